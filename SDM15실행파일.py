@@ -1,9 +1,18 @@
 import atexit
+import threading
+import time
+from collections import deque
 from dataclasses import dataclass
 from enum import IntEnum
+from typing import Union
 
+import numpy as np
 import serial
 
+import batchdecode
+import metrics
+from ringbuffer import RingReader, SampleRing, monotonic_stamp
+
 
 @dataclass
 class VersionInfo:
@@ -57,6 +66,10 @@ class FailedToReadError(Exception):
     pass
 
 
+class ReadTimeoutError(FailedToReadError):
+    pass
+
+
 class SelfTestFailedError(Exception):
     pass
 
@@ -65,6 +78,10 @@ class LidarScanningError(Exception):
     pass
 
 
+class LidarStreamingError(Exception):
+    pass
+
+
 PACKET_HED1 = 0xAA
 PACKET_HED2 = 0x55
 START_SCAN = 0x60
@@ -79,23 +96,166 @@ RESTORE_FACTORY_SETTINGS = 0x68
 
 NO_DATA = 0x00
 
+PACKET_HEADER = bytes([PACKET_HED1, PACKET_HED2])
+# header(2) + command(1) + data length(1) + checksum(1)
+PACKET_OVERHEAD = 5
+# pixhawk text that never terminates is dropped past this size
+MAX_PENDING_TEXT = 4096
+# serial port timeout, set once as pyserial reconfigures the port on every
+# assignment. A blocking read overruns its deadline by at most this
+READ_POLL = 0.02
+
+# samples filled in by the start_stream() reader thread
+STREAM_DTYPE = np.dtype([("timestamp", "<f8")] + batchdecode.SDM15_DTYPE.descr)
+
+
+@dataclass
+class ReadStats:
+    wait_time: float
+    parse_time: float
+    reads: int
+    timeouts: int
+
+
+@dataclass
+class Frame:
+    cmd: int
+    data: bytes
+
+
+@dataclass
+class PixhawkFrame:
+    distance: float
+
+
+class FrameParser(object):
+    """
+    incremental parser for SDM15 packets
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.checksum_errors = 0
+        # times garbage was skipped to find the next header
+        self.resyncs = 0
+
+    def reset(self):
+        """drop all buffered bytes"""
+        del self.buffer[:]
+
+    def feed(self, data: bytes):
+        """append received bytes to the buffer
+
+        Args:
+            data (bytes): bytes received from serial port
+        """
+        self.buffer += data
+
+    def parse(self) -> list[Union[Frame, PixhawkFrame]]:
+        """parse every complete packet in the buffer. Incomplete packets are kept for the next call
+
+        Returns:
+            list[Union[Frame, PixhawkFrame]]: parsed packets in received order
+        """
+        frames = []
+        buf = self.buffer
+        view = memoryview(buf)
+        end = len(buf)
+        pos = 0
+
+        while pos < end:
+            start = buf.find(PACKET_HEADER, pos)
+
+            if start != pos:
+                # bytes before the next header are pixhawk text lines
+                newline = buf.find(b"\n", pos, end if start < 0 else start)
+                if newline >= 0:
+                    frame = self._parse_pixhawk(view[pos:newline])
+                    if frame is not None:
+                        frames.append(frame)
+                    pos = newline + 1
+                    continue
+
+                if start < 0:
+                    # wait for the rest of the line or the header
+                    if end - pos > MAX_PENDING_TEXT:
+                        self.resyncs += 1
+                        pos = end - 1
+                    break
+
+                # skip garbage
+                self.resyncs += 1
+                pos = start
+
+            # wait for data length
+            if end - pos < PACKET_OVERHEAD - 1:
+                break
+
+            size = PACKET_OVERHEAD + buf[pos + 3]
+
+            # wait for the rest of the packet
+            if end - pos < size:
+                break
+
+            check_sum = buf[pos + size - 1]
+            if sum(view[pos : pos + size - 1]) & 0xFF != check_sum:
+                # resync on the next header
+                self.checksum_errors += 1
+                pos += 1
+                continue
+
+            frames.append(Frame(cmd=buf[pos + 2], data=bytes(view[pos + 4 : pos + size - 1])))
+            pos += size
+
+        view.release()
+        del buf[:pos]
+
+        return frames
+
+    @staticmethod
+    def _parse_pixhawk(line: memoryview) -> Union[PixhawkFrame, None]:
+        """parse one pixhawk text line such as "[Master]: 123\\r"
+
+        Args:
+            line (memoryview): line without newline
+
+        Returns:
+            Union[PixhawkFrame, None]: parsed frame. None if line is not a distance
+        """
+        text = bytes(line).decode("utf-8", errors="ignore").replace("[Master]: ", "")
+
+        try:
+            return PixhawkFrame(distance=float(text.strip()))
+        except ValueError:
+            return None
+
 
 class SDM15(object):
     """
     class for SDM15 serial communication
     """
 
-    def __init__(self, port: str, baud_rate: BaudRate = BaudRate.BAUD_460800):
+    def __init__(
+        self,
+        port: Union[str, serial.Serial],
+        baud_rate: BaudRate = BaudRate.BAUD_460800,
+        timeout: float = 1.0,
+    ):
         """setup serial port
 
         Args:
-            port (str): serial port name
+            port (Union[str, serial.Serial]): serial port name, or an opened serial-like object such as replay.ReplaySerial
             baud_rate (BaudRate, optional): baud rate. Warning: ydlidar usb adapter board does not support baud rate 512000 and 1500000. Defaults to BaudRate.BAUD_460800.
+            timeout (float, optional): seconds to wait for a packet before ReadTimeoutError is raised. Defaults to 1.0.
 
         Raises:
             Exception: serial port is not opened
         """
-        self.ser = serial.Serial(port=port, baudrate=baud_rate)
+        if isinstance(port, str):
+            self.ser = serial.Serial(port=port, baudrate=baud_rate, timeout=READ_POLL)
+        else:
+            self.ser = port
+            self.ser.timeout = READ_POLL
 
         # check serial port is opened
         if not self.ser.is_open:
@@ -103,12 +263,37 @@ class SDM15(object):
 
         self.scanning = False
         self.pixhawk = False
+        self.parser = FrameParser()
+        # complete packets not yet returned to the caller
+        self.pending = deque()
+
+        self.timeout = timeout
+        self.wait_time = 0.0
+        self.parse_time = 0.0
+        self.reads = 0
+        self.timeouts = 0
+        # metrics.DriverMetrics, None until enable_metrics() is called
+        self.metrics = None
+
+        self.stream = None
+        self._stream_thread = None
+        self._stream_stop = threading.Event()
 
         atexit.register(self._at_exit)
 
     def _at_exit(self):
         """close serial port when program exit"""
-        self.stop_scan()
+        if not self.ser.is_open:
+            return
+
+        try:
+            # stop_stream() stops the scan as well
+            if self.streaming:
+                self.stop_stream()
+            else:
+                self.stop_scan()
+        except FailedToReadError:
+            print("lidar did not answer stop scan")
         self.ser.close()
         print("serial port is closed")
 
@@ -170,48 +355,173 @@ class SDM15(object):
     def _write(self, cmd: bytes):
         """write command to serial port"""
         self._reset_buffer()
+        self.parser.reset()
+        self.pending.clear()
         self.ser.write(cmd)
         self.ser.flush()
 
-    def _read(self) -> list:
-        """receive data from serial port"""
+    def _wait_for_data(self, deadline: float) -> bytes:
+        """block in the serial driver until data is received or deadline passes
+
+        Args:
+            deadline (float): time.monotonic() value to give up at
 
-        # wait until data is received
-        while self.ser.in_waiting == 0:
-            pass
+        Raises:
+            ReadTimeoutError: no data received before deadline
 
-        # read all data
-        recv = self.ser.read_all()
+        Returns:
+            bytes: received data
+        """
+        t0 = time.monotonic()
+        remaining = deadline - t0
+
+        if remaining <= 0:
+            self.timeouts += 1
+            if self.metrics is not None:
+                self.metrics.add("timeouts")
+            raise ReadTimeoutError("no data received before deadline")
+
+        # read(1) sleeps in select/WaitForSingleObject until a byte arrives,
+        # for at most READ_POLL so the port timeout is never changed
+        recv = self.ser.read(1)
+        while len(recv) == 0 and time.monotonic() < deadline:
+            recv = self.ser.read(1)
+        t1 = time.monotonic()
+
+        # read the rest of the burst without blocking
+        waiting = self.ser.in_waiting
+        if waiting > 0:
+            recv += self.ser.read(waiting)
+
+        t2 = time.monotonic()
+        self.wait_time += t2 - t0
+        self.reads += 1
+
+        if self.metrics is not None:
+            self.metrics.observe("wait", t1 - t0)
+            self.metrics.observe("read", t2 - t1)
+            self.metrics.add("reads")
+            self.metrics.add("bytes_read", len(recv))
 
         # check data is received
-        if recv is None or len(recv) == 0:
-            raise FailedToReadError("no data received")
+        if len(recv) == 0:
+            self.timeouts += 1
+            if self.metrics is not None:
+                self.metrics.add("timeouts")
+            raise ReadTimeoutError("no data received before deadline")
+
+        return recv
+
+    def _parse(self, recv: bytes):
+        """parse received data and queue every complete packet
 
-        # convert to hex
-        recv_hex = recv.hex(":").split(":")
+        Args:
+            recv (bytes): received data
+        """
+        t0 = time.monotonic()
+        self.parser.feed(recv)
+
+        checksum_errors = self.parser.checksum_errors
+        resyncs = self.parser.resyncs
+        frames = self.parser.parse()
+        parse_time = time.monotonic() - t0
+        self.parse_time += parse_time
+
+        if self.metrics is not None:
+            self.metrics.observe("parse", parse_time)
+            self.metrics.add("frames", len(frames))
+            self.metrics.add("checksum_errors", self.parser.checksum_errors - checksum_errors)
+            self.metrics.add("resyncs", self.parser.resyncs - resyncs)
+
+        if self.parser.checksum_errors != checksum_errors:
+            print(f"check sum error: {self.parser.checksum_errors - checksum_errors} packets dropped")
+            # raise CheckSumError("check sum error")
+
+        if len(frames) == 0:
+            return
 
         # check pixhawk
-        if recv_hex[0] != "aa" or recv_hex[1] != "55":
-            distance = float(
-                recv.decode("utf-8").replace("[Master]: ", "").replace("\r\n", "")
-            )
+        if isinstance(frames[-1], PixhawkFrame):
             self.pixhawk = True
 
-            return [distance]
+        self.pending.extend(frames)
 
-        # convert to int
-        recv_hex = [int(x, 16) for x in recv_hex]
+    def _read(self, timeout: Union[float, None] = None) -> Union[Frame, PixhawkFrame]:
+        """receive the oldest packet from serial port
 
-        # check sum
-        check_sum = recv_hex[-1]
-        cal_check_sum = self.check(recv_hex[0:-1])
+        Args:
+            timeout (Union[float, None], optional): seconds to wait for a packet. Defaults to self.timeout.
 
-        # check check_sum
-        if cal_check_sum != check_sum:
-            print(f"check sum error: {check_sum} != {cal_check_sum}")
-            # raise CheckSumError("check sum error")
+        Raises:
+            ReadTimeoutError: no complete packet received in time
+        """
+        if self.streaming and threading.current_thread() is not self._stream_thread:
+            raise LidarStreamingError("lidar is streaming, read samples from self.stream")
+
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+
+        while len(self.pending) == 0:
+            self._parse(self._wait_for_data(deadline))
+
+        return self.pending.popleft()
+
+    def read_packets(self, timeout: Union[float, None] = None) -> list[Union[Frame, PixhawkFrame]]:
+        """receive every packet buffered since the last call
+
+        Args:
+            timeout (Union[float, None], optional): seconds to wait for the first packet. Defaults to self.timeout.
+
+        Raises:
+            ReadTimeoutError: no complete packet received in time
 
-        return recv_hex
+        Returns:
+            list[Union[Frame, PixhawkFrame]]: packets in received order
+        """
+        # drain the os buffer without blocking
+        waiting = self.ser.in_waiting
+        if waiting > 0:
+            self._parse(self.ser.read(waiting))
+
+        if len(self.pending) == 0:
+            self.pending.append(self._read(timeout))
+
+        frames = list(self.pending)
+        self.pending.clear()
+
+        return frames
+
+    def read_stats(self) -> ReadStats:
+        """time spent waiting for data versus parsing it
+
+        Returns:
+            ReadStats: accumulated read statistics
+        """
+        return ReadStats(
+            wait_time=self.wait_time,
+            parse_time=self.parse_time,
+            reads=self.reads,
+            timeouts=self.timeouts,
+        )
+
+    def enable_metrics(self, name: str = "SDM15") -> metrics.DriverMetrics:
+        """count bytes, frames and errors and time every read stage
+
+        Args:
+            name (str, optional): name in metrics.snapshot() and the prometheus endpoint. Defaults to "SDM15".
+
+        Returns:
+            metrics.DriverMetrics: metrics of this lidar
+        """
+        if self.metrics is None:
+            self.metrics = metrics.register(name)
+
+        return self.metrics
+
+    def disable_metrics(self):
+        """stop counting and remove the metrics from metrics.REGISTRY"""
+        if self.metrics is not None:
+            metrics.unregister(self.metrics)
+            self.metrics = None
 
     def check_scanning(self):
         """check lidar is scanning because some commands can only be executed when lidar is not scanning
@@ -267,14 +577,17 @@ class SDM15(object):
         self._write(cmd)
         recv = self._read()
 
-        # get data segment length
-        data_len = recv[3]
+        return self.decode_version_info(recv)
+
+    @staticmethod
+    def decode_version_info(recv: Frame) -> VersionInfo:
+        """decode version info packet"""
 
         # get data segment
-        data_segment = recv[4 : 4 + data_len]
+        data_segment = recv.data
 
         # get serial number
-        serial_number = data_segment[4 : 4 + data_len]
+        serial_number = data_segment[4:]
         serial_number = int("".join([str(x) for x in serial_number]))
 
         # create VersionInfo object
@@ -309,8 +622,16 @@ class SDM15(object):
         # cmd_type = recv[2]
         # print(self.get_cmd_type(cmd_type))
 
-        data_len = recv[3]
-        data_segment = recv[4 : 4 + data_len]
+        return self.decode_self_test(recv)
+
+    @staticmethod
+    def decode_self_test(recv: Frame) -> list[int]:
+        """decode self test packet
+
+        Raises:
+            SelfTestFailedError: self test failed
+        """
+        data_segment = recv.data
 
         self_test_result = data_segment[0]
         self_test_error_code = data_segment[1]
@@ -321,26 +642,21 @@ class SDM15(object):
                 f"self test failed error_code: {self_test_error_code}"
             )
 
-        self_test_data = data_segment[2:]
+        self_test_data = list(data_segment[2:])
 
         return self_test_data
 
-    def get_distance(self) -> tuple[int, int, int]:
-        """get distance, intensity and disturb
-
-        Returns:
-            tuple[int, int, int]: distance, intensity and disturb. If pixhawk is True, intensity and disturb will be -1
-        """
-        recv = self._read()
+    @staticmethod
+    def decode_distance(recv: Union[Frame, PixhawkFrame]) -> tuple[int, int, int]:
+        """decode distance, intensity and disturb from a scan packet"""
 
         # if pixhawk is True, distance will be returned
-        if self.pixhawk:
-            distance = recv[0]
+        if isinstance(recv, PixhawkFrame):
+            distance = recv.distance
 
             return distance, -1, -1
 
-        data_len = recv[3]
-        data_segment = recv[4 : 4 + data_len]
+        data_segment = recv.data
 
         distance_low = data_segment[0]
         distance_high = data_segment[1]
@@ -353,6 +669,118 @@ class SDM15(object):
 
         return distance, intensity, disturb
 
+    def get_distance(self) -> tuple[int, int, int]:
+        """get distance, intensity and disturb
+
+        Returns:
+            tuple[int, int, int]: distance, intensity and disturb. If pixhawk is True, intensity and disturb will be -1
+        """
+        recv = self._read()
+
+        return self.decode_distance(recv)
+
+    def get_distances(self) -> list[tuple[int, int, int]]:
+        """get every distance, intensity and disturb received since the last call. Blocks until at least one is received
+
+        Returns:
+            list[tuple[int, int, int]]: distance, intensity and disturb in received order. If pixhawk is True, intensity and disturb will be -1
+        """
+        frames = self.read_packets()
+
+        return [
+            self.decode_distance(recv)
+            for recv in frames
+            if isinstance(recv, PixhawkFrame) or len(recv.data) >= 4
+        ]
+
+    @property
+    def streaming(self) -> bool:
+        """whether the start_stream() reader thread is running"""
+        return self._stream_thread is not None and self._stream_thread.is_alive()
+
+    def start_stream(self, capacity: int = 65536) -> SampleRing:
+        """start scan and fill a ring buffer with timestamped samples from a reader thread
+
+        get_distance() and get_distances() can not be used until stop_stream() is called.
+        Standard output data format only.
+
+        Args:
+            capacity (int, optional): number of samples kept in the ring buffer. Defaults to 65536.
+
+        Returns:
+            SampleRing: ring buffer of STREAM_DTYPE samples. Use reader() or latest() to consume
+        """
+        if self.streaming:
+            raise LidarStreamingError("lidar is already streaming")
+
+        if not self.scanning:
+            self.start_scan()
+
+        self.stream = SampleRing(capacity, STREAM_DTYPE)
+        self._stream_stop.clear()
+        self._stream_thread = threading.Thread(target=self._stream_loop, daemon=True)
+        self._stream_thread.start()
+
+        return self.stream
+
+    def stop_stream(self):
+        """stop the reader thread and scan. Samples stay in self.stream"""
+        if not self.streaming:
+            return
+
+        self._stream_stop.set()
+        self._stream_thread.join()
+        self._stream_thread = None
+
+        self.stop_scan()
+
+    def _stream_loop(self):
+        """reader thread: decode every received block into the ring buffer"""
+        # samples already parsed while starting scan
+        timestamp = time.monotonic()
+        leftover = [
+            (timestamp,) + self.decode_distance(recv)
+            for recv in self.pending
+            if isinstance(recv, Frame) and len(recv.data) >= 4
+        ]
+        self.stream.push(np.array(leftover, dtype=STREAM_DTYPE))
+        self.pending.clear()
+
+        buffer = bytearray(self.parser.buffer)
+        self.parser.reset()
+
+        while not self._stream_stop.is_set():
+            try:
+                recv = self._wait_for_data(time.monotonic() + self.timeout)
+            except ReadTimeoutError:
+                continue
+
+            timestamp = time.monotonic()
+
+            t0 = time.monotonic()
+            buffer += recv
+            samples, consumed = batchdecode.decode_sdm15(buffer, self.metrics)
+            del buffer[:consumed]
+            parse_time = time.monotonic() - t0
+            self.parse_time += parse_time
+
+            if self.metrics is not None:
+                self.metrics.observe("parse", parse_time)
+                self.metrics.add("frames", len(samples))
+
+            self.stream.push(monotonic_stamp(samples, STREAM_DTYPE, timestamp))
+
+    def stream_reader(self) -> RingReader:
+        """create a cursor returning every new stream sample once
+
+        Returns:
+            RingReader: cursor over self.stream
+        """
+        if self.stream is None:
+            raise LidarStreamingError("start_stream() has not been called")
+
+        return self.stream.reader()
+
     def set_output_freq(self, freq: OutputFreqHex = OutputFreqHex.Freq_100Hz):
         """set output frequency
 
@@ -376,7 +804,7 @@ class SDM15(object):
         self._write(cmd)
         recv = self._read()
 
-        recv_freq = recv[4]
+        recv_freq = recv.data[0]
 
         # check recv_freq
         if recv_freq != freq:
@@ -415,7 +843,7 @@ class SDM15(object):
         self._write(cmd)
         recv = self._read()
 
-        recv_filter = recv[4]
+        recv_filter = recv.data[0]
 
         if recv_filter != filter:
             raise Exception("set filter failed")
@@ -445,7 +873,7 @@ class SDM15(object):
         self._write(cmd)
         recv = self._read()
 
-        recv_baud_rate = recv[4]
+        recv_baud_rate = recv.data[0]
 
         if recv_baud_rate != baud_rate:
             raise Exception("set baud rate failed")
@@ -482,7 +910,7 @@ class SDM15(object):
         self._write(cmd)
         recv = self._read()
 
-        recv_data_format = recv[4]
+        recv_data_format = recv.data[0]
 
         if recv_data_format != data_format:
             raise Exception("set output data format failed")
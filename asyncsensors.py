@@ -0,0 +1,448 @@
+import asyncio
+import io
+import time
+from typing import AsyncIterator, Union
+
+import serial
+
+import SDM15실행파일 as sdm15
+import batchdecode
+import tfluna
+from tfminiplus import tfmini
+
+# how often windows com ports are polled, they have no readiness notification
+POLL_INTERVAL = 0.001
+
+
+class AsyncSerial(object):
+    """
+    serial port awaited from an asyncio event loop without a thread per port
+    """
+
+    def __init__(self, port: str, baudrate: int):
+        """open serial port in non-blocking mode
+
+        Args:
+            port (str): serial port name
+            baudrate (int): baud rate
+        """
+        self.ser = serial.Serial(port=port, baudrate=baudrate, timeout=0)
+        self.buffer = bytearray()
+
+        # posix ports can be watched with loop.add_reader
+        try:
+            self._fd = self.ser.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            self._fd = None
+
+    def close(self):
+        """close serial port"""
+        self.ser.close()
+
+    def write(self, data: bytes):
+        """write data without waiting for it to be sent"""
+        self.ser.write(data)
+
+    def reset_input_buffer(self):
+        """drop received data"""
+        self.ser.reset_input_buffer()
+        del self.buffer[:]
+
+    async def _wait_readable(self, timeout: Union[float, None]):
+        """wait until the port has data
+
+        Raises:
+            asyncio.TimeoutError: no data received in timeout
+        """
+        loop = asyncio.get_running_loop()
+
+        if self._fd is not None:
+            ready = loop.create_future()
+            try:
+                loop.add_reader(self._fd, lambda: ready.done() or ready.set_result(None))
+            except NotImplementedError:
+                # proactor event loop
+                self._fd = None
+            else:
+                try:
+                    await asyncio.wait_for(ready, timeout)
+                finally:
+                    loop.remove_reader(self._fd)
+                return
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.ser.in_waiting == 0:
+            if deadline is not None and time.monotonic() > deadline:
+                raise asyncio.TimeoutError()
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def read(self, timeout: Union[float, None] = None) -> bytes:
+        """read every received byte, waiting for at least one
+
+        Args:
+            timeout (Union[float, None], optional): seconds to wait. Defaults to None.
+
+        Raises:
+            asyncio.TimeoutError: no data received in timeout
+
+        Returns:
+            bytes: received data
+        """
+        recv = self.ser.read(max(1, self.ser.in_waiting))
+
+        while len(recv) == 0:
+            await self._wait_readable(timeout)
+            recv = self.ser.read(max(1, self.ser.in_waiting))
+
+        return recv
+
+    async def readline(self, timeout: Union[float, None] = None) -> bytes:
+        """read one line including the newline
+
+        Args:
+            timeout (Union[float, None], optional): seconds to wait. Defaults to None.
+
+        Raises:
+            asyncio.TimeoutError: no line received in timeout
+
+        Returns:
+            bytes: received line
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            newline = self.buffer.find(b"\n")
+            if newline >= 0:
+                line = bytes(self.buffer[: newline + 1])
+                del self.buffer[: newline + 1]
+                return line
+
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            self.buffer += await self.read(remaining)
+
+
+class AsyncSDM15(object):
+    """
+    asyncio version of SDM15
+    """
+
+    def __init__(
+        self,
+        port: str,
+        baud_rate: sdm15.BaudRate = sdm15.BaudRate.BAUD_460800,
+        timeout: float = 1.0,
+    ):
+        """setup serial port
+
+        Args:
+            port (str): serial port name
+            baud_rate (BaudRate, optional): baud rate. Defaults to BaudRate.BAUD_460800.
+            timeout (float, optional): seconds to wait for a reply. Defaults to 1.0.
+        """
+        self.port = AsyncSerial(port, baud_rate)
+        self.parser = sdm15.FrameParser()
+        # packets received after a command answer
+        self.pending = []
+        self.timeout = timeout
+        self.scanning = False
+
+    def close(self):
+        """close serial port"""
+        self.port.close()
+
+    async def _command(self, cmd: int, data: tuple[int, ...] = ()) -> sdm15.Frame:
+        """send a command and wait for the packet answering it
+
+        Raises:
+            ReadTimeoutError: lidar did not answer in time
+
+        Returns:
+            Frame: answer
+        """
+        packet = [sdm15.PACKET_HED1, sdm15.PACKET_HED2, cmd, len(data)] + list(data)
+        packet.append(sdm15.SDM15.check(packet))
+
+        self.port.reset_input_buffer()
+        self.parser.reset()
+        self.pending.clear()
+        self.port.write(bytes(packet))
+
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                recv = await self.port.read(max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise sdm15.ReadTimeoutError(f"no answer to command {cmd:#04x}")
+
+            self.parser.feed(recv)
+            frames = self.parser.parse()
+            for i, frame in enumerate(frames):
+                if isinstance(frame, sdm15.Frame) and frame.cmd == cmd:
+                    self.pending.extend(frames[i + 1 :])
+                    return frame
+
+    def check_scanning(self):
+        """raise LidarScanningError if scanning"""
+        if self.scanning:
+            raise sdm15.LidarScanningError("lidar is scanning")
+
+    async def start_scan(self):
+        """start scan"""
+        await self._command(sdm15.START_SCAN)
+        self.scanning = True
+
+    async def stop_scan(self):
+        """stop scan"""
+        await self._command(sdm15.STOP_SCAN)
+        self.scanning = False
+
+    async def obtain_version_info(self) -> sdm15.VersionInfo:
+        """obtain version info from lidar"""
+        self.check_scanning()
+
+        return sdm15.SDM15.decode_version_info(await self._command(sdm15.GET_DEVICE_INFO))
+
+    async def lidar_self_test(self) -> list[int]:
+        """lidar self test
+
+        Raises:
+            SelfTestFailedError: self test failed
+        """
+        self.check_scanning()
+
+        return sdm15.SDM15.decode_self_test(await self._command(sdm15.SELF_TEST))
+
+    async def set_output_freq(self, freq: sdm15.OutputFreqHex = sdm15.OutputFreqHex.Freq_100Hz):
+        """set output frequency
+
+        Raises:
+            Exception: set output freq failed
+        """
+        self.check_scanning()
+
+        recv = await self._command(sdm15.SET_OUTPUT_FREQ, (freq,))
+        if recv.data[0] != freq:
+            raise Exception("set output freq failed")
+
+    async def set_filter(self, filter: sdm15.FilterHex = sdm15.FilterHex.On):
+        """set filter on or off
+
+        Raises:
+            Exception: set filter failed
+        """
+        self.check_scanning()
+
+        recv = await self._command(sdm15.SET_FILTER, (filter,))
+        if recv.data[0] != filter:
+            raise Exception("set filter failed")
+
+    async def set_baud_rate(self, baud_rate: sdm15.BaudRateHex = sdm15.BaudRateHex.BAUD_460800):
+        """set baud rate of lidar and switch the serial port to it
+
+        Args:
+            baud_rate (BaudRateHex, optional): baud rate. Warning: ydlidar usb adapter board does not support baud rate 512000 and 1500000. Defaults to BaudRateHex.BAUD_460800.
+
+        Raises:
+            Exception: set baud rate failed
+        """
+        self.check_scanning()
+
+        # the lidar answers at the old baud rate, then switches
+        recv = await self._command(sdm15.SET_SERIAL_BAUD, (baud_rate,))
+        if recv.data[0] != baud_rate:
+            raise Exception("set baud rate failed")
+
+        self.port.ser.baudrate = sdm15.BaudRate[sdm15.BaudRateHex(baud_rate).name]
+        self.port.reset_input_buffer()
+        self.parser.reset()
+
+    async def set_output_data_format(self, data_format: sdm15.OutputDataFormatHex = sdm15.OutputDataFormatHex.Standard):
+        """set output data format. Standard or Pixhawk
+
+        Raises:
+            Exception: set output data format failed
+        """
+        self.check_scanning()
+
+        recv = await self._command(sdm15.SET_FORMAT_OUTPUT_DATA, (data_format,))
+        if recv.data[0] != data_format:
+            raise Exception("set output data format failed")
+
+    async def restore_factory_settings(self):
+        """restore factory settings"""
+        self.check_scanning()
+
+        await self._command(sdm15.RESTORE_FACTORY_SETTINGS)
+
+    async def stream(self) -> AsyncIterator[tuple[int, int, int]]:
+        """start scan and yield distance, intensity and disturb of every packet
+
+        Raises:
+            ReadTimeoutError: lidar stopped sending data
+        """
+        if not self.scanning:
+            await self.start_scan()
+
+        pending = [recv for recv in self.pending if len(recv.data) >= 4]
+        self.pending.clear()
+        for recv in pending:
+            yield sdm15.SDM15.decode_distance(recv)
+
+        buffer = bytearray(self.parser.buffer)
+        self.parser.reset()
+
+        while True:
+            try:
+                buffer += await self.port.read(self.timeout)
+            except asyncio.TimeoutError:
+                raise sdm15.ReadTimeoutError("no data received before deadline")
+
+            samples, consumed = batchdecode.decode_sdm15(buffer)
+            del buffer[:consumed]
+
+            for sample in samples.tolist():
+                yield sample
+
+
+class AsyncTFMiniPlus(object):
+    """
+    asyncio version of the tfmini module
+    """
+
+    def __init__(self, port: str, rate: int = 115200, timeout: float = 1.0):
+        """setup serial port
+
+        Args:
+            port (str): serial port name
+            rate (int, optional): baud rate. Defaults to 115200.
+            timeout (float, optional): seconds to wait for data. Defaults to 1.0.
+        """
+        self.port = AsyncSerial(port, rate)
+        self.timeout = timeout
+        self.status = tfmini.TFMP_READY
+        self.version = bytearray(3)
+
+    def close(self):
+        """close serial port"""
+        self.port.close()
+
+    async def _reply(self, header: int, reply_len: int, deadline: float) -> Union[bytes, None]:
+        """wait for a 0x5A reply of reply_len bytes with a valid checksum. Sets status on failure"""
+        # bytes after the reply stay buffered for stream()
+        buffer = self.port.buffer
+
+        while True:
+            start = buffer.find(bytes([header, reply_len]))
+            while start >= 0 and len(buffer) - start >= reply_len:
+                reply = bytes(buffer[start : start + reply_len])
+                if sum(reply[:-1]) & 0xFF == reply[-1]:
+                    del buffer[: start + reply_len]
+                    return reply
+                start = buffer.find(bytes([header, reply_len]), start + 1)
+
+            try:
+                buffer += await self.port.read(max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                self.status = tfmini.TFMP_HEADER
+                return None
+
+    async def send_command(self, cmnd: int, param: int) -> bool:
+        """send a tfmini command such as SET_FRAME_RATE and check the reply
+
+        Returns:
+            bool: True if the device accepted the command. status explains failures
+        """
+        cmndData, replyLen = tfmini.buildCommand(cmnd, param)
+
+        self.port.reset_input_buffer()
+        self.port.write(cmndData)
+
+        if replyLen == 0:
+            return True
+
+        reply = await self._reply(0x5A, replyLen, time.monotonic() + self.timeout)
+        if reply is None:
+            return False
+
+        if cmnd == tfmini.GET_FIRMWARE_VERSION:
+            self.version[0] = reply[5]
+            self.version[1] = reply[4]
+            self.version[2] = reply[3]
+        elif cmnd in (tfmini.SOFT_RESET, tfmini.HARD_RESET, tfmini.SAVE_SETTINGS):
+            if reply[3] == 1:
+                self.status = tfmini.TFMP_FAIL
+                return False
+
+        self.status = tfmini.TFMP_READY
+        return True
+
+    async def stream(self) -> AsyncIterator[tuple[int, int, float]]:
+        """yield distance (cm), flux and temperature (°C) of every data frame
+
+        Raises:
+            asyncio.TimeoutError: device stopped sending data
+        """
+        buffer = self.port.buffer
+
+        while True:
+            buffer += await self.port.read(self.timeout)
+
+            samples, consumed = batchdecode.decode_tfmini(buffer)
+            del buffer[:consumed]
+
+            for sample in samples.tolist():
+                yield sample
+
+
+class AsyncTFLuna(AsyncTFMiniPlus):
+    """
+    asyncio version of the TF-Luna helpers. Data frames match TFMini-Plus
+    """
+
+    async def set_samp_rate(self, samp_rate: int = 100) -> bool:
+        """change the sample rate (1-250 Hz)"""
+        return await self.send_command(tfmini.SET_FRAME_RATE, samp_rate)
+
+    async def get_version(self) -> str:
+        """get version string
+
+        Raises:
+            asyncio.TimeoutError: no version reply
+        """
+        packet = [tfluna.COMMAND_HEADER, 0x04, tfluna.GET_VERSION]
+        packet.append(sum(packet) & 0xFF)
+
+        self.port.reset_input_buffer()
+        self.port.write(bytes(packet))
+
+        reply = await self._reply(tfluna.COMMAND_HEADER, tfluna.VERSION_REPLY_SIZE, time.monotonic() + self.timeout)
+        if reply is None:
+            raise asyncio.TimeoutError()
+
+        return reply[3:-1].decode("utf-8", errors="ignore")
+
+    async def set_baudrate(self, baudrate: int) -> bool:
+        """change the TF-Luna baud rate and reopen the port at it
+
+        Args:
+            baudrate (int): new baud rate, one of tfluna.BAUD_RATES
+
+        Returns:
+            bool: True if the TF-Luna confirmed the baud rate at the new speed
+        """
+        if baudrate not in tfluna.BAUD_RATES:
+            raise ValueError(f"baud rate must be one of {tfluna.BAUD_RATES}")
+
+        cmndData, replyLen = tfmini.buildCommand(tfmini.SET_BAUD_RATE, baudrate)
+        self.port.write(cmndData)
+        self.port.ser.flush()
+
+        await asyncio.sleep(0.1)
+        self.port.ser.baudrate = baudrate
+        self.port.reset_input_buffer()
+
+        # the first answer is lost while switching, ask again at the new baud rate
+        self.port.write(cmndData)
+        reply = await self._reply(tfluna.COMMAND_HEADER, replyLen, time.monotonic() + self.timeout)
+
+        return reply is not None and int.from_bytes(reply[3:7], "little") == baudrate
@@ -0,0 +1,150 @@
+import numpy as np
+
+# header(2) + command(1) + data length(1) + data(4) + checksum(1)
+SDM15_FRAME_SIZE = 9
+# PACKET_HED1, PACKET_HED2, START_SCAN, data length
+SDM15_SCAN_HEADER = bytes([0xAA, 0x55, 0x60, 0x04])
+
+# TF-Luna uses the same data frame as TFMini-Plus
+TFMINI_FRAME_SIZE = 9
+TFMINI_HEADER = bytes([0x59, 0x59])
+
+SDM15_DTYPE = np.dtype(
+    [
+        ("distance", "<u2"),
+        ("intensity", "u1"),
+        ("disturb", "u1"),
+    ]
+)
+
+TFMINI_DTYPE = np.dtype(
+    [
+        ("distance", "<u2"),
+        ("flux", "<u2"),
+        ("temperature", "<f4"),
+    ]
+)
+
+
+def _as_array(data) -> np.ndarray:
+    """view bytes, bytearray, memoryview or uint8 array without copying"""
+    if isinstance(data, np.ndarray):
+        return data.view(np.uint8).reshape(-1)
+
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def find_frames(buf: np.ndarray, header: bytes, frame_size: int, metrics=None) -> tuple[np.ndarray, int]:
+    """find every frame starting with header whose checksum matches
+
+    The checksum is the low byte of the sum of every byte but the last, which
+    is shared by SDM15, TFMini-Plus and TF-Luna.
+
+    Args:
+        buf (np.ndarray): received bytes as uint8 array
+        header (bytes): bytes every frame starts with
+        frame_size (int): size of one frame including header and checksum
+        metrics (metrics.DriverMetrics, optional): counts checksum errors and resyncs. Defaults to None.
+
+    Returns:
+        tuple[np.ndarray, int]: (n, frame_size) array of frames and number of bytes consumed. Bytes after consumed may hold an incomplete frame
+    """
+    n_starts = len(buf) - frame_size + 1
+
+    if n_starts <= 0:
+        return np.empty((0, frame_size), dtype=np.uint8), 0
+
+    # header candidates
+    is_header = buf[:n_starts] == header[0]
+    for i in range(1, len(header)):
+        is_header &= buf[i : i + n_starts] == header[i]
+    starts = np.flatnonzero(is_header)
+
+    # checksum
+    frames = buf[starts[:, None] + np.arange(frame_size)]
+    check_sum = frames[:, :-1].sum(axis=1, dtype=np.uint32) & 0xFF
+    valid = check_sum == frames[:, -1]
+    bad_starts = starts[~valid]
+    starts = starts[valid]
+    frames = frames[valid]
+
+    # a header inside the previous kept frame is payload, not a frame. Only
+    # starts close to the previous candidate can be inside one, so the scan
+    # against the last kept start loops over those rare cases only
+    close = np.flatnonzero(np.diff(starts) < frame_size) + 1
+    if len(close) > 0:
+        keep = np.ones(len(starts), dtype=bool)
+        for i in close:
+            if keep[i - 1]:
+                last = starts[i - 1]
+            keep[i] = starts[i] - last >= frame_size
+        starts = starts[keep]
+        frames = frames[keep]
+
+    consumed = n_starts
+    if len(starts) > 0:
+        consumed = max(consumed, int(starts[-1]) + frame_size)
+
+    if metrics is not None:
+        _count_errors(metrics, starts, bad_starts, frame_size)
+
+    return frames, consumed
+
+
+def _count_errors(metrics, starts: np.ndarray, bad_starts: np.ndarray, frame_size: int):
+    """count checksum errors and resyncs of find_frames()"""
+    # a bad header inside a good frame is payload, not an error
+    if len(starts) > 0 and len(bad_starts) > 0:
+        i = np.searchsorted(starts, bad_starts, side="right") - 1
+        inside = (i >= 0) & (bad_starts < starts[np.maximum(i, 0)] + frame_size)
+        bad_starts = bad_starts[~inside]
+    metrics.add("checksum_errors", len(bad_starts))
+
+    # frames not starting where the previous one ended
+    if len(starts) > 0:
+        gaps = np.count_nonzero(starts[1:] != starts[:-1] + frame_size)
+        metrics.add("resyncs", int(gaps) + int(starts[0] != 0))
+
+
+def decode_sdm15(data, metrics=None) -> tuple[np.ndarray, int]:
+    """decode SDM15 continuous scan packets
+
+    Args:
+        data (bytes | bytearray | memoryview | np.ndarray): received bytes
+        metrics (metrics.DriverMetrics, optional): counts checksum errors and resyncs. Defaults to None.
+
+    Returns:
+        tuple[np.ndarray, int]: SDM15_DTYPE samples and number of bytes consumed
+    """
+    frames, consumed = find_frames(_as_array(data), SDM15_SCAN_HEADER, SDM15_FRAME_SIZE, metrics)
+
+    samples = np.empty(len(frames), dtype=SDM15_DTYPE)
+    samples["distance"] = frames[:, 4] | (frames[:, 5].astype(np.uint16) << 8)
+    samples["intensity"] = frames[:, 6]
+    samples["disturb"] = frames[:, 7]
+
+    return samples, consumed
+
+
+def decode_tfmini(data, metrics=None) -> tuple[np.ndarray, int]:
+    """decode TFMini-Plus or TF-Luna data frames
+
+    Args:
+        data (bytes | bytearray | memoryview | np.ndarray): received bytes
+        metrics (metrics.DriverMetrics, optional): counts checksum errors and resyncs. Defaults to None.
+
+    Returns:
+        tuple[np.ndarray, int]: TFMINI_DTYPE samples and number of bytes consumed. Distance is in centimeters, temperature in degrees Celsius
+    """
+    frames, consumed = find_frames(_as_array(data), TFMINI_HEADER, TFMINI_FRAME_SIZE, metrics)
+    frames = frames.astype(np.uint16)
+
+    samples = np.empty(len(frames), dtype=TFMINI_DTYPE)
+    samples["distance"] = frames[:, 2] | (frames[:, 3] << 8)
+    samples["flux"] = frames[:, 4] | (frames[:, 5] << 8)
+    samples["temperature"] = (frames[:, 6] | (frames[:, 7] << 8)) / 8.0 - 256
+
+    return samples, consumed
+
+
+decode_tfluna = decode_tfmini
@@ -0,0 +1,375 @@
+import argparse
+import atexit
+import json
+import os
+import platform
+import sys
+import time
+from typing import Callable, Union
+
+import numpy as np
+
+import SDM15실행파일 as sdm15
+import batchdecode
+import tfluna
+from replay import ReplaySerial
+from tfminiplus import tfmini
+
+# LPXX only exists in this archive
+LP_ZIP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tf_luna files", "LP.zip")
+
+# simulated runs: output frequencies and baud rates each driver supports
+SDM15_BAUD_RATES = list(sdm15.BaudRate)
+TFMINI_FRAME_RATES = [100, 250, 500, 1000]
+TFMINI_BAUD_RATES = [115200, 460800, 921600]
+TFLUNA_FRAME_RATES = [100, 250]
+TFLUNA_BAUD_RATES = [115200, 230400, 460800, 921600]
+
+# driver timeout in replay runs, reached once the recording is exhausted
+REPLAY_TIMEOUT = 0.05
+
+
+# what the lidar answers START_SCAN with, dropped by SDM15.start_scan()
+SDM15_START_ANSWER = [sdm15.PACKET_HED1, sdm15.PACKET_HED2, sdm15.START_SCAN, 0x00, 0x5F]
+
+
+def make_sdm15_stream(n_frames: int) -> bytes:
+    """create continuous scan packets like the lidar sends at high output frequency
+
+    Args:
+        n_frames (int): number of packets
+
+    Returns:
+        bytes: packets
+    """
+    stream = bytearray()
+
+    for i in range(n_frames):
+        distance = i % 12000
+        packet = [
+            sdm15.PACKET_HED1,
+            sdm15.PACKET_HED2,
+            sdm15.START_SCAN,
+            0x04,
+            distance & 0xFF,
+            distance >> 8,
+            i & 0xFF,
+            0x00,
+        ]
+        packet.append(sdm15.SDM15.check(packet))
+        stream += bytes(packet)
+
+    return bytes(stream)
+
+
+def make_tfmini_stream(n_frames: int) -> bytes:
+    """create TFMini-Plus / TF-Luna data frames
+
+    Args:
+        n_frames (int): number of frames
+
+    Returns:
+        bytes: frames
+    """
+    stream = bytearray()
+
+    for i in range(n_frames):
+        distance = i % 1200
+        frame = [0x59, 0x59, distance & 0xFF, distance >> 8, 0x10, 0x02, 0x40, 0x09]
+        frame.append(sum(frame) & 0xFF)
+        stream += bytes(frame)
+
+    return bytes(stream)
+
+
+def legacy_parse(recv: bytes) -> list:
+    """hex string round-trip used by SDM15._read before FrameParser"""
+    recv_hex = recv.hex(":").split(":")
+    recv_hex = [int(x, 16) for x in recv_hex]
+    check_sum = recv_hex[-1]
+    cal_check_sum = sdm15.SDM15.check(recv_hex[0:-1])
+    if cal_check_sum != check_sum:
+        print(f"check sum error: {check_sum} != {cal_check_sum}")
+    return recv_hex
+
+
+def bench_sdm15_legacy(stream: bytes, frame_size: int = 9) -> float:
+    """frames/sec of the legacy parser, one read per packet"""
+    t0 = time.perf_counter()
+    for pos in range(0, len(stream), frame_size):
+        legacy_parse(stream[pos : pos + frame_size])
+    return len(stream) // frame_size / (time.perf_counter() - t0)
+
+
+def bench_sdm15_parser(stream: bytes, chunk_size: int = 4096) -> float:
+    """frames/sec of FrameParser fed with serial sized chunks"""
+    parser = sdm15.FrameParser()
+    n_frames = 0
+    t0 = time.perf_counter()
+    for pos in range(0, len(stream), chunk_size):
+        parser.feed(stream[pos : pos + chunk_size])
+        n_frames += len(parser.parse())
+    return n_frames / (time.perf_counter() - t0)
+
+
+def bench_batch(decode, stream: bytes) -> float:
+    """frames/sec of a batchdecode function over one large block"""
+    t0 = time.perf_counter()
+    samples, _ = decode(stream)
+    return len(samples) / (time.perf_counter() - t0)
+
+
+def measure(read: Callable[[], int], duration: Union[float, None] = None, done: Union[Callable[[], bool], None] = None) -> dict:
+    """call read until duration passes or done() is True
+
+    Args:
+        read (Callable[[], int]): reads from a driver and returns the number of frames it got
+        duration (Union[float, None], optional): seconds to run. Defaults to None.
+        done (Union[Callable[[], bool], None], optional): checked after each call that got no frame. Time after the last frame is not counted. Defaults to None.
+
+    Returns:
+        dict: frames, seconds, frames_per_sec, latency_p50_us, latency_p99_us, cpu_percent and timeouts. Latency is the duration of a read call per frame, including waiting for data
+    """
+    timeout_errors = (sdm15.FailedToReadError, tfluna.TFLunaTimeoutError)
+    latencies = []
+    frames = 0
+    timeouts = 0
+
+    t0 = t_last = time.perf_counter()
+    # cpu time of this thread only, simulators run in their own threads
+    cpu0 = cpu_last = time.thread_time()
+    while duration is None or time.perf_counter() - t0 < duration:
+        t = time.perf_counter()
+        try:
+            n = read()
+        except timeout_errors:
+            n = 0
+            timeouts += 1
+        dt = time.perf_counter() - t
+
+        if n > 0:
+            frames += n
+            latencies.append(dt / n)
+            t_last = t + dt
+            cpu_last = time.thread_time()
+        elif done is not None and done():
+            break
+
+    if done is None:
+        t_last = time.perf_counter()
+        cpu_last = time.thread_time()
+    wall = t_last - t0
+    cpu = cpu_last - cpu0
+
+    latencies = np.array(latencies) * 1e6
+    return {
+        "frames": frames,
+        "seconds": wall,
+        "frames_per_sec": frames / wall,
+        "latency_p50_us": float(np.percentile(latencies, 50)) if frames else None,
+        "latency_p99_us": float(np.percentile(latencies, 99)) if frames else None,
+        "cpu_percent": 100 * cpu / wall,
+        "timeouts": timeouts,
+    }
+
+
+def _one(read: Callable) -> Callable[[], int]:
+    """read function of a driver call returning one frame"""
+
+    def read_one() -> int:
+        read()
+        return 1
+
+    return read_one
+
+
+def bench_replay(n_frames: int) -> list[dict]:
+    """decode cost of every driver read call, fed as fast as possible from a recorded byte stream"""
+    results = []
+    sdm15_stream = bytes(SDM15_START_ANSWER) + make_sdm15_stream(n_frames)
+    tfmini_stream = make_tfmini_stream(n_frames)
+
+    for name in ("get_distance", "get_distances"):
+        port = ReplaySerial(sdm15_stream, speed=None)
+        lidar = sdm15.SDM15(port, timeout=REPLAY_TIMEOUT)
+        lidar.start_scan()
+        if name == "get_distance":
+            read = _one(lidar.get_distance)
+        else:
+            read = lambda: len(lidar.get_distances())
+        results.append({"driver": f"SDM15.{name}", **measure(read, done=lambda: port.eof)})
+        lidar.ser.close()
+
+    for name in ("read_tfluna_data", "read_frames"):
+        port = ReplaySerial(tfmini_stream, 115200, speed=None)
+        luna = tfluna.TFLuna(port, timeout=REPLAY_TIMEOUT)
+        if name == "read_tfluna_data":
+            read = _one(luna.read_tfluna_data)
+        else:
+            read = lambda: len(luna.read_frames())
+        results.append({"driver": f"TFLuna.{name}", **measure(read, done=lambda: port.eof)})
+
+    for name in ("getData", "getFrames"):
+        port = ReplaySerial(tfmini_stream, 115200, speed=None)
+        device = tfmini.TFMiniPlus()
+        device.begin(port, 115200)
+        if name == "getData":
+            # getData() jumps to the newest frame, the others count as dropped
+            read = lambda: 1 if device.getData() else 0
+        else:
+            read = lambda: len(device.getFrames())
+        result = measure(read, done=lambda: port.eof)
+        result["dropped"] = n_frames - result["frames"]
+        results.append({"driver": f"TFMiniPlus.{name}", **result})
+
+    for result in results:
+        result.update(source="replay", frames_in=n_frames)
+
+    return results
+
+
+def _bench_simulated(device, open_driver: Callable, duration: float) -> dict:
+    """run one driver against a simulator and count frames it missed"""
+    device.start()
+    try:
+        read, close = open_driver(device.port)
+        sent = device.frames_sent
+        result = measure(read, duration)
+        # frames in flight when measuring stops are counted as dropped
+        result["dropped"] = max(0, device.frames_sent - sent - result["frames"])
+        result["overruns"] = device.overruns
+        close()
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}"}
+    finally:
+        device.close()
+
+    return result
+
+
+def bench_simulated(duration: float) -> list[dict]:
+    """sustained rate, cpu and drops of every driver at each output frequency and baud rate"""
+    import simulator
+
+    results = []
+
+    def open_sdm15(port, baud_rate, freq):
+        lidar = sdm15.SDM15(port, baud_rate)
+        lidar.set_output_freq(freq)
+        lidar.start_scan()
+
+        def close():
+            lidar.stop_scan()
+            lidar.ser.close()
+
+        return _one(lidar.get_distance), close
+
+    for baud_rate in SDM15_BAUD_RATES:
+        for freq, rate in simulator.SDM15_FREQS.items():
+            device = simulator.SDM15Simulator(baud_rate, freq)
+            result = _bench_simulated(device, lambda port: open_sdm15(port, baud_rate, freq), duration)
+            results.append({"driver": "SDM15.get_distance", "baud_rate": int(baud_rate), "rate_hz": rate, **result})
+
+    def open_tfmini(port, baud_rate):
+        device = tfmini.TFMiniPlus()
+        device.begin(port, baud_rate)
+        return (lambda: 1 if device.getData() else 0), device.pStream.close
+
+    for baud_rate in TFMINI_BAUD_RATES:
+        for rate in TFMINI_FRAME_RATES:
+            device = simulator.TFMiniPlusSimulator(baud_rate, rate)
+            result = _bench_simulated(device, lambda port: open_tfmini(port, baud_rate), duration)
+            results.append({"driver": "TFMiniPlus.getData", "baud_rate": baud_rate, "rate_hz": rate, **result})
+
+    def open_tfluna(port, baud_rate, rate):
+        luna = tfluna.TFLuna(port, baud_rate)
+        luna.set_samp_rate(rate)
+        return _one(luna.read_tfluna_data), luna.close
+
+    for baud_rate in TFLUNA_BAUD_RATES:
+        for rate in TFLUNA_FRAME_RATES:
+            device = simulator.TFLunaSimulator(baud_rate, rate)
+            result = _bench_simulated(device, lambda port: open_tfluna(port, baud_rate, rate), duration)
+            results.append({"driver": "TFLuna.read_tfluna_data", "baud_rate": baud_rate, "rate_hz": rate, **result})
+
+    def open_lpxx(port, device):
+        if LP_ZIP not in sys.path:
+            sys.path.append(LP_ZIP)
+        from LP import LPXX
+
+        lidar = LPXX(port)
+        # LPXX.start_scan() uses an undefined PACKET_HED1 and _at_exit() calls it
+        atexit.unregister(lidar._at_exit)
+        device._start_streaming()
+
+        return _one(lidar.get_distance), lidar.ser.close
+
+    device = simulator.SDM15Simulator()
+    result = _bench_simulated(device, lambda port: open_lpxx(port, device), duration)
+    results.append({"driver": "LPXX.get_distance", "baud_rate": int(sdm15.BaudRate.BAUD_460800), "rate_hz": 100, **result})
+
+    for result in results:
+        result["source"] = "simulator"
+
+    return results
+
+
+def bench_decode(n_frames: int) -> list[dict]:
+    """frames/sec of the parsers alone"""
+    stream = make_sdm15_stream(n_frames)
+    tfmini_stream = make_tfmini_stream(n_frames)
+
+    return [
+        {"driver": "SDM15 legacy parser", "frames_per_sec": bench_sdm15_legacy(stream)},
+        {"driver": "SDM15 FrameParser", "frames_per_sec": bench_sdm15_parser(stream)},
+        {"driver": "SDM15 batch decode", "frames_per_sec": bench_batch(batchdecode.decode_sdm15, stream)},
+        {"driver": "TFMini batch decode", "frames_per_sec": bench_batch(batchdecode.decode_tfmini, tfmini_stream)},
+    ]
+
+
+def _print_results(title: str, results: list[dict]):
+    print(title)
+    for result in results:
+        setting = ""
+        if "rate_hz" in result:
+            setting = f" {result['rate_hz']}Hz@{result['baud_rate']}"
+        if "error" in result:
+            print(f"  {result['driver']}{setting}: {result['error']}")
+            continue
+
+        line = f"  {result['driver']}{setting}: {result['frames_per_sec']:,.0f} frames/sec"
+        if result.get("latency_p50_us") is not None:
+            line += f", latency p50 {result['latency_p50_us']:.1f} us p99 {result['latency_p99_us']:.1f} us"
+        if "cpu_percent" in result:
+            line += f", cpu {result['cpu_percent']:.0f}%"
+        if "dropped" in result:
+            line += f", dropped {result['dropped']}"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark sensor drivers and write the results as json")
+    parser.add_argument("--output", default="benchmark.json", help="json result file")
+    parser.add_argument("--frames", type=int, default=200000, help="frames per decode and replay run")
+    parser.add_argument("--duration", type=float, default=1.0, help="seconds per simulated run")
+    parser.add_argument("--no-simulator", action="store_true", help="skip simulated runs, which need Linux ptys")
+    args = parser.parse_args()
+
+    report = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "decode": bench_decode(args.frames),
+        "replay": bench_replay(args.frames),
+    }
+    _print_results("decode", report["decode"])
+    _print_results("replay", report["replay"])
+
+    if not args.no_simulator and sys.platform.startswith("linux"):
+        report["simulator"] = bench_simulated(args.duration)
+        _print_results("simulator", report["simulator"])
+
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"results written to {args.output}")
@@ -0,0 +1,254 @@
+import csv
+import json
+import struct
+import zlib
+from typing import Union
+
+import numpy as np
+
+# file layout:
+#   header    magic(8) metadata length(u4) flags(u4)
+#   metadata  utf-8 json, space padded so records start at a multiple of DATA_ALIGN
+#   records   fixed-size records of metadata["dtype"], little endian
+# with FLAG_ZLIB the records are stored as chunks of
+#   raw length(u4) compressed length(u4) zlib data
+MAGIC = b"TOFCAP01"
+HEADER_FORMAT = "<8sII"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+CHUNK_HEADER_FORMAT = "<II"
+CHUNK_HEADER_SIZE = struct.calcsize(CHUNK_HEADER_FORMAT)
+DATA_ALIGN = 64
+
+FLAG_ZLIB = 0x01
+
+
+class CaptureFormatError(Exception):
+    pass
+
+
+def _dtype_to_json(dtype: np.dtype) -> list:
+    return [list(field) for field in np.dtype(dtype).descr]
+
+
+def _dtype_from_json(descr: list) -> np.dtype:
+    return np.dtype([tuple(field) for field in descr])
+
+
+class CaptureWriter(object):
+    """
+    append-only writer of fixed-size sample records
+
+    Samples are collected in a preallocated chunk and written with one
+    file.write() per chunk instead of one per sample.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dtype: np.dtype,
+        metadata: Union[dict, None] = None,
+        chunk_size: int = 4096,
+        compress: bool = False,
+    ):
+        """create the file and write the header
+
+        Args:
+            path (str): capture file path
+            dtype (np.dtype): record dtype such as sdm15.STREAM_DTYPE or rangesensor.SAMPLE_DTYPE
+            metadata (Union[dict, None], optional): json serializable sensor info such as port and baud rate. Defaults to None.
+            chunk_size (int, optional): records per write. Defaults to 4096.
+            compress (bool, optional): zlib compress every chunk. Compressed files can not be memory mapped. Defaults to False.
+        """
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        self.chunk = np.zeros(chunk_size, dtype=self.dtype)
+        self.n_chunk = 0
+        self.compress = compress
+        self.count = 0
+
+        info = dict(metadata or {})
+        info["dtype"] = _dtype_to_json(self.dtype)
+        info["record_size"] = self.dtype.itemsize
+        text = json.dumps(info, ensure_ascii=False).encode("utf-8")
+        padding = -(HEADER_SIZE + len(text)) % DATA_ALIGN
+        text += b" " * padding
+
+        self.file = open(path, "wb")
+        self.file.write(struct.pack(HEADER_FORMAT, MAGIC, len(text), FLAG_ZLIB if compress else 0))
+        self.file.write(text)
+
+    def __enter__(self) -> "CaptureWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, samples: np.ndarray):
+        """append samples
+
+        Args:
+            samples (np.ndarray): samples with the capture dtype
+        """
+        pos = 0
+        while pos < len(samples):
+            n = min(len(samples) - pos, len(self.chunk) - self.n_chunk)
+            self.chunk[self.n_chunk : self.n_chunk + n] = samples[pos : pos + n]
+            self.n_chunk += n
+            pos += n
+
+            if self.n_chunk == len(self.chunk):
+                self._write_chunk()
+
+        self.count += len(samples)
+
+    def _write_chunk(self):
+        """write the collected records"""
+        if self.n_chunk == 0:
+            return
+
+        data = self.chunk[: self.n_chunk].tobytes()
+        if self.compress:
+            packed = zlib.compress(data)
+            self.file.write(struct.pack(CHUNK_HEADER_FORMAT, len(data), len(packed)))
+            data = packed
+        self.file.write(data)
+
+        self.n_chunk = 0
+
+    def flush(self):
+        """write collected records and flush the file"""
+        self._write_chunk()
+        self.file.flush()
+
+    def close(self):
+        """flush and close the file"""
+        if self.file.closed:
+            return
+
+        self.flush()
+        self.file.close()
+
+
+def read_header(path: str) -> tuple[dict, int, int]:
+    """read capture metadata
+
+    Raises:
+        CaptureFormatError: not a capture file
+
+    Returns:
+        tuple[dict, int, int]: metadata, flags and offset of the first record
+    """
+    with open(path, "rb") as file:
+        header = file.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise CaptureFormatError(f"{path} is too short")
+
+        magic, length, flags = struct.unpack(HEADER_FORMAT, header)
+        if magic != MAGIC:
+            raise CaptureFormatError(f"{path} is not a capture file")
+
+        metadata = json.loads(file.read(length).decode("utf-8"))
+
+    metadata["dtype"] = _dtype_from_json(metadata["dtype"])
+
+    return metadata, flags, HEADER_SIZE + length
+
+
+def open_capture(path: str) -> tuple[dict, np.memmap]:
+    """memory map an uncompressed capture without reading it
+
+    A trailing partial record, left by a logger that was killed, is ignored.
+
+    Raises:
+        CaptureFormatError: file is compressed
+
+    Returns:
+        tuple[dict, np.memmap]: metadata and read-only records
+    """
+    metadata, flags, offset = read_header(path)
+
+    if flags & FLAG_ZLIB:
+        raise CaptureFormatError(f"{path} is compressed, use load_capture()")
+
+    dtype = metadata["dtype"]
+    with open(path, "rb") as file:
+        file.seek(0, 2)
+        count = (file.tell() - offset) // dtype.itemsize
+
+    if count == 0:
+        return metadata, np.zeros(0, dtype=dtype)
+
+    return metadata, np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+
+def load_capture(path: str) -> tuple[dict, np.ndarray]:
+    """read a compressed or uncompressed capture
+
+    Returns:
+        tuple[dict, np.ndarray]: metadata and records
+    """
+    metadata, flags, offset = read_header(path)
+
+    if not flags & FLAG_ZLIB:
+        metadata, records = open_capture(path)
+        return metadata, np.array(records)
+
+    chunks = []
+    with open(path, "rb") as file:
+        file.seek(offset)
+        while True:
+            header = file.read(CHUNK_HEADER_SIZE)
+            if len(header) < CHUNK_HEADER_SIZE:
+                break
+
+            _, length = struct.unpack(CHUNK_HEADER_FORMAT, header)
+            packed = file.read(length)
+            if len(packed) < length:
+                break
+            chunks.append(zlib.decompress(packed))
+
+    return metadata, np.frombuffer(b"".join(chunks), dtype=metadata["dtype"])
+
+
+def to_csv(path: str, csv_path: str, chunk_size: int = 65536):
+    """convert a capture to csv with one column per field
+
+    Args:
+        path (str): capture file path
+        csv_path (str): csv file path
+        chunk_size (int, optional): records converted at a time. Defaults to 65536.
+    """
+    _, flags, _ = read_header(path)
+    if flags & FLAG_ZLIB:
+        _, records = load_capture(path)
+    else:
+        # convert large captures without loading them
+        _, records = open_capture(path)
+    names = records.dtype.names
+
+    with open(csv_path, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(names)
+        for pos in range(0, len(records), chunk_size):
+            chunk = records[pos : pos + chunk_size]
+            writer.writerows(zip(*(chunk[name].tolist() for name in names)))
+
+
+def to_parquet(path: str, parquet_path: str):
+    """convert a capture to parquet. Requires pyarrow
+
+    Args:
+        path (str): capture file path
+        parquet_path (str): parquet file path
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("to_parquet() requires pyarrow, install it with `pip install pyarrow`")
+
+    metadata, records = load_capture(path)
+    table = pa.table({name: records[name] for name in records.dtype.names})
+
+    info = {key: value for key, value in metadata.items() if key != "dtype"}
+    table = table.replace_schema_metadata({"capture": json.dumps(info, ensure_ascii=False)})
+    pq.write_table(table, parquet_path)
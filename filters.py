@@ -0,0 +1,342 @@
+import argparse
+import time
+from typing import Union
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import capture
+import rangesensor
+
+# MAD to standard deviation of normally distributed values
+MAD_SCALE = 1.4826
+
+# EMA decay per sample is kept above this so a long gap restarts the average
+# without a zero in the log space product
+MIN_DECAY = 1e-12
+
+# log decay spanned by one EMA block, exp(500) is far from float64 overflow
+EMA_BLOCK_LOG = 500.0
+
+
+def _valid(batch: np.ndarray) -> np.ndarray:
+    """mask of the samples with STATUS_OK and a finite distance"""
+    return (batch["status"] == rangesensor.STATUS_OK) & np.isfinite(batch["distance_mm"])
+
+
+def _nanmedian_rows(windows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """median of the finite values of every row
+
+    Rows are sorted in C, which puts nan last, and the median is picked by
+    the count of finite values, so there is no per-row Python loop.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: median, nan for rows with no finite value, and finite values per row
+    """
+    ordered = np.sort(windows, axis=1)
+    counts = np.count_nonzero(np.isfinite(ordered), axis=1)
+    rows = np.arange(len(ordered))
+    lo = np.maximum(counts - 1, 0) // 2
+    hi = counts // 2
+
+    median = (ordered[rows, lo] + ordered[rows, hi]) / 2
+    median[counts == 0] = np.nan
+
+    return median, counts
+
+
+class StreamFilter(object):
+    """
+    base of the host side filters, called on consecutive batches of one sensor
+
+    A filter keeps the state it needs from earlier batches, so filtering a
+    stream batch by batch gives the same result as filtering it at once.
+    Batches are structured arrays with the fields of rangesensor.SAMPLE_DTYPE
+    it uses, such as SAMPLE_DTYPE or sweep.POINT_DTYPE. The input batch is
+    not changed. Samples that are not STATUS_OK are passed through and do
+    not enter the state. Use one filter object per sensor.
+    """
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        """filter the next batch
+
+        Args:
+            batch (np.ndarray): samples following the last batch
+
+        Returns:
+            np.ndarray: filtered copy of the samples
+        """
+        batch = batch.copy()
+        if len(batch):
+            self._filter(batch)
+        return batch
+
+    def _filter(self, batch: np.ndarray):
+        """filter batch in place"""
+        raise NotImplementedError
+
+    def reset(self):
+        """forget the earlier batches"""
+        raise NotImplementedError
+
+
+class _WindowFilter(StreamFilter):
+    """keeps the last window - 1 distances so every sample has a full trailing window"""
+
+    def __init__(self, window: int):
+        """
+        Raises:
+            ValueError: window smaller than 1
+        """
+        if window < 1:
+            raise ValueError(f"window must be at least 1, got {window}")
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        # nan is no value, so the first samples use a shorter window
+        self._history = np.full(self.window - 1, np.nan)
+
+    def _windows(self, batch: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """valid mask and trailing window of every sample, nan where a sample is not valid"""
+        valid = _valid(batch)
+        values = np.where(valid, batch["distance_mm"], np.nan)
+
+        padded = np.concatenate((self._history, values))
+        self._history = padded[len(padded) - (self.window - 1) :]
+
+        return valid, sliding_window_view(padded, self.window)
+
+
+class SlidingMedian(_WindowFilter):
+    """
+    median of the last `window` valid samples
+
+    Removes spikes shorter than half the window and keeps steps, which an
+    average would smear. The output is causal, so a step shows up half a
+    window late.
+    """
+
+    def __init__(self, window: int = 5):
+        """
+        Args:
+            window (int, optional): samples, odd for a median of an existing value. Defaults to 5.
+        """
+        super().__init__(window)
+
+    def _filter(self, batch: np.ndarray):
+        valid, windows = self._windows(batch)
+        median, _ = _nanmedian_rows(windows)
+        batch["distance_mm"][valid] = median[valid]
+
+
+class Hampel(_WindowFilter):
+    """
+    Hampel outlier rejection over a trailing window
+
+    A sample is an outlier when it is further from the median of its window
+    than n_sigmas times the MAD estimate of the standard deviation, and
+    further than min_deviation. Outliers get STATUS_OUTLIER and a nan
+    distance, or the median with replace=True.
+    """
+
+    def __init__(
+        self,
+        window: int = 7,
+        n_sigmas: float = 3.0,
+        min_deviation: float = 10.0,
+        min_count: int = 3,
+        replace: bool = False,
+    ):
+        """
+        Args:
+            window (int, optional): samples, including the tested one. Defaults to 7.
+            n_sigmas (float, optional): threshold in standard deviations. Defaults to 3.0.
+            min_deviation (float, optional): smallest deviation in mm rejected, so steady readings with an MAD of 0 keep their quantization, 10 mm for the TFMini-Plus / TF-Luna. Defaults to 10.0.
+            min_count (int, optional): valid samples a window needs before anything is rejected. Defaults to 3.
+            replace (bool, optional): replace outliers with the median instead of rejecting them. Defaults to False.
+        """
+        super().__init__(window)
+        self.n_sigmas = n_sigmas
+        self.min_deviation = min_deviation
+        self.min_count = min_count
+        self.replace = replace
+        self.rejected = 0
+
+    def _filter(self, batch: np.ndarray):
+        valid, windows = self._windows(batch)
+        median, counts = _nanmedian_rows(windows)
+        mad, _ = _nanmedian_rows(np.abs(windows - median[:, None]))
+
+        deviation = np.abs(batch["distance_mm"] - median)
+        threshold = np.maximum(self.n_sigmas * MAD_SCALE * mad, self.min_deviation)
+        outlier = valid & (counts >= self.min_count) & (deviation > threshold)
+        self.rejected += int(np.count_nonzero(outlier))
+
+        if self.replace:
+            batch["distance_mm"][outlier] = median[outlier]
+        else:
+            batch["distance_mm"][outlier] = np.nan
+            batch["status"][outlier] = rangesensor.STATUS_OUTLIER
+
+
+class EMA(StreamFilter):
+    """
+    exponential moving average of the valid samples
+
+    With alpha every sample has the same weight. With time_constant the
+    weight grows with the time since the last valid sample, so gaps and
+    changing frame rates keep the same smoothing in seconds. The recursion
+    is solved in closed form in log space, in blocks short enough not to
+    overflow, so a batch costs a few NumPy calls.
+    """
+
+    def __init__(self, alpha: Union[float, None] = None, time_constant: Union[float, None] = None):
+        """
+        Args:
+            alpha (Union[float, None], optional): weight of a new sample, 0 to 1. Defaults to None.
+            time_constant (Union[float, None], optional): seconds for the weight of a sample to drop to 1/e. Defaults to None.
+
+        Raises:
+            ValueError: not exactly one of alpha and time_constant, or out of range
+        """
+        if (alpha is None) == (time_constant is None):
+            raise ValueError("give one of alpha and time_constant")
+        if alpha is not None and not 0 < alpha <= 1:
+            raise ValueError(f"alpha must be in (0, 1], got {alpha}")
+        if time_constant is not None and time_constant <= 0:
+            raise ValueError(f"time_constant must be positive, got {time_constant}")
+
+        self.alpha = alpha
+        self.time_constant = time_constant
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self.last_time = None
+
+    def _filter(self, batch: np.ndarray):
+        valid = _valid(batch)
+        x = batch["distance_mm"][valid].astype(np.float64)
+        if len(x) == 0:
+            return
+
+        if self.alpha is not None:
+            decay = np.full(len(x), 1.0 - self.alpha)
+        else:
+            t = batch["timestamp"][valid]
+            last = t[0] if self.last_time is None else self.last_time
+            decay = np.exp(-np.maximum(np.diff(t, prepend=last), 0.0) / self.time_constant)
+            self.last_time = t[-1]
+        decay = np.maximum(decay, MIN_DECAY)
+
+        # y[i] = decay[i] * y[i - 1] + (1 - decay[i]) * x[i]
+        y = np.empty(len(x))
+        prev = x[0] if self.value is None else self.value
+        log_decay = np.cumsum(np.log(decay))
+        start = 0
+        while start < len(x):
+            base = log_decay[start - 1] if start else 0.0
+            stop = max(int(np.searchsorted(-log_decay, EMA_BLOCK_LOG - base, side="right")), start + 1)
+
+            log_p = log_decay[start:stop] - base
+            terms = (1.0 - decay[start:stop]) * x[start:stop] * np.exp(-log_p)
+            y[start:stop] = np.exp(log_p) * (prev + np.cumsum(terms))
+
+            prev = y[stop - 1]
+            start = stop
+
+        self.value = prev
+        batch["distance_mm"][valid] = y
+
+
+class StrengthMask(StreamFilter):
+    """
+    flag samples by signal strength as the TFMini-Plus does with TFMP_WEAK and TFMP_STRONG
+
+    Weak samples get STATUS_WEAK and strong ones STATUS_STRONG, both with a
+    nan distance. Sensors with no strength report 0, so do not mask them.
+    """
+
+    def __init__(self, weak_strength: int = 100, strong_strength: int = rangesensor.TFMINI_FLUX_STRONG):
+        """
+        Args:
+            weak_strength (int, optional): strength at or below which a sample is weak, 100 for the TFMini-Plus / TF-Luna. Defaults to 100.
+            strong_strength (int, optional): strength at or above which a sample is saturated. Defaults to rangesensor.TFMINI_FLUX_STRONG.
+        """
+        self.weak_strength = weak_strength
+        self.strong_strength = strong_strength
+        self.rejected = 0
+
+    def reset(self):
+        pass
+
+    def _filter(self, batch: np.ndarray):
+        ok = batch["status"] == rangesensor.STATUS_OK
+        weak = ok & (batch["strength"] <= self.weak_strength)
+        strong = ok & (batch["strength"] >= self.strong_strength)
+        self.rejected += int(np.count_nonzero(weak | strong))
+
+        batch["status"][weak] = rangesensor.STATUS_WEAK
+        batch["status"][strong] = rangesensor.STATUS_STRONG
+        batch["distance_mm"][weak | strong] = np.nan
+
+
+class Chain(StreamFilter):
+    """filters applied one after the other, such as Chain(StrengthMask(), Hampel(), EMA(alpha=0.2))"""
+
+    def __init__(self, *filters: StreamFilter):
+        self.filters = filters
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        for f in self.filters:
+            batch = f(batch)
+        return batch
+
+    def reset(self):
+        for f in self.filters:
+            f.reset()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="filter the range samples of a capture file batch by batch")
+    parser.add_argument("input", help="capture file with rangesensor.SAMPLE_DTYPE fields")
+    parser.add_argument("output", nargs="?", help="capture file of the filtered samples")
+    parser.add_argument("--batch", type=int, default=256, help="samples per batch, as a sensor read would return")
+    parser.add_argument("--strength", type=int, help="mask samples at or below this strength")
+    parser.add_argument("--hampel", type=int, help="Hampel window in samples")
+    parser.add_argument("--median", type=int, help="sliding median window in samples")
+    parser.add_argument("--ema", type=float, help="EMA time constant in seconds")
+    args = parser.parse_args()
+
+    stages = []
+    if args.strength is not None:
+        stages.append(StrengthMask(args.strength))
+    if args.hampel:
+        stages.append(Hampel(args.hampel))
+    if args.median:
+        stages.append(SlidingMedian(args.median))
+    if args.ema:
+        stages.append(EMA(time_constant=args.ema))
+    chain = Chain(*stages)
+
+    metadata, samples = capture.load_capture(args.input)
+    writer = None
+    if args.output:
+        writer = capture.CaptureWriter(args.output, samples.dtype, metadata)
+
+    elapsed = 0.0
+    for start in range(0, len(samples), args.batch):
+        t0 = time.perf_counter()
+        filtered = chain(samples[start : start + args.batch])
+        elapsed += time.perf_counter() - t0
+        if writer is not None:
+            writer.write(filtered)
+
+    if writer is not None:
+        writer.close()
+
+    print(f"{len(samples)} samples in {elapsed:.3f} s, {len(samples) / max(elapsed, 1e-9):.0f} samples/s")
+    for f in stages:
+        if hasattr(f, "rejected"):
+            print(f"{type(f).__name__}: {f.rejected} rejected")
@@ -0,0 +1,211 @@
+import bisect
+import http.server
+import threading
+from typing import Union
+
+# upper bounds of the latency buckets in seconds
+LATENCY_BUCKETS = (
+    1e-6, 2e-6, 5e-6,
+    1e-5, 2e-5, 5e-5,
+    1e-4, 2e-4, 5e-4,
+    1e-3, 2e-3, 5e-3,
+    1e-2, 2e-2, 5e-2,
+    1e-1, 2e-1, 5e-1,
+    1.0,
+)
+
+# counters every driver keeps
+COUNTERS = (
+    "bytes_read",
+    "reads",
+    "frames",
+    "checksum_errors",
+    "resyncs",  # times bytes were skipped to find the next header
+    "timeouts",
+)
+
+# timed stages of a read
+STAGES = (
+    "wait",  # blocked in the serial driver until data arrived
+    "read",  # reading data that was already waiting
+    "parse",  # finding, checking and decoding frames
+)
+
+PROMETHEUS_PREFIX = "tof"
+
+
+class Histogram(object):
+    """
+    latency histogram with fixed buckets
+    """
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        # the last count is for values above every bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Union[float, None]:
+        """upper bound of the bucket holding quantile q. None if empty, inf if above every bucket"""
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        return {
+            "bounds": list(self.bounds),
+            "counts": list(self.counts),
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+
+class DriverMetrics(object):
+    """
+    counters and stage latencies of one driver
+
+    Only the driver thread updates them, snapshot() may be called from any thread.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.latency = {stage: Histogram() for stage in STAGES}
+
+    def add(self, counter: str, n: int = 1):
+        self.counters[counter] += n
+
+    def observe(self, stage: str, seconds: float):
+        self.latency[stage].observe(seconds)
+
+    def reset(self):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.latency = {stage: Histogram() for stage in STAGES}
+
+    def snapshot(self) -> dict:
+        """copy of every counter and histogram
+
+        Returns:
+            dict: name, counters and latency histograms by stage
+        """
+        return {
+            "name": self.name,
+            "counters": dict(self.counters),
+            "latency": {stage: histogram.snapshot() for stage, histogram in self.latency.items()},
+        }
+
+
+# every registered DriverMetrics by name
+REGISTRY: dict[str, DriverMetrics] = {}
+_registry_lock = threading.Lock()
+
+
+def register(name: str) -> DriverMetrics:
+    """create metrics for a driver. A number is appended to repeated names
+
+    Args:
+        name (str): driver name such as "SDM15"
+
+    Returns:
+        DriverMetrics: new metrics
+    """
+    with _registry_lock:
+        unique = name
+        n = 2
+        while unique in REGISTRY:
+            unique = f"{name}#{n}"
+            n += 1
+
+        metrics = DriverMetrics(unique)
+        REGISTRY[unique] = metrics
+
+    return metrics
+
+
+def unregister(metrics: DriverMetrics):
+    with _registry_lock:
+        if REGISTRY.get(metrics.name) is metrics:
+            del REGISTRY[metrics.name]
+
+
+def snapshot() -> dict[str, dict]:
+    """snapshot of every registered driver by name"""
+    with _registry_lock:
+        registered = list(REGISTRY.values())
+
+    return {metrics.name: metrics.snapshot() for metrics in registered}
+
+
+def render_prometheus() -> str:
+    """every registered driver in the prometheus text exposition format"""
+    snapshots = snapshot()
+    lines = []
+
+    for counter in COUNTERS:
+        name = f"{PROMETHEUS_PREFIX}_{counter}_total"
+        lines.append(f"# TYPE {name} counter")
+        for driver, snap in snapshots.items():
+            lines.append(f'{name}{{driver="{driver}"}} {snap["counters"][counter]}')
+
+    for stage in STAGES:
+        name = f"{PROMETHEUS_PREFIX}_{stage}_seconds"
+        lines.append(f"# TYPE {name} histogram")
+        for driver, snap in snapshots.items():
+            histogram = snap["latency"][stage]
+            total = 0
+            for bound, count in zip(histogram["bounds"] + ["+Inf"], histogram["counts"]):
+                total += count
+                lines.append(f'{name}_bucket{{driver="{driver}",le="{bound}"}} {total}')
+            lines.append(f'{name}_sum{{driver="{driver}"}} {histogram["sum"]}')
+            lines.append(f'{name}_count{{driver="{driver}"}} {histogram["count"]}')
+
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int = 9108, host: str = "127.0.0.1") -> http.server.ThreadingHTTPServer:
+    """serve render_prometheus() at http://host:port/metrics from a daemon thread
+
+    Args:
+        port (int, optional): tcp port. Defaults to 9108.
+        host (str, optional): address to listen on. Defaults to "127.0.0.1".
+
+    Returns:
+        http.server.ThreadingHTTPServer: server, call shutdown() to stop
+    """
+    server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
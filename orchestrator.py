@@ -0,0 +1,306 @@
+import argparse
+import queue
+import threading
+import time
+from typing import Iterator, Union
+
+import numpy as np
+
+import capture
+import rangesensor
+
+# a rangesensor sample and the index of its sensor in Orchestrator.names
+MERGED_DTYPE = np.dtype(rangesensor.SAMPLE_DTYPE.descr + [("sensor", "u1")])
+
+# sensor read timeout of the reader threads, also how long stopping may take
+READ_TIMEOUT = 0.1
+
+
+class Orchestrator(object):
+    """
+    acquires from several range sensors at once and merges them into one time-ordered stream
+
+    Every sensor is read by its own thread, which waits in the serial
+    driver with the GIL released, so throughput grows with the number of
+    ports. Batches wait in a bounded queue per sensor. When a queue is full
+    the reader stops reading and the port buffers the data
+    (overflow="block"), or the oldest batch is dropped (overflow="drop").
+
+    read() returns every sample up to the watermark, the time every sensor
+    is known to be complete to. A read ends after the samples it returned
+    were stamped and before the next read stamps any, so each reader
+    raises its watermark to the end of its last read.
+    """
+
+    def __init__(
+        self,
+        sensors: dict[str, rangesensor.RangeSensor],
+        queue_size: int = 64,
+        overflow: str = "block",
+        slack: float = 0.01,
+        max_pending: int = 1 << 20,
+    ):
+        """
+        Args:
+            sensors (dict[str, rangesensor.RangeSensor]): opened sensors by name, closed by close()
+            queue_size (int, optional): batches buffered per sensor. Defaults to 64.
+            overflow (str, optional): "block" or "drop" the oldest batch when a queue is full. Defaults to "block".
+            slack (float, optional): seconds a sample may be stamped before the end of the read returning it. Defaults to 0.01.
+            max_pending (int, optional): samples held back for ordering before they are returned anyway. Defaults to 1 << 20.
+
+        Raises:
+            ValueError: unknown overflow or more than 256 sensors
+        """
+        if overflow not in ("block", "drop"):
+            raise ValueError(f"overflow must be block or drop, got {overflow}")
+        if len(sensors) > 256:
+            raise ValueError("at most 256 sensors can be merged")
+
+        self.names = list(sensors)
+        self.sensors = list(sensors.values())
+        self.queues = [queue.Queue(queue_size) for _ in self.sensors]
+        self.overflow = overflow
+        self.slack = slack
+        self.max_pending = max_pending
+
+        n = len(self.sensors)
+        self.received = [0] * n
+        self.dropped = [0] * n
+        # exception that stopped the reader of each sensor
+        self.errors = [None] * n
+        self._watermarks = np.full(n, -np.inf)
+        self._pending = [[] for _ in range(n)]
+        self._new_data = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    @classmethod
+    def open(cls, ports: dict[str, tuple[str, str]], **kwargs) -> "Orchestrator":
+        """open sensors with rangesensor.open_sensor()
+
+        Args:
+            ports (dict[str, tuple[str, str]]): (sensor kind, port) by name
+
+        Returns:
+            Orchestrator: orchestrator over the opened sensors, not started
+        """
+        sensors = {}
+        try:
+            for name, (kind, port) in ports.items():
+                sensors[name] = rangesensor.open_sensor(kind, port)
+        except Exception:
+            for sensor in sensors.values():
+                sensor.close()
+            raise
+
+        return cls(sensors, **kwargs)
+
+    def __enter__(self) -> "Orchestrator":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        """start one reader thread per sensor"""
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._reader, args=(i,), daemon=True) for i in range(len(self.sensors))]
+        for thread in self._threads:
+            thread.start()
+
+    def close(self):
+        """stop the readers and close every sensor"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+        for sensor in self.sensors:
+            sensor.close()
+
+    def _put(self, i: int, item: tuple[np.ndarray, float]):
+        q = self.queues[i]
+
+        if self.overflow == "drop":
+            while True:
+                try:
+                    q.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        self.dropped[i] += len(q.get_nowait()[0])
+                    except queue.Empty:
+                        pass
+        else:
+            while not self._stop.is_set():
+                try:
+                    q.put(item, timeout=READ_TIMEOUT)
+                    break
+                except queue.Full:
+                    pass
+
+        self._new_data.set()
+
+    def _reader(self, i: int):
+        """reader thread of sensor i"""
+        sensor = self.sensors[i]
+
+        while not self._stop.is_set():
+            try:
+                batch = sensor.read(READ_TIMEOUT)
+            except Exception as e:
+                self.errors[i] = e
+                # nothing more will come, stop holding the others back
+                self._put(i, (rangesensor.empty_batch(), np.inf))
+                return
+            watermark = time.monotonic() - self.slack
+
+            # an empty batch only carries the watermark, skip it if a queued one will
+            if len(batch) == 0 and not self.queues[i].empty():
+                continue
+
+            self.received[i] += len(batch)
+            self._put(i, (batch, watermark))
+
+    def _drain(self):
+        """move every queued batch to the pending samples"""
+        for i, q in enumerate(self.queues):
+            while True:
+                try:
+                    batch, watermark = q.get_nowait()
+                except queue.Empty:
+                    break
+
+                if len(batch):
+                    merged = np.empty(len(batch), dtype=MERGED_DTYPE)
+                    for name in rangesensor.SAMPLE_DTYPE.names:
+                        merged[name] = batch[name]
+                    merged["sensor"] = i
+                    self._pending[i].append(merged)
+                self._watermarks[i] = max(self._watermarks[i], watermark)
+
+    def _merge(self) -> np.ndarray:
+        """pop every pending sample up to the watermark in time order"""
+        pending = [np.concatenate(batches) if batches else np.empty(0, dtype=MERGED_DTYPE) for batches in self._pending]
+
+        limit = self._watermarks.min()
+        if sum(len(samples) for samples in pending) > self.max_pending:
+            limit = np.inf
+
+        ready = []
+        for i, samples in enumerate(pending):
+            done = samples["timestamp"] <= limit
+            ready.append(samples[done])
+            self._pending[i] = [samples[~done]] if not done.all() else []
+
+        merged = np.concatenate(ready)
+
+        return merged[np.argsort(merged["timestamp"], kind="stable")]
+
+    def read(self, timeout: Union[float, None] = None) -> np.ndarray:
+        """get every sample that can be ordered since the last call. Blocks until at least one can
+
+        Args:
+            timeout (Union[float, None], optional): seconds to wait. Defaults to None.
+
+        Returns:
+            np.ndarray: MERGED_DTYPE samples ordered by timestamp. Empty if timed out
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            self._new_data.clear()
+            self._drain()
+            merged = self._merge()
+            if len(merged):
+                return merged
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return merged
+            self._new_data.wait(remaining)
+
+    def stream(self, duration: Union[float, None] = None) -> Iterator[np.ndarray]:
+        """yield merged batches until duration passed, or forever
+
+        Args:
+            duration (Union[float, None], optional): seconds. Defaults to None.
+
+        Yields:
+            np.ndarray: MERGED_DTYPE samples ordered by timestamp
+        """
+        end = None if duration is None else time.monotonic() + duration
+
+        while end is None or time.monotonic() < end:
+            merged = self.read(READ_TIMEOUT)
+            if len(merged):
+                yield merged
+
+    def stats(self) -> dict[str, dict]:
+        """samples received, dropped and batches queued of every sensor"""
+        return {
+            name: {
+                "received": self.received[i],
+                "dropped": self.dropped[i],
+                "queued": self.queues[i].qsize(),
+                "error": None if self.errors[i] is None else repr(self.errors[i]),
+            }
+            for i, name in enumerate(self.names)
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="acquire from several sensors at once into one time-ordered stream")
+    parser.add_argument("sensors", nargs="+", help="KIND=PORT such as SDM15=COM3 or TF-Luna=/dev/ttyUSB0, PORT is ignored with --simulate")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to acquire")
+    parser.add_argument("--output", help="capture file of the merged samples")
+    parser.add_argument("--overflow", choices=["block", "drop"], default="block")
+    parser.add_argument("--simulate", action="store_true", help="use simulator.py devices instead of ports, Linux only")
+    args = parser.parse_args()
+
+    devices = []
+    ports = {}
+    for spec in args.sensors:
+        kind, _, port = spec.partition("=")
+        if args.simulate:
+            import simulator
+
+            device = {
+                "SDM15": simulator.SDM15Simulator,
+                "TF-Luna": simulator.TFLunaSimulator,
+                "TFMini-Plus": simulator.TFMiniPlusSimulator,
+            }[kind]()
+            device.start()
+            devices.append(device)
+            port = device.port
+
+        name = kind
+        n = 2
+        while name in ports:
+            name = f"{kind}#{n}"
+            n += 1
+        ports[name] = (kind, port)
+
+    orchestrator = Orchestrator.open(ports, overflow=args.overflow)
+    writer = None
+    if args.output:
+        writer = capture.CaptureWriter(args.output, MERGED_DTYPE, {"sensors": orchestrator.names})
+
+    total = 0
+    with orchestrator:
+        t0 = time.monotonic()
+        for merged in orchestrator.stream(args.duration):
+            total += len(merged)
+            if writer is not None:
+                writer.write(merged)
+        elapsed = time.monotonic() - t0
+
+    if writer is not None:
+        writer.close()
+    for device in devices:
+        device.close()
+
+    print(f"{total} samples in {elapsed:.1f} s, {total / elapsed:.0f} samples/s")
+    for name, stats in orchestrator.stats().items():
+        print(f"{name}: {stats}")
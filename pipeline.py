@@ -0,0 +1,398 @@
+import argparse
+import copy
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Callable, Union
+
+import numpy as np
+
+import batchdecode
+import capture
+import rangesensor
+import SDM15실행파일 as sdm15
+from ringbuffer import monotonic_stamp
+from timesync import StreamClock, transfer_time
+
+# serial read timeout of the reader threads, also how long stopping may take
+READ_TIMEOUT = 0.1
+
+# seconds a reader gathers bytes after the first one before claiming a slot,
+# so a block holds many frames instead of a fragment of one
+BLOCK_INTERVAL = 0.01
+
+# per worker counters in the shared stats array
+WORKER_COUNTERS = (
+    "blocks",
+    "bytes",
+    "samples",
+    "decode_seconds",
+    "filter_seconds",
+    "write_seconds",
+)
+
+
+class PipelineWorkerError(Exception):
+    pass
+
+
+def _qsize(q) -> int:
+    """queue depth, -1 where the platform can not tell (macOS)"""
+    try:
+        return q.qsize()
+    except NotImplementedError:
+        return -1
+
+
+def _to_samples(kind: str, data: np.ndarray, timestamp: float) -> np.ndarray:
+    """convert decoded frames of a sensor to rangesensor.SAMPLE_DTYPE"""
+    if kind == "SDM15":
+        return rangesensor.SDM15Sensor.from_stream(monotonic_stamp(data, sdm15.STREAM_DTYPE, timestamp))
+
+    return rangesensor.tfmini_batch(timestamp, data["distance"], data["flux"], data["temperature"])
+
+
+def _worker(
+    index: int,
+    shm_name: str,
+    slot_size: int,
+    work: multiprocessing.Queue,
+    free: multiprocessing.Queue,
+    sensors: list[tuple[str, str, int, str]],
+    sample_filter: Union[Callable[[np.ndarray], np.ndarray], None],
+    correct_timestamps: bool,
+    counters,
+):
+    """worker process: decode, filter and write the blocks of its sensors in read order
+
+    Args:
+        sensors (list[tuple[str, str, int, str]]): name, kind, baud rate and capture path of every sensor, by sensor index
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    writers = {}
+    leftovers = {}
+    clocks = {}
+    # filters keep state between batches, so every sensor gets its own copy
+    sample_filters = {}
+    base = index * len(WORKER_COUNTERS)
+
+    try:
+        while True:
+            item = work.get()
+            if item is None:
+                break
+
+            slot, sensor, length, timestamp = item
+            start = slot * slot_size
+            data = leftovers.get(sensor, b"") + bytes(shm.buf[start : start + length])
+            # the slot is free as soon as it was copied
+            free.put(slot)
+
+            name, kind, baudrate, path = sensors[sensor]
+            t0 = time.perf_counter()
+            decode = batchdecode.decode_sdm15 if kind == "SDM15" else batchdecode.decode_tfmini
+            decoded, consumed = decode(data)
+            leftovers[sensor] = data[consumed:]
+            samples = _to_samples(kind, decoded, timestamp)
+
+            if correct_timestamps and len(samples):
+                if sensor not in clocks:
+                    clocks[sensor] = StreamClock(transfer_time(rangesensor.SENSORS[kind][0], baudrate))
+                samples["timestamp"] = clocks[sensor].correct(samples["timestamp"])
+
+            t1 = time.perf_counter()
+            if sample_filter is not None:
+                if sensor not in sample_filters:
+                    sample_filters[sensor] = copy.deepcopy(sample_filter)
+                samples = sample_filters[sensor](samples)
+
+            t2 = time.perf_counter()
+            if sensor not in writers:
+                writers[sensor] = capture.CaptureWriter(path, rangesensor.SAMPLE_DTYPE, {"sensor": name, "kind": kind, "baudrate": baudrate})
+            writers[sensor].write(samples)
+            t3 = time.perf_counter()
+
+            with counters.get_lock():
+                counters[base + 0] += 1
+                counters[base + 1] += length
+                counters[base + 2] += len(samples)
+                counters[base + 3] += t1 - t0
+                counters[base + 4] += t2 - t1
+                counters[base + 5] += t3 - t2
+    finally:
+        for writer in writers.values():
+            writer.close()
+        shm.close()
+
+
+class Pipeline(object):
+    """
+    multi-process acquisition: reader threads copy raw bytes to shared memory, worker processes do the rest
+
+    One reader thread per port copies each received block into a free slot
+    of a shared memory pool and queues the slot to the worker owning the
+    sensor. Every sensor has one worker, so its blocks are decoded in
+    order and frames cut between blocks are joined. Workers decode with
+    batchdecode, correct timestamps with a StreamClock, apply `sample_filter`
+    and append rangesensor.SAMPLE_DTYPE samples to `<output_dir>/<name>.tofcap`.
+
+    A reader waits block_interval after the first byte of a block and
+    takes everything received by then, so every block costs one queue
+    round trip and one decode for many frames. When every slot is in use
+    the readers wait, so the port buffers the data. stats() shows the depth
+    of every stage: no free slots and full worker queues mean the workers
+    are the bottleneck, empty queues mean the ports are. A worker that
+    exits early is shown by stats(), its readers stop and close() raises
+    PipelineWorkerError.
+
+    On Windows and macOS workers are spawned, so create the pipeline under
+    `if __name__ == "__main__":` and pass a module-level sample_filter.
+    """
+
+    def __init__(
+        self,
+        ports: dict[str, tuple[str, str]],
+        output_dir: str,
+        workers: Union[int, None] = None,
+        slots: int = 256,
+        slot_size: int = 65536,
+        sample_filter: Union[Callable[[np.ndarray], np.ndarray], None] = None,
+        correct_timestamps: bool = True,
+        block_interval: float = BLOCK_INTERVAL,
+    ):
+        """open the sensors and allocate the shared memory
+
+        Args:
+            ports (dict[str, tuple[str, str]]): (sensor kind, port) by name, kinds as in rangesensor.SENSORS
+            output_dir (str): directory of the capture files
+            workers (Union[int, None], optional): worker processes. Defaults to one per sensor up to the cpu count.
+            slots (int, optional): blocks in the shared memory pool. Defaults to 256.
+            slot_size (int, optional): maximum bytes per block. Defaults to 65536.
+            sample_filter (Union[Callable[[np.ndarray], np.ndarray], None], optional): applied to every decoded batch before writing, such as a filters.Chain, copied per sensor. Defaults to None.
+            correct_timestamps (bool, optional): move read timestamps to frame times with timesync.StreamClock. Defaults to True.
+            block_interval (float, optional): seconds a reader gathers bytes into one block. Defaults to BLOCK_INTERVAL.
+        """
+        self.names = list(ports)
+        self.kinds = [kind for kind, _ in ports.values()]
+        self.slot_size = slot_size
+        self.block_interval = block_interval
+        self.n_workers = workers or min(len(ports), os.cpu_count() or 1)
+
+        os.makedirs(output_dir, exist_ok=True)
+        self.paths = [os.path.join(output_dir, f"{name}.tofcap") for name in self.names]
+
+        # the drivers start the sensors, the readers then only use their serial ports
+        self.sensors = []
+        try:
+            for kind, port in ports.values():
+                self.sensors.append(rangesensor.open_sensor(kind, port))
+        except Exception:
+            for sensor in self.sensors:
+                sensor.close()
+            raise
+        self.ports = [self._serial(sensor) for sensor in self.sensors]
+
+        context = multiprocessing.get_context()
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_size)
+        self.free = context.Queue()
+        for slot in range(slots):
+            self.free.put(slot)
+        self.work = [context.Queue() for _ in range(self.n_workers)]
+        self.counters = context.Array("d", self.n_workers * len(WORKER_COUNTERS))
+
+        # reader stats, written by one reader thread each
+        self.blocks_read = [0] * len(self.sensors)
+        self.bytes_read = [0] * len(self.sensors)
+        self.slot_wait = [0.0] * len(self.sensors)
+        self.peak_depth = [0] * self.n_workers
+
+        config = [
+            (name, kind, port.baudrate, path)
+            for name, kind, port, path in zip(self.names, self.kinds, self.ports, self.paths)
+        ]
+        self._processes = [
+            context.Process(
+                target=_worker,
+                args=(i, self.shm.name, slot_size, self.work[i], self.free, config, sample_filter, correct_timestamps, self.counters),
+                daemon=True,
+            )
+            for i in range(self.n_workers)
+        ]
+        self._stop = threading.Event()
+        self._threads = []
+
+    @staticmethod
+    def _serial(sensor: rangesensor.RangeSensor):
+        """start streaming and return the serial port of an opened sensor"""
+        if isinstance(sensor, rangesensor.SDM15Sensor):
+            sensor.lidar.start_scan()
+            return sensor.lidar.ser
+        if isinstance(sensor, rangesensor.TFLunaSensor):
+            return sensor.tfluna.ser
+        return sensor.device.pStream
+
+    def __enter__(self) -> "Pipeline":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        """start the worker processes and one reader thread per port"""
+        for process in self._processes:
+            process.start()
+
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._reader, args=(i,), daemon=True) for i in range(len(self.ports))]
+        for thread in self._threads:
+            thread.start()
+
+    def _reader(self, i: int):
+        """reader thread of sensor i"""
+        ser = self.ports[i]
+        ser.timeout = READ_TIMEOUT
+        worker = i % self.n_workers
+        work = self.work[worker]
+        buf = self.shm.buf
+
+        process = self._processes[worker]
+
+        while not self._stop.is_set():
+            recv = ser.read(1)
+            if not recv:
+                continue
+
+            # gather the rest of the block, the port buffers it meanwhile
+            time.sleep(self.block_interval)
+            recv += ser.read(min(ser.in_waiting, self.slot_size - 1))
+            timestamp = time.monotonic()
+
+            t0 = time.perf_counter()
+            while True:
+                try:
+                    slot = self.free.get(timeout=READ_TIMEOUT)
+                    break
+                except queue.Empty:
+                    # a dead worker would never free the slots it is sent
+                    if self._stop.is_set() or not process.is_alive():
+                        return
+            self.slot_wait[i] += time.perf_counter() - t0
+
+            if not process.is_alive():
+                self.free.put(slot)
+                return
+
+            start = slot * self.slot_size
+            buf[start : start + len(recv)] = recv
+            work.put((slot, i, len(recv), timestamp))
+
+            self.blocks_read[i] += 1
+            self.bytes_read[i] += len(recv)
+            self.peak_depth[worker] = max(self.peak_depth[worker], _qsize(work))
+
+    def close(self):
+        """stop the readers, let the workers finish every queued block and close the sensors
+
+        Raises:
+            PipelineWorkerError: a worker process exited with an error, its capture files may be incomplete
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+        for work in self.work:
+            work.put(None)
+        for process in self._processes:
+            process.join()
+
+        for sensor in self.sensors:
+            sensor.close()
+
+        self.shm.close()
+        self.shm.unlink()
+
+        failed = [i for i, process in enumerate(self._processes) if process.exitcode != 0]
+        if failed:
+            raise PipelineWorkerError(f"workers {failed} exited with codes {[self._processes[i].exitcode for i in failed]}")
+
+    def stats(self) -> dict:
+        """counters and queue depth of every stage
+
+        Returns:
+            dict: "read" per sensor, "free_slots", and "decode" per worker with its queue depth, whether it is alive and its exit code
+        """
+        with self.counters.get_lock():
+            counters = list(self.counters)
+
+        n = len(WORKER_COUNTERS)
+        return {
+            "read": {
+                name: {"blocks": self.blocks_read[i], "bytes": self.bytes_read[i], "slot_wait_seconds": self.slot_wait[i]}
+                for i, name in enumerate(self.names)
+            },
+            "free_slots": _qsize(self.free),
+            "decode": [
+                dict(
+                    zip(WORKER_COUNTERS, counters[i * n : (i + 1) * n]),
+                    queued=_qsize(self.work[i]),
+                    peak_queued=self.peak_depth[i],
+                    alive=self._processes[i].is_alive(),
+                    exitcode=self._processes[i].exitcode,
+                    sensors=[name for j, name in enumerate(self.names) if j % self.n_workers == i],
+                )
+                for i in range(self.n_workers)
+            ],
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="acquire from several sensors with decoding and writing in worker processes")
+    parser.add_argument("sensors", nargs="+", help="KIND=PORT such as SDM15=COM3 or TF-Luna=/dev/ttyUSB0, PORT is ignored with --simulate")
+    parser.add_argument("--output-dir", default="captures", help="directory of the capture files, one per sensor")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to acquire")
+    parser.add_argument("--workers", type=int, help="worker processes, defaults to one per sensor")
+    parser.add_argument("--simulate", action="store_true", help="use simulator.py devices instead of ports, Linux only")
+    args = parser.parse_args()
+
+    devices = []
+    ports = {}
+    for spec in args.sensors:
+        kind, _, port = spec.partition("=")
+        if args.simulate:
+            import simulator
+
+            device = {
+                "SDM15": lambda: simulator.SDM15Simulator(freq=sdm15.OutputFreqHex.Freq_1800Hz),
+                "TF-Luna": lambda: simulator.TFLunaSimulator(frame_rate=1000),
+                "TFMini-Plus": lambda: simulator.TFMiniPlusSimulator(frame_rate=1000),
+            }[kind]()
+            device.start()
+            devices.append(device)
+            port = device.port
+
+        name = kind
+        n = 2
+        while name in ports:
+            name = f"{kind}#{n}"
+            n += 1
+        ports[name] = (kind, port)
+
+    with Pipeline(ports, args.output_dir, args.workers) as pipeline:
+        end = time.monotonic() + args.duration
+        while time.monotonic() < end:
+            time.sleep(1.0)
+            stats = pipeline.stats()
+            depths = ", ".join(f"{worker['sensors']} queued {worker['queued']}" for worker in stats["decode"])
+            print(f"free slots {stats['free_slots']}, {depths}")
+
+    for device in devices:
+        device.close()
+
+    stats = pipeline.stats()
+    for worker in stats["decode"]:
+        print(f"{worker['sensors']}: {worker['samples']:.0f} samples, decode {worker['decode_seconds']:.3f} s, write {worker['write_seconds']:.3f} s, peak queued {worker['peak_queued']}")
@@ -0,0 +1,327 @@
+import sys
+import time
+from typing import Union
+
+import numpy as np
+
+import batchdecode
+import SDM15실행파일 as sdm15
+from tfluna import TFLuna, TFLunaTimeoutError
+from tfminiplus import tfmini
+
+# one measurement of any range sensor in this repository
+SAMPLE_DTYPE = np.dtype(
+    [
+        ("timestamp", "<f8"),  # time.monotonic() seconds
+        ("distance_mm", "<f4"),
+        ("strength", "<u2"),  # intensity or flux, 0 if the sensor has none
+        ("temperature", "<f4"),  # °C, nan if the sensor has none
+        ("status", "u1"),
+    ]
+)
+
+# status values
+STATUS_OK = 0
+STATUS_WEAK = 1  # signal too weak, distance is not valid
+STATUS_STRONG = 2  # signal saturated
+STATUS_FLOOD = 3  # ambient light saturated
+STATUS_DISTURBED = 4  # SDM15 disturb flag set
+STATUS_OUTLIER = 5  # rejected by a host side filter such as filters.Hampel
+
+# TFMini-Plus / TF-Luna error codes sent in place of distance or flux
+TFMINI_DIST_WEAK = 0xFFFF  # -1
+TFMINI_DIST_FLOOD = 0xFFFC  # -4
+TFMINI_FLUX_STRONG = 0xFFFF  # -1
+
+# sensors open_sensor() can open, with the frame size and default baud rate of each
+SENSORS = {
+    "SDM15": (9, sdm15.BaudRate.BAUD_460800),
+    "TF-Luna": (9, 115200),
+    "TFMini-Plus": (9, 115200),
+}
+
+
+def empty_batch(n: int = 0) -> np.ndarray:
+    """allocate n samples with no strength, no temperature and STATUS_OK
+
+    Args:
+        n (int, optional): number of samples. Defaults to 0.
+
+    Returns:
+        np.ndarray: SAMPLE_DTYPE samples
+    """
+    batch = np.zeros(n, dtype=SAMPLE_DTYPE)
+    batch["temperature"] = np.nan
+
+    return batch
+
+
+def tfmini_batch(timestamp, distance_cm, flux, temperature) -> np.ndarray:
+    """convert TFMini-Plus / TF-Luna values to samples and flag the error codes"""
+    distance_cm = np.asarray(distance_cm, dtype=np.uint16)
+    flux = np.asarray(flux, dtype=np.uint16)
+
+    batch = empty_batch(len(distance_cm))
+    batch["timestamp"] = timestamp
+    batch["distance_mm"] = distance_cm * 10.0
+    batch["strength"] = flux
+    batch["temperature"] = temperature
+
+    batch["status"][flux == TFMINI_FLUX_STRONG] = STATUS_STRONG
+    batch["status"][distance_cm == TFMINI_DIST_FLOOD] = STATUS_FLOOD
+    batch["status"][distance_cm == TFMINI_DIST_WEAK] = STATUS_WEAK
+    batch["distance_mm"][batch["status"] != STATUS_OK] = np.nan
+
+    return batch
+
+
+class RangeSensor(object):
+    """
+    common interface of every range sensor
+
+    read() returns a SAMPLE_DTYPE batch so logging, fusion and plotting can
+    handle every sensor with the same vectorized code.
+    """
+
+    name = "sensor"
+
+    def read(self, timeout: Union[float, None] = None) -> np.ndarray:
+        """get every sample received since the last call. Blocks until at least one is received
+
+        Args:
+            timeout (Union[float, None], optional): seconds to wait. Defaults to the driver timeout.
+
+        Returns:
+            np.ndarray: SAMPLE_DTYPE samples, oldest first. Empty if timed out
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """close the underlying driver"""
+        raise NotImplementedError
+
+
+class SDM15Sensor(RangeSensor):
+    """
+    RangeSensor for SDM15. Reads the start_stream() ring buffer if streaming
+    """
+
+    name = "SDM15"
+
+    def __init__(self, lidar: sdm15.SDM15):
+        """
+        Args:
+            lidar (SDM15): opened lidar. Scan is started on the first read if needed
+        """
+        self.lidar = lidar
+        self.reader = None
+
+    def read(self, timeout: Union[float, None] = None) -> np.ndarray:
+        if self.lidar.streaming:
+            if self.reader is None or self.reader.ring is not self.lidar.stream:
+                self.reader = self.lidar.stream_reader()
+                # samples pushed before the first read were never returned either
+                self.reader.index = 0
+            return self.from_stream(self.reader.read(self.lidar.timeout if timeout is None else timeout))
+
+        if not self.lidar.scanning:
+            self.lidar.start_scan()
+
+        try:
+            frames = self.lidar.read_packets(timeout)
+        except sdm15.ReadTimeoutError:
+            return empty_batch()
+
+        timestamp = time.monotonic()
+        batch = empty_batch(len(frames))
+        batch["timestamp"] = timestamp
+
+        n = 0
+        for recv in frames:
+            if isinstance(recv, sdm15.PixhawkFrame):
+                # pixhawk text is in meters
+                batch["distance_mm"][n] = recv.distance * 1000.0
+            elif len(recv.data) >= 4:
+                distance, intensity, disturb = sdm15.SDM15.decode_distance(recv)
+                batch["distance_mm"][n] = distance
+                batch["strength"][n] = intensity
+                batch["status"][n] = STATUS_DISTURBED if disturb else STATUS_OK
+            else:
+                continue
+            n += 1
+
+        return batch[:n]
+
+    @staticmethod
+    def from_stream(samples: np.ndarray) -> np.ndarray:
+        """convert sdm15.STREAM_DTYPE samples"""
+        batch = empty_batch(len(samples))
+        batch["timestamp"] = samples["timestamp"]
+        batch["distance_mm"] = samples["distance"]
+        batch["strength"] = samples["intensity"]
+        batch["status"][samples["disturb"] != 0] = STATUS_DISTURBED
+
+        return batch
+
+    def close(self):
+        self.lidar.stop_stream()
+        if self.lidar.scanning:
+            self.lidar.stop_scan()
+        self.lidar.ser.close()
+
+
+class TFMiniPlusSensor(RangeSensor):
+    """
+    RangeSensor for tfmini.TFMiniPlus
+    """
+
+    name = "TFMini-Plus"
+
+    def __init__(self, device: tfmini.TFMiniPlus):
+        """
+        Args:
+            device (tfmini.TFMiniPlus): device after begin()
+        """
+        self.device = device
+
+    def read(self, timeout: Union[float, None] = None) -> np.ndarray:
+        if timeout is None:
+            timeout = tfmini.TFMP_SERIAL_TIMEOUT / 1000
+        deadline = time.monotonic() + timeout
+
+        frames = self.device.getFrames()
+        while len(frames) == 0:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return empty_batch()
+
+            # sleep in the serial driver until a byte arrives or tfmini.TFMP_READ_POLL
+            # passes, getFrames() reads the rest
+            self.device.buffer += self.device.pStream.read(1)
+            frames = self.device.getFrames()
+
+        timestamp, dist, flux, temp = zip(*frames)
+
+        return tfmini_batch(timestamp, dist, flux, temp)
+
+    def close(self):
+        self.device.pStream.close()
+
+
+class TFLunaSensor(RangeSensor):
+    """
+    RangeSensor for tfluna.TFLuna
+    """
+
+    name = "TF-Luna"
+
+    def __init__(self, tfluna: TFLuna):
+        """
+        Args:
+            tfluna (TFLuna): opened TF-Luna
+        """
+        self.tfluna = tfluna
+
+    def read(self, timeout: Union[float, None] = None) -> np.ndarray:
+        samples = self.tfluna.read_frames()
+
+        if len(samples) == 0:
+            saved = self.tfluna.timeout
+            if timeout is not None:
+                self.tfluna.timeout = timeout
+            try:
+                first = self.tfluna.read_tfluna_data()
+            except TFLunaTimeoutError:
+                return empty_batch()
+            finally:
+                self.tfluna.timeout = saved
+
+            # the blocking read decoded a whole burst, collect the rest of it
+            self.tfluna.pending.appendleft(first)
+            samples = self.tfluna.read_frames()
+
+        # stamp every frame when it ended, like TFMiniPlus.getFrames(): frames
+        # received earlier were followed by the later frames and the undecoded bytes
+        byte_time = 10 / self.tfluna.ser.baudrate
+        after = len(self.tfluna.buffer) + batchdecode.TFMINI_FRAME_SIZE * np.arange(len(samples) - 1, -1, -1)
+        timestamp = time.monotonic() - after * byte_time
+
+        return tfmini_batch(timestamp, samples["distance"], samples["flux"], samples["temperature"])
+
+    def close(self):
+        self.tfluna.close()
+
+
+class LPXXSensor(RangeSensor):
+    """
+    RangeSensor for LPXX (LP.py in LP.zip) or any driver with an SDM15-like get_distance()
+
+    get_distance() must return (distance in mm, intensity, disturb) and is
+    called once per read, so this adapter returns one sample at a time.
+    A read returns no sample when get_distance() raises the
+    FailedToReadError of the driver's own module, such as LP.py, which is
+    not sdm15.FailedToReadError.
+    """
+
+    name = "LPXX"
+
+    def __init__(self, lidar):
+        """
+        Args:
+            lidar: opened driver with get_distance()
+        """
+        self.lidar = lidar
+
+        # FailedToReadError of the modules defining the driver class and its bases
+        self.read_errors = (sdm15.FailedToReadError,)
+        for cls in type(lidar).__mro__:
+            driver_error = getattr(sys.modules.get(cls.__module__), "FailedToReadError", None)
+            if isinstance(driver_error, type) and issubclass(driver_error, Exception) and driver_error not in self.read_errors:
+                self.read_errors += (driver_error,)
+
+    def read(self, timeout: Union[float, None] = None) -> np.ndarray:
+        try:
+            distance, intensity, disturb = self.lidar.get_distance()
+        except self.read_errors:
+            return empty_batch()
+
+        batch = empty_batch(1)
+        batch["timestamp"] = time.monotonic()
+        batch["distance_mm"] = distance
+        batch["strength"] = max(intensity, 0)
+        batch["status"] = STATUS_DISTURBED if disturb > 0 else STATUS_OK
+
+        return batch
+
+    def close(self):
+        self.lidar.ser.close()
+
+
+def open_sensor(kind: str, port, baudrate: Union[int, None] = None) -> RangeSensor:
+    """open a sensor by name
+
+    Args:
+        kind (str): "SDM15", "TF-Luna" or "TFMini-Plus"
+        port: serial port name, or an opened serial-like object
+        baudrate (Union[int, None], optional): baud rate. Defaults to the sensor default in SENSORS.
+
+    Raises:
+        ValueError: unknown sensor
+
+    Returns:
+        RangeSensor: opened sensor
+    """
+    if kind not in SENSORS:
+        raise ValueError(f"unknown sensor {kind}, expected one of {', '.join(SENSORS)}")
+
+    if baudrate is None:
+        baudrate = SENSORS[kind][1]
+
+    if kind == "SDM15":
+        return SDM15Sensor(sdm15.SDM15(port, baudrate))
+    if kind == "TF-Luna":
+        return TFLunaSensor(TFLuna(port, baudrate))
+
+    device = tfmini.TFMiniPlus()
+    device.begin(port, baudrate)
+    return TFMiniPlusSensor(device)
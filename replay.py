@@ -0,0 +1,236 @@
+import mmap
+import time
+from typing import Union
+
+import numpy as np
+
+import capture
+import rangesensor
+import serialtap
+import SDM15실행파일 as sdm15
+
+
+def _map_file(path: str) -> Union[mmap.mmap, bytes]:
+    """memory map a file read-only. Empty files can not be mapped"""
+    with open(path, "rb") as file:
+        try:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return b""
+
+
+class ReplaySerial(object):
+    """
+    serial-port-like object playing back recorded serial bytes
+
+    Pass it instead of a port name to SDM15, TFLuna or TFMiniPlus.begin().
+    Commands written to it are ignored. With speed=None every byte is
+    available at once, otherwise bytes arrive at the baud rate times speed,
+    or at their recorded times for a serialtap recording (from_tap()).
+    """
+
+    def __init__(
+        self,
+        data: Union[str, bytes],
+        baudrate: int = 460800,
+        speed: Union[float, None] = 1.0,
+        timeout: Union[float, None] = None,
+    ):
+        """
+        Args:
+            data (Union[str, bytes]): recorded bytes or path of a raw byte recording, which is memory mapped
+            baudrate (int, optional): baud rate of the recording. Defaults to 460800.
+            speed (Union[float, None], optional): playback speed, 1.0 is real time. None plays as fast as possible. Defaults to 1.0.
+            timeout (Union[float, None], optional): read timeout like serial.Serial. Defaults to None.
+        """
+        self.data = _map_file(data) if isinstance(data, str) else data
+        self.port = data if isinstance(data, str) else "replay"
+        self.baudrate = baudrate
+        self.speed = speed
+        self.timeout = timeout
+        self.is_open = True
+        self.pos = 0
+        self.t0 = time.monotonic()
+        # (end offset, seconds after the first chunk) of every recorded chunk
+        self.schedule = None
+
+    @classmethod
+    def from_tap(cls, path: str, speed: Union[float, None] = 1.0, timeout: Union[float, None] = None) -> "ReplaySerial":
+        """play back the received bytes of a serialtap recording at their recorded times
+
+        Args:
+            path (str): tap file path
+            speed (Union[float, None], optional): playback speed, 1.0 is real time. None plays as fast as possible. Defaults to 1.0.
+            timeout (Union[float, None], optional): read timeout like serial.Serial. Defaults to None.
+        """
+        metadata, records = serialtap.read_tap(path)
+
+        chunks = []
+        times = []
+        for t_ns, direction, data in records:
+            if direction == serialtap.RX:
+                chunks.append(data)
+                times.append(t_ns)
+
+        replay = cls(b"".join(chunks), metadata["baudrate"], speed, timeout)
+        replay.port = metadata["port"]
+        if times:
+            ends = np.cumsum([len(chunk) for chunk in chunks])
+            replay.schedule = (ends, (np.array(times) - times[0]) / 1e9)
+
+        return replay
+
+    def _arrived(self) -> int:
+        """number of bytes received so far"""
+        if self.speed is None:
+            return len(self.data)
+
+        if self.schedule is not None:
+            ends, times = self.schedule
+            i = np.searchsorted(times, (time.monotonic() - self.t0) * self.speed, side="right")
+            return int(ends[i - 1]) if i > 0 else 0
+
+        # 8 data, 1 start and 1 stop bit per byte
+        arrived = int((time.monotonic() - self.t0) * self.speed * self.baudrate / 10)
+
+        return min(arrived, len(self.data))
+
+    @property
+    def eof(self) -> bool:
+        """whether every recorded byte has been read"""
+        return self.pos >= len(self.data)
+
+    @property
+    def in_waiting(self) -> int:
+        return self._arrived() - self.pos
+
+    def inWaiting(self) -> int:
+        return self.in_waiting
+
+    def read(self, size: int = 1) -> bytes:
+        """read size bytes, waiting up to timeout like serial.Serial
+
+        At the end of the recording this waits for timeout and returns the
+        remaining bytes, like a device that stopped sending.
+        """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+
+        while self._arrived() - self.pos < size and self._arrived() < len(self.data):
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+
+            # sleep until the missing bytes are due
+            if self.schedule is not None:
+                ends, times = self.schedule
+                i = np.searchsorted(ends, self.pos + size, side="left")
+                due = times[min(i, len(times) - 1)] / self.speed - (time.monotonic() - self.t0)
+            else:
+                missing = size - (self._arrived() - self.pos)
+                due = missing * 10 / (self.baudrate * self.speed)
+            due = max(due, 0.0001)
+            time.sleep(due if remaining is None else min(due, remaining))
+
+        stop = min(self.pos + size, self._arrived())
+        if stop == self.pos and self.eof and deadline is not None:
+            time.sleep(max(0.0, deadline - time.monotonic()))
+
+        recv = bytes(self.data[self.pos : stop])
+        self.pos = stop
+
+        return recv
+
+    def write(self, data: bytes) -> int:
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        # the recording is the only input, dropping it would lose data
+        pass
+
+    def reset_output_buffer(self):
+        pass
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+
+class ReplaySensor(rangesensor.RangeSensor):
+    """
+    RangeSensor playing back a capture file of SAMPLE_DTYPE or sdm15.STREAM_DTYPE samples
+
+    Samples are returned with their recorded timestamps. In real time, a
+    sample is returned once as much time has passed since the first read
+    as passed between the first recorded sample and it.
+    """
+
+    name = "replay"
+
+    def __init__(self, path: str, speed: Union[float, None] = 1.0, chunk_size: int = 4096, timeout: float = 1.0):
+        """
+        Args:
+            path (str): capture file path
+            speed (Union[float, None], optional): playback speed, 1.0 is real time. None plays as fast as possible. Defaults to 1.0.
+            chunk_size (int, optional): maximum samples per read when playing as fast as possible. Defaults to 4096.
+            timeout (float, optional): default seconds a read waits for the next sample. Defaults to 1.0.
+        """
+        self.metadata, self.records = capture.open_capture(path)
+        self.name = self.metadata.get("sensor", self.name)
+        self.speed = speed
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.pos = 0
+        self.t0 = None
+
+        names = self.records.dtype.names
+        if names == rangesensor.SAMPLE_DTYPE.names:
+            self._convert = lambda samples: np.array(samples, dtype=rangesensor.SAMPLE_DTYPE)
+        elif names == sdm15.STREAM_DTYPE.names:
+            self._convert = rangesensor.SDM15Sensor.from_stream
+        else:
+            raise capture.CaptureFormatError(f"can not replay samples with fields {names}")
+
+        self.timestamps = self.records["timestamp"]
+
+    @property
+    def eof(self) -> bool:
+        """whether every recorded sample has been read"""
+        return self.pos >= len(self.records)
+
+    def read(self, timeout: Union[float, None] = None) -> np.ndarray:
+        if self.eof:
+            return rangesensor.empty_batch()
+
+        if self.speed is None:
+            stop = min(self.pos + self.chunk_size, len(self.records))
+        else:
+            if self.t0 is None:
+                self.t0 = time.monotonic()
+
+            # wait for the next sample to be due
+            due = self.t0 + (self.timestamps[self.pos] - self.timestamps[0]) / self.speed
+            wait = due - time.monotonic()
+            timeout = self.timeout if timeout is None else timeout
+            if wait > timeout:
+                time.sleep(timeout)
+                return rangesensor.empty_batch()
+            if wait > 0:
+                time.sleep(wait)
+
+            # every sample due by now
+            elapsed = (time.monotonic() - self.t0) * self.speed + self.timestamps[0]
+            stop = int(np.searchsorted(self.timestamps, elapsed, side="right"))
+            stop = max(stop, self.pos + 1)
+
+        samples = self._convert(self.records[self.pos : stop])
+        self.pos = stop
+
+        return samples
+
+    def close(self):
+        self.records = self.records[:0]
@@ -0,0 +1,177 @@
+import threading
+import time
+from typing import Union
+
+import numpy as np
+
+
+class SampleRing(object):
+    """
+    fixed-size ring buffer of structured samples with one writer thread
+
+    The writer works like a seqlock and never takes a lock: it reserves
+    the slots it is about to overwrite by advancing `writing`, copies the
+    samples in and then publishes them by advancing `written`. Readers copy
+    out, then read `writing` and drop whatever the writer overwrote or was
+    overwriting while they were copying.
+    """
+
+    def __init__(self, capacity: int, dtype: np.dtype):
+        """preallocate the buffer
+
+        Args:
+            capacity (int): number of samples kept
+            dtype (np.dtype): sample dtype
+        """
+        self.buffer = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        # total number of samples ever written
+        self.written = 0
+        # total number of samples written or being written, ahead of written during a push
+        self.writing = 0
+        self._new_data = threading.Condition()
+
+    def push(self, samples: np.ndarray):
+        """append samples. Only one thread may push
+
+        Args:
+            samples (np.ndarray): samples with the ring dtype
+        """
+        n = len(samples)
+
+        if n == 0:
+            return
+
+        written = self.written
+
+        # only the newest capacity samples can be kept
+        if n > self.capacity:
+            written += n - self.capacity
+            samples = samples[-self.capacity :]
+            n = self.capacity
+
+        # reserve before overwriting, so readers know the old samples are gone
+        self.writing = written + n
+
+        start = written % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start : start + first] = samples[:first]
+        self.buffer[: n - first] = samples[first:]
+
+        # publish
+        self.written = written + n
+
+        with self._new_data:
+            self._new_data.notify_all()
+
+    def _copy(self, start: int, stop: int) -> tuple[np.ndarray, int]:
+        """copy samples [start, stop) counted from the first sample ever written
+
+        Returns:
+            tuple[np.ndarray, int]: samples still in the buffer and index of the first one
+        """
+        start = max(start, stop - self.capacity)
+        index = np.arange(start, stop) % self.capacity
+        samples = self.buffer[index]
+
+        # drop samples the writer overwrote or was overwriting during the copy,
+        # writing is read after the copy so a push in progress is seen
+        overwritten = min(self.writing - self.capacity - start, stop - start)
+        if overwritten > 0:
+            samples = samples[overwritten:]
+            start += overwritten
+
+        return samples, start
+
+    def latest(self, n: int) -> np.ndarray:
+        """copy the newest samples
+
+        Args:
+            n (int): maximum number of samples
+
+        Returns:
+            np.ndarray: up to n samples, oldest first
+        """
+        stop = self.written
+        samples, _ = self._copy(max(0, stop - n), stop)
+
+        return samples
+
+    def read(self, since: int) -> tuple[np.ndarray, int, int]:
+        """copy every sample written after index since
+
+        Args:
+            since (int): value of `written` returned by the previous read
+
+        Returns:
+            tuple[np.ndarray, int, int]: samples, index to pass to the next read and number of samples lost to overwriting
+        """
+        stop = self.written
+        samples, start = self._copy(since, stop)
+
+        return samples, stop, start - since
+
+    def wait(self, since: int, timeout: Union[float, None] = None) -> bool:
+        """block until a sample is written after index since
+
+        Args:
+            since (int): value of `written` already seen
+            timeout (Union[float, None], optional): seconds to wait. Defaults to None.
+
+        Returns:
+            bool: True if new samples are available
+        """
+        with self._new_data:
+            return self._new_data.wait_for(lambda: self.written > since, timeout)
+
+    def reader(self) -> "RingReader":
+        """create a cursor that starts at the newest sample"""
+        return RingReader(self)
+
+
+class RingReader(object):
+    """
+    cursor over a SampleRing returning every new sample once
+    """
+
+    def __init__(self, ring: SampleRing):
+        self.ring = ring
+        self.index = ring.written
+        self.dropped = 0
+
+    def read(self, timeout: Union[float, None] = None) -> np.ndarray:
+        """get samples written since the last call. Blocks until at least one is written
+
+        Args:
+            timeout (Union[float, None], optional): seconds to wait. Defaults to None.
+
+        Returns:
+            np.ndarray: new samples. Empty if timed out
+        """
+        if timeout is None or timeout > 0:
+            self.ring.wait(self.index, timeout)
+
+        samples, self.index, dropped = self.ring.read(self.index)
+        self.dropped += dropped
+
+        return samples
+
+
+def monotonic_stamp(samples: np.ndarray, dtype: np.dtype, timestamp: Union[float, None] = None) -> np.ndarray:
+    """copy decoded samples into dtype with a timestamp field
+
+    Args:
+        samples (np.ndarray): decoded samples
+        dtype (np.dtype): dtype with "timestamp" and every field of samples
+        timestamp (Union[float, None], optional): time.monotonic() value. Defaults to now.
+
+    Returns:
+        np.ndarray: stamped samples
+    """
+    stamped = np.empty(len(samples), dtype=dtype)
+    stamped["timestamp"] = time.monotonic() if timestamp is None else timestamp
+
+    for name in samples.dtype.names:
+        stamped[name] = samples[name]
+
+    return stamped
@@ -2,9 +2,42 @@
 #define DIR_PIN 4         // 모터 방향 핀
 #define ORIGIN_SENSOR_PIN 7  // 원점 센서 핀
 
-bool rotate = true;
-int AngleToMove = 0;
+#define STEPS_PER_TURN 24000L    // 200펄스로 3도 회전, 따라서 360도 = 120 * 200 펄스
+#define MAX_STEP_RATE 2000.0     // 최고 속도 (펄스/초)
+#define MIN_STEP_RATE 200.0      // 출발, 정지 속도 (펄스/초)
+#define ACCELERATION 4000.0      // 가감속 (펄스/초^2)
+#define PULSE_WIDTH_US 3         // 펄스 폭
+#define COMMAND_IDLE_MS 50       // 줄바꿈 없는 명령은 이 시간 동안 입력이 없으면 실행
+#define REPORT_INTERVAL_MS 100   // 회전 중 시간 출력 주기
+
+// 위치 패킷: 0xA5 0x5A, 위치 int32, 시각 uint32 (us), 상태, 체크섬. 정수는 little endian
+#define POSITION_HED1 0xA5
+#define POSITION_HED2 0x5A
+#define POSITION_PACKET_SIZE 12
+#define POSITION_INTERVAL_MS 40  // 위치 패킷 주기, 9600bps에서 시간 출력과 함께 보낼 수 있는 정도
+
+// "T" 명령의 응답: 0xA5 0x5B, 명령을 받은 시각 uint32 (us), 체크섬. 호스트 시계 동기화용
+#define PING_HED2 0x5B
+#define PING_PACKET_SIZE 7
+
+// 회전 상태. stepsTotal이 0이면 정지 상태
+long stepsTotal = 0;
+long stepsDone = 0;
+unsigned long stepInterval = 0;   // 다음 펄스까지의 시간 (us)
+unsigned long lastStepMicros = 0;
+unsigned long moveStartMillis = 0;
+unsigned long lastReportMillis = 0;
+
+long position = 0;                // 전원을 켠 뒤 누적 펄스 수, DIR_PIN HIGH 방향이 +
+int direction = 1;
+unsigned long lastPulseMicros = 0;  // 마지막 펄스를 출력한 시각
+bool positionStreaming = false;   // "P1"로 켜고 "P0"로 끔
+unsigned long lastPositionMillis = 0;
+
 String inputStr;
+unsigned long lastInputMillis = 0;
+unsigned long commandMicros = 0;  // 마지막 명령의 줄바꿈을 받은 시각
+String pendingCmd;                // 회전 중에 받은 명령, 회전이 끝나면 실행
 
 void setup() {
     pinMode(PUL_PIN, OUTPUT);
@@ -12,65 +45,223 @@ void setup() {
     pinMode(ORIGIN_SENSOR_PIN, INPUT_PULLUP);  // 원점 센서 풀업 설정
 
     Serial.begin(9600);
-    
+
     // 초기 모터 설정
     digitalWrite(DIR_PIN, HIGH);  // 초기 방향 설정
     delay(500);                   // 초기화 대기
 }
 
-void generatePulse() { // 펄스 생성 함수
-    if(rotate){
-        digitalWrite(PUL_PIN, HIGH);
-        delayMicroseconds(2);        // 펄스 폭
-        digitalWrite(PUL_PIN, LOW);
-        delayMicroseconds(2);        // 로우 레벨 폭
-        delay(2);                    // 스텝 간격 조정
+bool moving() {
+    return stepsTotal != 0;
+}
+
+// 남은 펄스 수로 감속하고 진행한 펄스 수로 가속하는 사다리꼴 속도
+float stepRate() {
+    float minSq = MIN_STEP_RATE * MIN_STEP_RATE;
+    float up = sqrt(minSq + 2.0 * ACCELERATION * stepsDone);
+    float down = sqrt(minSq + 2.0 * ACCELERATION * (stepsTotal - stepsDone));
+    return min(MAX_STEP_RATE, min(up, down));
+}
+
+void startMove(long steps) {
+    if (steps == 0) {
+        return;
     }
+
+    direction = steps > 0 ? 1 : -1;
+    digitalWrite(DIR_PIN, steps > 0 ? HIGH : LOW);
+    stepsTotal = steps > 0 ? steps : -steps;
+    stepsDone = 0;
+
+    // 첫 펄스는 바로 출력
+    stepInterval = 1000000.0 / MIN_STEP_RATE;
+    lastStepMicros = micros() - stepInterval;
+    moveStartMillis = millis();
+    lastReportMillis = moveStartMillis;
 }
 
-void stop(){
-    rotate = false;
+void printRotationTime(const char *label) {
+    Serial.print(label);
+    Serial.print((millis() - moveStartMillis) / 1000.0, 3);
+    Serial.println(" s");
 }
 
-void rotateonce(){
-  digitalWrite(DIR_PIN, HIGH);  // 초기 방향 설정
-  for(int j = 0; j< 120; j++) // 1회전 3도이므로 3*120 = 360
-    for(int i = 0; i < 200; i++) {// 200펄스로 1회전 
-        generatePulse();
+// 현재 속도에서 감속해 정지
+void stopMove() {
+    pendingCmd = "";
+
+    if (!moving()) {
+        return;
+    }
+
+    float rate = 1000000.0 / stepInterval;
+    long stopSteps = (rate * rate - MIN_STEP_RATE * MIN_STEP_RATE) / (2.0 * ACCELERATION);
+    stopSteps = max(stopSteps, 1L);  // 마지막 펄스에서 회전 완료 처리
+    if (stepsTotal - stepsDone > stopSteps) {
+        stepsTotal = stepsDone + stopSteps;
     }
 }
 
-void rotateAngle() {
-    if(AngleToMove > 0 && AngleToMove <= 360){
-        digitalWrite(DIR_PIN, HIGH);  // 초기 방향 설정
-        for (int j = 0; j < AngleToMove; j++) {
-            for(int i = 0; i < 200/3; i++) {// 200펄스로 1회전 = 3도, 따라서 200/3 = 1도
-                generatePulse();
-            }
-        }
+void handleCommand(String cmd) {
+    cmd.trim();  // 입력 문자열의 앞뒤 공백 제거
+    if (cmd.length() == 0) {
+        return;
     }
-    else if(AngleToMove < 0 && AngleToMove >= -360){
-        digitalWrite(DIR_PIN, LOW);  // 초기 방향 설정
-        AngleToMove = -AngleToMove;
-        for (int j = 0; j < AngleToMove; j++) {
-            for(int i = 0; i < 200/3; i++) {// 200펄스로 1회전 = 3도, 따라서 200/3 = 1도
-                generatePulse();
-            }
+
+    if (cmd == "S") {
+        stopMove();
+        return;
+    }
+
+    if (cmd == "T") {
+        sendPing();
+        return;
+    }
+
+    if (cmd == "P1" || cmd == "P0") {
+        positionStreaming = cmd == "P1";
+        lastPositionMillis = millis() - POSITION_INTERVAL_MS;  // 첫 패킷은 바로 전송
+        return;
+    }
+
+    if (moving()) {
+        pendingCmd = cmd;
+        return;
+    }
+
+    if (cmd == "R") {
+        startMove(STEPS_PER_TURN);
+    }
+    else {
+        long angle = cmd.toInt();
+        if (angle != 0 && angle >= -360 && angle <= 360) {
+            // 200펄스 = 3도. 이전 펌웨어는 1도에 200/3 = 66펄스(정수)로 360도가 23760펄스였음
+            startMove(angle * 200 / 3);
         }
     }
 }
 
-void loop() {
-    if (Serial.available() > 0) {
-        inputStr = Serial.readStringUntil('\n');
-        inputStr.trim();  // 입력 문자열의 앞뒤 공백 제거
+// 펄스 시간이 되었을 때만 펄스 하나를 출력하고 바로 돌아감
+void runMotor() {
+    if (!moving()) {
+        return;
+    }
+
+    unsigned long now = micros();
+    if (now - lastStepMicros < stepInterval) {
+        return;
+    }
+
+    digitalWrite(PUL_PIN, HIGH);
+    delayMicroseconds(PULSE_WIDTH_US);  // 펄스 폭
+    digitalWrite(PUL_PIN, LOW);
+    position += direction;
+    lastPulseMicros = now;
+
+    // 늦어진 펄스는 따라잡지 않음
+    lastStepMicros += stepInterval;
+    if (now - lastStepMicros > stepInterval) {
+        lastStepMicros = now;
+    }
 
-        if(inputStr == "R"){rotateonce();}
-        else if(inputStr == "S"){stop();}
+    stepsDone++;
+    if (stepsDone < stepsTotal) {
+        stepInterval = 1000000.0 / stepRate();
+        return;
+    }
+
+    stepsTotal = 0;
+    printRotationTime("Total Rotation Time: ");
+    lastPositionMillis = millis() - POSITION_INTERVAL_MS;  // 멈춘 위치를 바로 전송
+
+    if (pendingCmd.length() > 0) {
+        String cmd = pendingCmd;
+        pendingCmd = "";
+        handleCommand(cmd);
+    }
+}
+
+// 한 글자씩 읽어서 회전 중에도 명령을 받음
+void readSerial() {
+    while (Serial.available() > 0) {
+        char c = Serial.read();
+        lastInputMillis = millis();
+
+        if (c == '\n' || c == '\r') {
+            commandMicros = micros();
+            handleCommand(inputStr);
+            inputStr = "";
+        }
         else {
-            int angle = inputStr.toInt();
-            AngleToMove = angle;
-            rotateAngle();
+            inputStr += c;
         }
     }
-}
\ No newline at end of file
+
+    // 호스트는 줄바꿈 없이 "R", "S", 각도를 보냄
+    if (inputStr.length() > 0 && millis() - lastInputMillis >= COMMAND_IDLE_MS) {
+        commandMicros = micros();
+        handleCommand(inputStr);
+        inputStr = "";
+    }
+}
+
+void report() {
+    if (moving() && millis() - lastReportMillis >= REPORT_INTERVAL_MS) {
+        lastReportMillis += REPORT_INTERVAL_MS;
+        printRotationTime("Current Rotation Time: ");
+    }
+}
+
+byte checkSumOf(byte *packet, int size) {
+    byte checkSum = 0;
+    for (int i = 0; i < size - 1; i++) {
+        checkSum += packet[i];
+    }
+    return checkSum;
+}
+
+// 명령을 받은 시각을 바로 보냄. 호스트는 왕복 시간으로 시계 차이를 계산
+void sendPing() {
+    byte packet[PING_PACKET_SIZE];
+    packet[0] = POSITION_HED1;
+    packet[1] = PING_HED2;
+    for (int i = 0; i < 4; i++) {
+        packet[2 + i] = (commandMicros >> (8 * i)) & 0xFF;
+    }
+    packet[PING_PACKET_SIZE - 1] = checkSumOf(packet, PING_PACKET_SIZE);
+
+    Serial.write(packet, PING_PACKET_SIZE);
+}
+
+// 위치와 그 위치가 된 시각을 보냄. 회전 중에는 마지막 펄스 시각, 정지 중에는 현재 시각
+void sendPosition() {
+    if (!positionStreaming || millis() - lastPositionMillis < POSITION_INTERVAL_MS) {
+        return;
+    }
+
+    // 송신 버퍼가 부족하면 펄스 출력이 막히지 않도록 다음 주기에 보냄
+    if (Serial.availableForWrite() < POSITION_PACKET_SIZE) {
+        return;
+    }
+    lastPositionMillis = millis();
+
+    unsigned long t = moving() ? lastPulseMicros : micros();
+    byte packet[POSITION_PACKET_SIZE];
+    packet[0] = POSITION_HED1;
+    packet[1] = POSITION_HED2;
+    for (int i = 0; i < 4; i++) {
+        packet[2 + i] = (position >> (8 * i)) & 0xFF;
+        packet[6 + i] = (t >> (8 * i)) & 0xFF;
+    }
+    packet[10] = moving() ? 1 : 0;
+    packet[POSITION_PACKET_SIZE - 1] = checkSumOf(packet, POSITION_PACKET_SIZE);
+
+    Serial.write(packet, POSITION_PACKET_SIZE);
+}
+
+void loop() {
+    runMotor();
+    readSerial();
+    report();
+    sendPosition();
+}
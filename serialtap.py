@@ -0,0 +1,167 @@
+import json
+import struct
+import threading
+import time
+from collections import deque
+from typing import Iterator, Union
+
+import serial
+
+# file layout:
+#   header    magic(8) metadata length(u4)
+#   metadata  utf-8 json
+#   records   monotonic time in ns(u8) length(u4) direction(u1) bytes
+MAGIC = b"TOFTAP01"
+HEADER_FORMAT = "<8sI"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+RECORD_FORMAT = "<QIB"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+# direction
+RX = 0
+TX = 1
+
+
+class TapFormatError(Exception):
+    pass
+
+
+class TapSerial(object):
+    """
+    serial port wrapper recording every received and written chunk
+
+    read() and write() only append the chunk to a queue. A writer thread
+    packs the queue into the file every flush_interval, so a slow disk never
+    stalls the driver. Pass it instead of a port name to SDM15, TFLuna or
+    TFMiniPlus.begin().
+    """
+
+    def __init__(self, ser: serial.Serial, path: str, metadata: Union[dict, None] = None, flush_interval: float = 0.1):
+        """open the tap file and start the writer thread
+
+        Args:
+            ser (serial.Serial): opened serial port
+            path (str): tap file path
+            metadata (Union[dict, None], optional): json serializable info saved with port and baud rate. Defaults to None.
+            flush_interval (float, optional): seconds between writes to the file. Defaults to 0.1.
+        """
+        # attributes of the wrapper itself, everything else goes to ser
+        object.__setattr__(self, "ser", ser)
+        object.__setattr__(self, "chunks", deque())
+        object.__setattr__(self, "flush_interval", flush_interval)
+        object.__setattr__(self, "_stop", threading.Event())
+
+        info = dict(metadata or {})
+        info.update(
+            port=ser.port,
+            baudrate=ser.baudrate,
+            # pairs a monotonic record time with wall clock time
+            monotonic_ns=time.monotonic_ns(),
+            time=time.time(),
+        )
+        text = json.dumps(info, ensure_ascii=False).encode("utf-8")
+
+        file = open(path, "wb", buffering=1 << 20)
+        file.write(struct.pack(HEADER_FORMAT, MAGIC, len(text)))
+        file.write(text)
+        object.__setattr__(self, "file", file)
+
+        thread = threading.Thread(target=self._writer_loop, daemon=True)
+        object.__setattr__(self, "_thread", thread)
+        thread.start()
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.ser, name, value)
+
+    def read(self, size: int = 1) -> bytes:
+        recv = self.ser.read(size)
+        if recv:
+            self.chunks.append((time.monotonic_ns(), RX, recv))
+        return recv
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append((time.monotonic_ns(), TX, bytes(data)))
+        return self.ser.write(data)
+
+    def _drain(self):
+        """write queued chunks to the file"""
+        chunks = self.chunks
+        pack = struct.pack
+        records = []
+
+        while chunks:
+            t_ns, direction, data = chunks.popleft()
+            records.append(pack(RECORD_FORMAT, t_ns, len(data), direction))
+            records.append(data)
+
+        if records:
+            self.file.write(b"".join(records))
+
+    def _writer_loop(self):
+        """writer thread: drain the queue every flush_interval"""
+        while not self._stop.wait(self.flush_interval):
+            self._drain()
+        self._drain()
+
+    def close(self):
+        """stop recording, flush the tap file and close the serial port"""
+        if not self._stop.is_set():
+            self._stop.set()
+            self._thread.join()
+            self.file.close()
+
+        self.ser.close()
+
+
+def open_tap(port: str, baudrate: int, path: str, timeout: Union[float, None] = None, **metadata) -> TapSerial:
+    """open a serial port recorded to path
+
+    Args:
+        port (str): serial port name
+        baudrate (int): baud rate
+        path (str): tap file path
+        timeout (Union[float, None], optional): read timeout. Defaults to None.
+
+    Returns:
+        TapSerial: recorded serial port
+    """
+    return TapSerial(serial.Serial(port=port, baudrate=baudrate, timeout=timeout), path, metadata)
+
+
+def read_tap(path: str) -> tuple[dict, Iterator[tuple[int, int, bytes]]]:
+    """read a tap file
+
+    A record cut off by a killed process is ignored.
+
+    Raises:
+        TapFormatError: not a tap file
+
+    Returns:
+        tuple[dict, Iterator[tuple[int, int, bytes]]]: metadata and (monotonic time in ns, direction, bytes) records
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+
+    if len(data) < HEADER_SIZE:
+        raise TapFormatError(f"{path} is too short")
+
+    magic, length = struct.unpack_from(HEADER_FORMAT, data)
+    if magic != MAGIC:
+        raise TapFormatError(f"{path} is not a tap file")
+
+    metadata = json.loads(data[HEADER_SIZE : HEADER_SIZE + length].decode("utf-8"))
+
+    def records():
+        pos = HEADER_SIZE + length
+        while pos + RECORD_SIZE <= len(data):
+            t_ns, size, direction = struct.unpack_from(RECORD_FORMAT, data, pos)
+            pos += RECORD_SIZE
+            if pos + size > len(data):
+                return
+            yield t_ns, direction, data[pos : pos + size]
+            pos += size
+
+    return metadata, records()
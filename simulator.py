@@ -0,0 +1,578 @@
+import os
+import select
+import struct
+import threading
+import time
+import tty
+
+import numpy as np
+
+import SDM15실행파일 as sdm15
+import stage
+import tfluna
+
+# SDM15 output frequency of every OutputFreqHex
+SDM15_FREQS = {
+    sdm15.OutputFreqHex.Freq_10Hz: 10,
+    sdm15.OutputFreqHex.Freq_100Hz: 100,
+    sdm15.OutputFreqHex.Freq_200Hz: 200,
+    sdm15.OutputFreqHex.Freq_500Hz: 500,
+    sdm15.OutputFreqHex.Freq_1000Hz: 1000,
+    sdm15.OutputFreqHex.Freq_1800Hz: 1800,
+}
+
+# TFMini-Plus command ids
+TFMINI_GET_FIRMWARE_VERSION = 0x01
+TFMINI_SOFT_RESET = 0x02
+TFMINI_SET_FRAME_RATE = 0x03
+TFMINI_TRIGGER_DETECTION = 0x04
+TFMINI_SET_FORMAT = 0x05
+TFMINI_ENABLE_OUTPUT = 0x07
+TFMINI_HARD_RESET = 0x10
+TFMINI_SAVE_SETTINGS = 0x11
+TFMINI_FORMAT_MM = 0x06
+
+# rotatemotor.ino: 200 pulses turn the stage 3 degrees, "R" sends 120 * 200
+STAGE_DEGREES_PER_PULSE = 3 / 200
+STAGE_PULSES_PER_TURN = 120 * 200
+# trapezoidal ramp in pulses/s and pulses/s^2
+STAGE_MAX_STEP_RATE = 2000.0
+STAGE_MIN_STEP_RATE = 200.0
+STAGE_ACCELERATION = 4000.0
+# a command without newline is taken after this many seconds without input
+STAGE_COMMAND_IDLE = 0.05
+
+
+class SimulatedDevice(object):
+    """
+    device emulated behind a pty pair, Linux only
+
+    Open `port` with a driver like a real serial port. Bytes are written at
+    the configured baud rate and dropped, like a UART overrun, when the
+    driver does not read them.
+    """
+
+    def __init__(self, baudrate: int):
+        """create the pty pair
+
+        Args:
+            baudrate (int): baud rate used to pace output
+        """
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+
+        self.port = os.ttyname(self.slave)
+        self.baudrate = baudrate
+        self.rx = bytearray()
+        # bytes dropped because the driver did not read
+        self.overruns = 0
+        self._tx_free = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        """start emulating in a thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """stop the thread and close the pty pair"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+        os.close(self.master)
+        os.close(self.slave)
+
+    def _send(self, data: bytes):
+        """write data no faster than the baud rate"""
+        now = time.monotonic()
+        start = max(now, self._tx_free)
+        if start > now:
+            time.sleep(start - now)
+        # 8 data, 1 start and 1 stop bit per byte
+        self._tx_free = start + len(data) * 10 / self.baudrate
+
+        try:
+            written = os.write(self.master, data)
+        except BlockingIOError:
+            written = 0
+        self.overruns += len(data) - written
+
+    def _loop(self):
+        """wait for commands and emit output when it is due"""
+        while not self._stop.is_set():
+            timeout = min(max(0.0, self._next_due() - time.monotonic()), 0.05)
+            readable, _, _ = select.select([self.master], [], [], timeout)
+
+            if readable:
+                try:
+                    self.rx += os.read(self.master, 4096)
+                except BlockingIOError:
+                    pass
+                self._handle()
+
+            self._emit(time.monotonic())
+
+    def _next_due(self) -> float:
+        """time.monotonic() value of the next output"""
+        return float("inf")
+
+    def _handle(self):
+        """consume complete commands from self.rx"""
+        pass
+
+    def _emit(self, now: float):
+        """send output due by now"""
+        pass
+
+
+class StreamingDevice(SimulatedDevice):
+    """
+    SimulatedDevice sending one frame per 1 / rate seconds while streaming
+    """
+
+    def __init__(self, baudrate: int, rate: int):
+        super().__init__(baudrate)
+        self.distance_mm = 1000.0
+        self.rate = rate
+        self.streaming = False
+        self.frames_sent = 0
+        self._t0 = 0.0
+        self._due_frames = 0
+
+    def start(self):
+        super().start()
+        if self.streaming:
+            self._start_streaming()
+
+    def _start_streaming(self):
+        self.streaming = True
+        self._t0 = time.monotonic()
+        self._due_frames = 0
+
+    def _set_rate(self, rate: int):
+        self.rate = rate
+        if self.streaming:
+            self._start_streaming()
+
+    def _next_due(self) -> float:
+        if not self.streaming or self.rate <= 0:
+            return float("inf")
+        return self._t0 + (self._due_frames + 1) / self.rate
+
+    def _emit(self, now: float):
+        if not self.streaming or self.rate <= 0:
+            return
+
+        # frames due since the last call, sent in one write
+        due = int((now - self._t0) * self.rate)
+        n = due - self._due_frames
+        if n <= 0:
+            return
+        self._due_frames = due
+
+        self._send(b"".join(self._frame() for _ in range(n)))
+        self.frames_sent += n
+
+    def _frame(self) -> bytes:
+        raise NotImplementedError
+
+
+class SDM15Simulator(StreamingDevice):
+    """
+    SDM15 answering 0xAA55 commands and sending scan frames
+    """
+
+    def __init__(self, baudrate: int = sdm15.BaudRate.BAUD_460800, freq: sdm15.OutputFreqHex = sdm15.OutputFreqHex.Freq_100Hz):
+        super().__init__(baudrate, SDM15_FREQS[freq])
+        self.intensity = 200
+        self.disturb = 0
+        self.pixhawk = False
+
+    @staticmethod
+    def _packet(cmd: int, data: bytes = b"") -> bytes:
+        packet = bytearray([sdm15.PACKET_HED1, sdm15.PACKET_HED2, cmd, len(data)]) + data
+        packet.append(sum(packet) & 0xFF)
+        return bytes(packet)
+
+    def _frame(self) -> bytes:
+        if self.pixhawk:
+            # pixhawk text is in meters
+            return f"{self.distance_mm / 1000:.2f}\r\n".encode()
+
+        distance = int(self.distance_mm)
+        data = bytes([distance & 0xFF, distance >> 8 & 0xFF, self.intensity, self.disturb])
+        return self._packet(sdm15.START_SCAN, data)
+
+    def _handle(self):
+        rx = self.rx
+
+        while True:
+            start = rx.find(sdm15.PACKET_HEADER)
+            if start < 0:
+                del rx[:-1]
+                return
+            if len(rx) - start < sdm15.PACKET_OVERHEAD:
+                del rx[:start]
+                return
+
+            size = sdm15.PACKET_OVERHEAD + rx[start + 3]
+            if len(rx) - start < size:
+                del rx[:start]
+                return
+
+            packet = bytes(rx[start : start + size])
+            del rx[: start + size]
+            if sum(packet[:-1]) & 0xFF == packet[-1]:
+                self._command(packet[2], packet[4:-1])
+
+    def _command(self, cmd: int, data: bytes):
+        if cmd == sdm15.START_SCAN:
+            self._send(self._packet(cmd))
+            self._start_streaming()
+        elif cmd == sdm15.STOP_SCAN:
+            self.streaming = False
+            self._send(self._packet(cmd))
+        elif cmd == sdm15.GET_DEVICE_INFO:
+            # model, hardware, firmware major, firmware minor, serial number digits
+            self._send(self._packet(cmd, bytes([0x0F, 0x01, 0x01, 0x02, 2, 0, 2, 4, 0, 1, 0, 1])))
+        elif cmd == sdm15.SELF_TEST:
+            self._send(self._packet(cmd, bytes([0x01, 0x00, 0x00, 0x00])))
+        elif cmd == sdm15.SET_OUTPUT_FREQ:
+            self._set_rate(SDM15_FREQS[data[0]])
+            self._send(self._packet(cmd, data))
+        elif cmd == sdm15.SET_FORMAT_OUTPUT_DATA:
+            self.pixhawk = data[0] == sdm15.OutputDataFormatHex.Pixhawk
+            self._send(self._packet(cmd, data))
+        elif cmd in (sdm15.SET_FILTER, sdm15.SET_SERIAL_BAUD, sdm15.RESTORE_FACTORY_SETTINGS):
+            # baud rate has no meaning on a pty
+            self._send(self._packet(cmd, data))
+
+
+class TFMiniPlusSimulator(StreamingDevice):
+    """
+    TFMini-Plus sending 0x59 0x59 data frames and answering 0x5A commands
+    """
+
+    def __init__(self, baudrate: int = 115200, frame_rate: int = 100):
+        super().__init__(baudrate, frame_rate)
+        self.flux = 1000
+        self.temperature = 40.0
+        self.firmware_version = (2, 0, 5)
+        self.mm = False
+        self._start_streaming()
+
+    def _frame(self) -> bytes:
+        distance = int(self.distance_mm if self.mm else self.distance_mm / 10)
+        temp = int((self.temperature + 256) * 8)
+        frame = bytearray([0x59, 0x59])
+        frame += distance.to_bytes(2, "little") + self.flux.to_bytes(2, "little") + temp.to_bytes(2, "little")
+        frame.append(sum(frame) & 0xFF)
+        return bytes(frame)
+
+    @staticmethod
+    def _reply(cmd: int, data: bytes) -> bytes:
+        reply = bytearray([tfluna.COMMAND_HEADER, 4 + len(data), cmd]) + data
+        reply.append(sum(reply) & 0xFF)
+        return bytes(reply)
+
+    def _handle(self):
+        rx = self.rx
+
+        while True:
+            start = rx.find(tfluna.COMMAND_HEADER)
+            if start < 0:
+                del rx[:]
+                return
+            if len(rx) - start < 2:
+                del rx[:start]
+                return
+
+            size = rx[start + 1]
+            if size < 4:
+                del rx[: start + 1]
+                continue
+            if len(rx) - start < size:
+                del rx[:start]
+                return
+
+            packet = bytes(rx[start : start + size])
+            if sum(packet[:-1]) & 0xFF != packet[-1]:
+                del rx[: start + 1]
+                continue
+            del rx[: start + size]
+            self._command(packet)
+
+    def _command(self, packet: bytes):
+        cmd = packet[2]
+        payload = packet[3:-1]
+
+        if cmd == TFMINI_GET_FIRMWARE_VERSION:
+            major, minor, revision = self.firmware_version
+            self._send(self._reply(cmd, bytes([revision, minor, major])))
+        elif cmd in (TFMINI_SOFT_RESET, TFMINI_HARD_RESET, TFMINI_SAVE_SETTINGS):
+            # 0 is pass
+            self._send(self._reply(cmd, b"\x00"))
+        elif cmd == TFMINI_TRIGGER_DETECTION:
+            self._send(self._frame())
+        else:
+            if cmd == TFMINI_SET_FRAME_RATE:
+                self._set_rate(int.from_bytes(payload[:2], "little"))
+            elif cmd == TFMINI_SET_FORMAT:
+                self.mm = payload[0] == TFMINI_FORMAT_MM
+            elif cmd == TFMINI_ENABLE_OUTPUT:
+                if payload[0]:
+                    self._start_streaming()
+                else:
+                    self.streaming = False
+            # everything else, including baud rate, is echoed
+            self._send(packet)
+
+
+class TFLunaSimulator(TFMiniPlusSimulator):
+    """
+    TF-Luna, a TFMini-Plus that also answers the version command
+    """
+
+    def __init__(self, baudrate: int = 115200, frame_rate: int = 100):
+        super().__init__(baudrate, frame_rate)
+        self.version = "TF-Luna v3.3.0"
+
+    def _command(self, packet: bytes):
+        if packet[2] == tfluna.GET_VERSION:
+            text = self.version.encode().ljust(tfluna.VERSION_REPLY_SIZE - 4)
+            self._send(self._reply(tfluna.GET_VERSION, text))
+        else:
+            super()._command(packet)
+
+
+def _stage_step_times(total: int, times: np.ndarray = np.zeros(1), done: int = 0) -> np.ndarray:
+    """seconds after the first pulse of every pulse of a move, like rotatemotor.ino runMotor()
+
+    Args:
+        total (int): pulses of the move
+        times (np.ndarray, optional): pulse times already scheduled. Defaults to the first pulse at 0.
+        done (int, optional): pulses already sent, the times up to the next one are kept. Defaults to 0.
+    """
+    kept = times[: done + 1]
+    # the interval before pulse d is set from the pulses sent and left after pulse d - 1
+    d = np.arange(done + 1, total)
+    min_sq = STAGE_MIN_STEP_RATE**2
+    rates = np.minimum(
+        STAGE_MAX_STEP_RATE,
+        np.sqrt(min_sq + 2 * STAGE_ACCELERATION * np.minimum(d, total - d)),
+    )
+
+    return np.concatenate((kept, kept[-1] + np.cumsum(1 / rates)))
+
+
+class StageSimulator(SimulatedDevice):
+    """
+    rotatemotor.ino stage taking an angle, "R", "S", "T", "P1" or "P0" per line
+
+    Prints "Current Rotation Time: <s> s" every report_interval while
+    rotating and "Total Rotation Time: <s> s" when done. A command received
+    while rotating runs after the move, "S" decelerates to a stop. "P1"
+    turns on a stage.PositionPacket every position_interval, "T" is
+    answered with a stage.PingReply.
+    """
+
+    def __init__(self, baudrate: int = 9600, report_interval: float = 0.1, position_interval: float = 0.04):
+        super().__init__(baudrate)
+        self.report_interval = report_interval
+        self.position_interval = position_interval
+        # pulses since start, positive is DIR_PIN HIGH
+        self.position = 0
+        self.position_streaming = False
+        self._move = None  # (start time, start position, direction, pulse times)
+        self._pending = ""
+        self._next_report = 0.0
+        self._next_position = 0.0
+        self._rx_time = 0.0
+        # micros() counts from here
+        self._boot = time.monotonic()
+
+    @property
+    def moving(self) -> bool:
+        return self._move is not None
+
+    @property
+    def angle(self) -> float:
+        """current angle in degrees"""
+        return self._position(time.monotonic()) * STAGE_DEGREES_PER_PULSE
+
+    def _next_due(self) -> float:
+        due = float("inf")
+        if self._move is not None:
+            due = min(self._next_report, self._move[0] + self._move[3][-1])
+        if self.rx:
+            due = min(due, self._rx_time + STAGE_COMMAND_IDLE)
+        if self.position_streaming:
+            due = min(due, self._next_position)
+        return due
+
+    def _handle(self):
+        self._rx_time = time.monotonic()
+        lines = bytes(self.rx).replace(b"\r", b"\n").split(b"\n")
+        self.rx[:] = lines.pop()
+        for line in lines:
+            self._command(line.decode(errors="ignore").strip())
+
+    def _command(self, text: str):
+        if text == "":
+            return
+
+        if text == "S":
+            self._pending = ""
+            if self._move is not None:
+                self._decelerate(time.monotonic())
+            return
+
+        if text == "T":
+            packet = struct.pack(stage.PING_FORMAT[:-1], bytes([stage.POSITION_HED1, stage.PING_HED2]), self._micros(time.monotonic()))
+            self._send(packet + bytes([sum(packet) & 0xFF]))
+            return
+
+        if text in ("P1", "P0"):
+            self.position_streaming = text == "P1"
+            self._next_position = time.monotonic()
+            return
+
+        if self._move is not None:
+            # the firmware runs the last command received during a move after it
+            self._pending = text
+            return
+
+        if text == "R":
+            direction = 1
+            pulses = STAGE_PULSES_PER_TURN
+        else:
+            try:
+                degrees = int(text)
+            except ValueError:
+                degrees = 0  # String.toInt() returns 0
+            if degrees == 0 or not -360 <= degrees <= 360:
+                return
+            direction = 1 if degrees > 0 else -1
+            pulses = abs(degrees) * 200 // 3
+
+        now = time.monotonic()
+        self._move = (now, self.position, direction, _stage_step_times(pulses))
+        self._next_report = now + self.report_interval
+
+    def _sent(self, now: float) -> int:
+        """pulses sent by now"""
+        start, _, _, times = self._move
+        return int(np.searchsorted(times, now - start, side="right"))
+
+    def _position(self, now: float) -> int:
+        if self._move is None:
+            return self.position
+        _, position, direction, _ = self._move
+        return position + direction * self._sent(now)
+
+    def _decelerate(self, now: float):
+        """shorten the move to the pulses needed to decelerate from the current rate"""
+        start, position, direction, times = self._move
+        done = self._sent(now)
+        if done >= len(times):
+            return
+
+        rate = 1 / (times[done] - times[done - 1]) if done > 0 else STAGE_MIN_STEP_RATE
+        stop_pulses = max(int((rate**2 - STAGE_MIN_STEP_RATE**2) / (2 * STAGE_ACCELERATION)), 1)
+        if len(times) - done > stop_pulses:
+            self._move = (start, position, direction, _stage_step_times(done + stop_pulses, times, done))
+
+    def _finish(self, now: float):
+        start = self._move[0]
+        self.position = self._position(now)
+        self._move = None
+        self._send(f"Total Rotation Time: {now - start:.3f} s\r\n".encode())
+        # the position the stage stopped at is sent right away
+        self._next_position = now
+
+        if self._pending:
+            text, self._pending = self._pending, ""
+            self._command(text)
+
+    def _micros(self, t: float) -> int:
+        """firmware micros() at time.monotonic() value t"""
+        return int((t - self._boot) * 1e6) & 0xFFFFFFFF
+
+    def _send_position(self, now: float):
+        """send the position with the time of the last pulse while rotating"""
+        position = self._position(now)
+        t = now
+        if self._move is not None:
+            sent = self._sent(now)
+            if sent > 0:
+                t = self._move[0] + self._move[3][sent - 1]
+
+        micros = self._micros(t)
+        flags = stage.POSITION_MOVING if self._move is not None else 0
+        packet = struct.pack(stage.POSITION_FORMAT[:-1], stage.POSITION_HEADER, position, micros, flags)
+        self._send(packet + bytes([sum(packet) & 0xFF]))
+
+    def _emit(self, now: float):
+        # the host sends commands without newline
+        if self.rx and now - self._rx_time >= STAGE_COMMAND_IDLE:
+            text = self.rx.decode(errors="ignore").strip()
+            del self.rx[:]
+            self._command(text)
+
+        if self._move is not None:
+            start, _, _, times = self._move
+            if now >= start + times[-1]:
+                self._finish(start + times[-1])
+            elif now >= self._next_report:
+                self._send(f"Current Rotation Time: {now - start:.3f} s\r\n".encode())
+                self._next_report += self.report_interval
+
+        if self.position_streaming and now >= self._next_position:
+            self._send_position(now)
+            self._next_position = now + self.position_interval
+
+
+def start_all(sdm15_freq: sdm15.OutputFreqHex = sdm15.OutputFreqHex.Freq_100Hz, frame_rate: int = 100) -> dict[str, SimulatedDevice]:
+    """start one simulator of every device
+
+    Returns:
+        dict[str, SimulatedDevice]: simulators by device name
+    """
+    devices = {
+        "SDM15": SDM15Simulator(freq=sdm15_freq),
+        "TFMini-Plus": TFMiniPlusSimulator(frame_rate=frame_rate),
+        "TF-Luna": TFLunaSimulator(frame_rate=frame_rate),
+        "stage": StageSimulator(),
+    }
+    for device in devices.values():
+        device.start()
+
+    return devices
+
+
+if __name__ == "__main__":
+    devices = start_all()
+    for name, device in devices.items():
+        print(f"{name}: {device.port}")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("Stopping simulators")
+    finally:
+        for device in devices.values():
+            device.close()
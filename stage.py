@@ -0,0 +1,569 @@
+import queue
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Union
+
+import numpy as np
+import serial
+
+from timesync import ClockFit, transfer_time
+
+# rotatemotor.ino: 200 pulses turn the stage 3 degrees
+DEGREES_PER_PULSE = 3 / 200
+PULSES_PER_TURN = 120 * 200
+
+POSITION_HED1 = 0xA5
+POSITION_HED2 = 0x5A
+POSITION_HEADER = bytes([POSITION_HED1, POSITION_HED2])
+# header(2) + position(i4) + pulse time in us(u4) + flags(1) + checksum(1)
+POSITION_FORMAT = "<2siIBB"
+POSITION_PACKET_SIZE = struct.calcsize(POSITION_FORMAT)
+POSITION_MOVING = 0x01
+
+# reply to PING: header(2) + micros() when the command was received(u4) + checksum(1)
+PING_HED2 = 0x5B
+PING_FORMAT = "<2sIB"
+PING_PACKET_SIZE = struct.calcsize(PING_FORMAT)
+PING = b"T\n"
+
+# commands turning the position packets on and off
+POSITION_ON = b"P1\n"
+POSITION_OFF = b"P0\n"
+
+# text that never terminates is dropped past this size
+MAX_PENDING_TEXT = 4096
+
+# printed by the firmware when a move ended
+TOTAL_ROTATION_TIME = "Total Rotation Time:"
+# serial read timeout of the reader thread, also how long closing may take
+READ_INTERVAL = 0.1
+
+
+class StageClosedError(Exception):
+    pass
+
+
+@dataclass
+class PositionPacket:
+    position: int  # pulses since power on, positive is DIR_PIN HIGH
+    micros: int  # firmware micros() when the stage reached position
+    moving: bool
+
+
+@dataclass
+class PingReply:
+    micros: int  # firmware micros() when the ping was received
+
+
+class StageParser(object):
+    """
+    incremental parser for the stage output, position packets and ping replies mixed with text lines
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.checksum_errors = 0
+
+    def feed(self, data: bytes):
+        """append received bytes to the buffer
+
+        Args:
+            data (bytes): bytes received from serial port
+        """
+        self.buffer += data
+
+    def parse(self) -> list[Union[PositionPacket, PingReply, str]]:
+        """parse every complete packet and line in the buffer. Incomplete ones are kept for the next call
+
+        Returns:
+            list[Union[PositionPacket, PingReply, str]]: packets and lines without newline in received order
+        """
+        items = []
+        buf = self.buffer
+        end = len(buf)
+        pos = 0
+
+        while pos < end:
+            # text is ascii, so the first header byte only starts packets
+            start = buf.find(POSITION_HED1, pos)
+
+            if start != pos:
+                # bytes before the next header are text lines
+                newline = buf.find(b"\n", pos, end if start < 0 else start)
+                if newline >= 0:
+                    line = buf[pos:newline].decode("utf-8", errors="ignore").strip()
+                    if line:
+                        items.append(line)
+                    pos = newline + 1
+                    continue
+
+                if start < 0:
+                    # wait for the rest of the line or the header
+                    if end - pos > MAX_PENDING_TEXT:
+                        pos = end - 1
+                    break
+
+                # a line cut by a packet
+                pos = start
+
+            # wait for the packet type
+            if end - pos < 2:
+                break
+
+            size = {POSITION_HED2: POSITION_PACKET_SIZE, PING_HED2: PING_PACKET_SIZE}.get(buf[pos + 1])
+            if size is None:
+                self.checksum_errors += 1
+                pos += 1
+                continue
+
+            # wait for the rest of the packet
+            if end - pos < size:
+                break
+
+            if sum(buf[pos : pos + size - 1]) & 0xFF != buf[pos + size - 1]:
+                # resync on the next header
+                self.checksum_errors += 1
+                pos += 1
+                continue
+
+            if size == POSITION_PACKET_SIZE:
+                _, position, micros, flags, _ = struct.unpack_from(POSITION_FORMAT, buf, pos)
+                items.append(PositionPacket(position=position, micros=micros, moving=bool(flags & POSITION_MOVING)))
+            else:
+                _, micros, _ = struct.unpack_from(PING_FORMAT, buf, pos)
+                items.append(PingReply(micros=micros))
+            pos += size
+
+        del buf[:pos]
+
+        return items
+
+
+class PositionTrack(object):
+    """
+    stage positions on the time.monotonic() clock, for tagging samples with angles
+
+    The firmware clock is mapped to the host clock with `clock` once
+    Stage.sync() fitted it. Before that, the smallest delay between a
+    packet time and its arrival over the last `window` packets is used,
+    which follows the drift of the Arduino clock.
+    """
+
+    def __init__(self, window: int = 64, baudrate: int = 9600):
+        """
+        Args:
+            window (int, optional): packets the clock offset is estimated over. Defaults to 64.
+            baudrate (int, optional): stage baud rate, to remove the packet transfer time. Defaults to 9600.
+        """
+        self.window = window
+        self.transfer_time = transfer_time(POSITION_PACKET_SIZE, baudrate)
+        self.clock = ClockFit()
+        self.times = np.empty(1024)
+        self.positions = np.empty(1024)
+        self.count = 0
+        self._offsets = np.empty(window)
+        self._wraps = 0
+        self._last_micros = None
+        self._lock = threading.Lock()
+
+    def add(self, packet: PositionPacket, arrival: float):
+        """add a packet
+
+        Args:
+            packet (PositionPacket): received packet
+            arrival (float): time.monotonic() value the packet was received at
+        """
+        device_time = self.device_time(packet.micros)
+
+        with self._lock:
+            n = self.count
+            self._offsets[n % self.window] = arrival - self.transfer_time - device_time
+            offset = self._offsets[: min(n + 1, self.window)].min()
+
+            if n == len(self.times):
+                self.times = np.resize(self.times, 2 * n)
+                self.positions = np.resize(self.positions, 2 * n)
+            self.times[n] = self.clock.to_host(device_time) if self.clock.ready else device_time + offset
+            self.positions[n] = packet.position
+            self.count = n + 1
+
+    def device_time(self, micros: int) -> float:
+        """firmware micros() in seconds, counting the times it wrapped around
+
+        Args:
+            micros (int): micros() value from a packet, in received order
+
+        Returns:
+            float: seconds since the firmware started
+        """
+        # micros() wraps every 71 minutes. Called from the reader thread and from ping()
+        with self._lock:
+            if self._last_micros is not None and micros < self._last_micros - (1 << 31):
+                self._wraps += 1
+            self._last_micros = micros
+            wraps = self._wraps
+
+        return ((wraps << 32) + micros) / 1e6
+
+    @property
+    def angle(self) -> float:
+        """last received angle in degrees. nan before the first packet"""
+        with self._lock:
+            return self.positions[self.count - 1] * DEGREES_PER_PULSE if self.count else float("nan")
+
+    def angle_at(self, t: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """angle at time.monotonic() values, such as the timestamp field of a sensor batch
+
+        Angles between packets are interpolated linearly, times outside the
+        received packets get the first or last angle.
+
+        Args:
+            t (Union[float, np.ndarray]): time.monotonic() values
+
+        Returns:
+            Union[float, np.ndarray]: angles in degrees. nan before the first packet
+        """
+        with self._lock:
+            times = self.times[: self.count].copy()
+            positions = self.positions[: self.count].copy()
+
+        if len(times) == 0:
+            return np.full(np.shape(t), np.nan) if np.ndim(t) else float("nan")
+
+        # equal times can come from packets sent while stopped before the offset settled
+        return np.interp(t, np.maximum.accumulate(times), positions) * DEGREES_PER_PULSE
+
+
+class PositionStream(object):
+    """
+    reader thread turning on the stage position packets and filling a PositionTrack
+    """
+
+    def __init__(
+        self,
+        ser: serial.Serial,
+        on_line: Union[Callable[[str], None], None] = None,
+        on_packet: Union[Callable[[Union[PositionPacket, PingReply], float], None], None] = None,
+        window: int = 64,
+    ):
+        """
+        Args:
+            ser (serial.Serial): opened stage serial port, read with a timeout
+            on_line (Union[Callable[[str], None], None], optional): called from the reader thread with every text line. Defaults to None.
+            on_packet (Union[Callable[[Union[PositionPacket, PingReply], float], None], None], optional): called from the reader thread with every packet and its arrival time, after positions were added to track. Defaults to None.
+            window (int, optional): packets the clock offset is estimated over. Defaults to 64.
+        """
+        self.ser = ser
+        self.on_line = on_line
+        self.on_packet = on_packet
+        self.parser = StageParser()
+        self.track = PositionTrack(window, ser.baudrate)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """turn on the position packets and start the reader thread"""
+        self._stop.clear()
+        self.ser.write(POSITION_ON)
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """turn off the position packets and stop the reader thread. The port is left open"""
+        if self._thread is not None:
+            self.ser.write(POSITION_OFF)
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            recv = self.ser.read(max(1, self.ser.in_waiting))
+            if not recv:
+                continue
+
+            # a chunk is read right after its last byte, which is close enough at 9600 bps
+            arrival = time.monotonic()
+            self.parser.feed(recv)
+            for item in self.parser.parse():
+                if isinstance(item, str):
+                    if self.on_line is not None:
+                        self.on_line(item)
+                    continue
+
+                if isinstance(item, PositionPacket):
+                    self.track.add(item, arrival)
+                if self.on_packet is not None:
+                    self.on_packet(item, arrival)
+
+
+class Stage(object):
+    """
+    non-blocking controller for the rotatemotor.ino stage
+
+    Moves are queued on the host and sent one at a time, each when the
+    previous one ended, so any number of moves can be scripted back to
+    back. Every move returns a concurrent.futures.Future resolved with
+    the firmware's total rotation time once the stage stopped. Await it
+    from asyncio with asyncio.wrap_future().
+    """
+
+    def __init__(self, port: Union[str, serial.Serial], baudrate: int = 9600, startup_delay: float = 2.0):
+        """open the stage and start reading it
+
+        Args:
+            port (Union[str, serial.Serial]): serial port name, or an opened serial-port-like object
+            baudrate (int, optional): baud rate. Defaults to 9600.
+            startup_delay (float, optional): seconds the Arduino needs after a port name is opened. Defaults to 2.0.
+        """
+        if isinstance(port, str):
+            self.ser = serial.Serial(port, baudrate, timeout=READ_INTERVAL)
+            # opening the port resets the Arduino
+            time.sleep(startup_delay)
+        else:
+            self.ser = port
+            self.ser.timeout = READ_INTERVAL
+
+        # pulses since power on, from the last packet sent at a stop
+        self.position = 0
+        self._queue = deque()  # (command, value, future) not sent yet
+        self._current = None  # (future, expected position) of the move sent to the stage
+        self._total_time = None  # set by "Total Rotation Time" until the stopped position arrives
+        self._packets = False
+        self._subscribers = []
+        self._ping_reply = None  # (arrival, micros)
+        self._ping_received = threading.Event()
+        self._ping_lock = threading.Lock()
+        # future callbacks run with it held and may queue the next move
+        self._lock = threading.RLock()
+
+        self.stream = PositionStream(self.ser, on_line=self._on_line, on_packet=self._on_packet)
+        self.stream.start()
+
+    @property
+    def track(self) -> PositionTrack:
+        """positions received from the stage, for angle_at()"""
+        return self.stream.track
+
+    @property
+    def clock(self) -> ClockFit:
+        """map from the firmware clock to time.monotonic(), fitted by sync()"""
+        return self.track.clock
+
+    @property
+    def angle(self) -> float:
+        """last received angle in degrees"""
+        angle = self.track.angle
+        return self.position * DEGREES_PER_PULSE if np.isnan(angle) else angle
+
+    @property
+    def moving(self) -> bool:
+        """whether a move is running or queued"""
+        with self._lock:
+            return self._current is not None or len(self._queue) > 0
+
+    def move_to(self, angle: float) -> Future:
+        """queue a move to an absolute angle, rounded to the nearest degree of travel
+
+        Args:
+            angle (float): target angle in degrees from the power on position
+
+        Returns:
+            Future: resolved with the rotation time in seconds, or with ValueError if the move is over 360 degrees
+        """
+        return self._enqueue("to", angle)
+
+    def move_by(self, degrees: int) -> Future:
+        """queue a relative move
+
+        Args:
+            degrees (int): -360 to 360 degrees, positive is DIR_PIN HIGH
+
+        Raises:
+            ValueError: degrees out of range
+
+        Returns:
+            Future: resolved with the rotation time in seconds
+        """
+        if not -360 <= degrees <= 360:
+            raise ValueError(f"degrees must be between -360 and 360, got {degrees}")
+        return self._enqueue("by", int(degrees))
+
+    def rotate(self) -> Future:
+        """queue one full turn
+
+        Returns:
+            Future: resolved with the rotation time in seconds
+        """
+        return self._enqueue("R", 360)
+
+    def stop(self) -> Future:
+        """cancel the queued moves and decelerate the running one to a stop
+
+        Returns:
+            Future: resolved when the stage stopped
+        """
+        with self._lock:
+            while self._queue:
+                self._queue.popleft()[2].cancel()
+
+            if self._current is None:
+                future = Future()
+                future.set_result(0.0)
+                return future
+
+            self.ser.write(b"S\n")
+            return self._current[0]
+
+    def ping(self, timeout: float = 0.2) -> Union[tuple[float, float, float], None]:
+        """measure the firmware clock with one round trip
+
+        Args:
+            timeout (float, optional): seconds to wait for the reply. Defaults to 0.2.
+
+        Returns:
+            Union[tuple[float, float, float], None]: firmware seconds, time.monotonic() value at that time
+            and its error bound. None if the firmware did not answer
+        """
+        with self._ping_lock:
+            self._ping_received.clear()
+            with self._lock:
+                sent = time.monotonic()
+                self.ser.write(PING)
+
+            if not self._ping_received.wait(timeout):
+                return None
+            arrival, micros = self._ping_reply
+
+        # the firmware stamps the ping when its newline arrives and answers at once,
+        # the serial latency is assumed to be the same both ways
+        up = transfer_time(len(PING), self.ser.baudrate)
+        down = transfer_time(PING_PACKET_SIZE, self.ser.baudrate)
+        host_time = (sent + up + arrival - down) / 2
+        error = max((arrival - sent - up - down) / 2, 0.0)
+
+        return self.track.device_time(micros), host_time, error
+
+    def sync(self, pings: int = 16, interval: float = 0.1) -> ClockFit:
+        """fit the firmware clock with round trip pings
+
+        Later position packets are placed on the host clock with the fit.
+        The drift is only fitted once the pings span timesync.MIN_SLOPE_SPAN,
+        which the defaults do. Calling it again adds pairs to the fit, which
+        then follows the drift more closely.
+
+        Args:
+            pings (int, optional): number of pings. Defaults to 16.
+            interval (float, optional): seconds between pings. Defaults to 0.1.
+
+        Returns:
+            ClockFit: updated clock, not ready if the firmware does not answer pings
+        """
+        for _ in range(pings):
+            result = self.ping()
+            if result is None:
+                break
+            self.clock.add(*result)
+            time.sleep(interval)
+
+        return self.clock
+
+    def subscribe(self) -> queue.Queue:
+        """receive every text line from the stage
+
+        Returns:
+            queue.Queue: gets (time.monotonic() value, line) for every line received from now on
+        """
+        messages = queue.Queue()
+        with self._lock:
+            self._subscribers.append(messages)
+        return messages
+
+    def unsubscribe(self, messages: queue.Queue):
+        with self._lock:
+            if messages in self._subscribers:
+                self._subscribers.remove(messages)
+
+    def close(self):
+        """cancel the queued moves, stop reading and close the serial port"""
+        with self._lock:
+            while self._queue:
+                self._queue.popleft()[2].cancel()
+            if self._current is not None:
+                self._current[0].set_exception(StageClosedError("stage closed before the move ended"))
+                self._current = None
+        self.stream.close()
+        self.ser.close()
+
+    def _enqueue(self, command: str, value: float) -> Future:
+        future = Future()
+        with self._lock:
+            self._queue.append((command, value, future))
+            if self._current is None:
+                self._send_next()
+        return future
+
+    def _send_next(self):
+        """send the next queued move. Called with the lock held"""
+        while self._queue and self._current is None:
+            command, value, future = self._queue.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            if command == "R":
+                text = "R"
+                pulses = PULSES_PER_TURN
+            else:
+                degrees = value if command == "by" else round(value - self.position * DEGREES_PER_PULSE)
+                if abs(degrees) > 360:
+                    future.set_exception(ValueError(f"move of {degrees} degrees is over 360"))
+                    continue
+                if degrees == 0:
+                    future.set_result(0.0)
+                    continue
+                text = str(degrees)
+                # same integer math as the firmware
+                pulses = abs(degrees) * 200 // 3 * (1 if degrees > 0 else -1)
+
+            self._current = (future, self.position + pulses)
+            self._total_time = None
+            self.ser.write(f"{text}\n".encode())
+
+    def _finish(self, position: int):
+        """resolve the current move. Called with the lock held"""
+        future, _ = self._current
+        self.position = position
+        self._current = None
+        future.set_result(self._total_time)
+        self._send_next()
+
+    def _on_line(self, line: str):
+        arrival = time.monotonic()
+        with self._lock:
+            for messages in self._subscribers:
+                messages.put((arrival, line))
+
+            if self._current is None or not line.startswith(TOTAL_ROTATION_TIME):
+                return
+
+            self._total_time = float(line[len(TOTAL_ROTATION_TIME) :].split()[0])
+            if not self._packets:
+                # firmware without position packets, assume the move completed
+                self._finish(self._current[1])
+
+    def _on_packet(self, packet: Union[PositionPacket, PingReply], arrival: float):
+        if isinstance(packet, PingReply):
+            self._ping_reply = (arrival, packet.micros)
+            self._ping_received.set()
+            return
+
+        with self._lock:
+            self._packets = True
+            if self._current is None:
+                self.position = packet.position
+            elif self._total_time is not None and not packet.moving:
+                self._finish(packet.position)
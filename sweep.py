@@ -0,0 +1,236 @@
+import argparse
+import threading
+from typing import Iterator, Union
+
+import numpy as np
+
+import capture
+import rangesensor
+from stage import Stage
+from timesync import StreamClock, transfer_time
+
+# one range sample placed in the plane of the stage
+POINT_DTYPE = np.dtype(
+    [
+        ("timestamp", "<f8"),  # time.monotonic() seconds
+        ("revolution", "<u4"),  # 0 for the first turn of the sweep
+        ("angle_deg", "<f4"),  # stage angle in the revolution, 0 to 360
+        ("distance_mm", "<f4"),  # nan if status is not STATUS_OK
+        ("strength", "<u2"),
+        ("status", "u1"),
+        ("x_mm", "<f4"),
+        ("y_mm", "<f4"),
+    ]
+)
+
+# mean range of every angle bin of one revolution
+BIN_DTYPE = np.dtype(
+    [
+        ("angle_deg", "<f4"),  # center of the bin
+        ("distance_mm", "<f4"),  # nan if the bin has no valid sample
+        ("count", "<u4"),  # valid samples in the bin
+        ("x_mm", "<f4"),
+        ("y_mm", "<f4"),
+    ]
+)
+
+# sensor read timeout of the collector thread, also how long stopping may take
+READ_TIMEOUT = 0.1
+
+
+def to_points(samples: np.ndarray, angles: np.ndarray, start_angle: float = 0.0) -> np.ndarray:
+    """place SAMPLE_DTYPE samples in the plane from the stage angle they were measured at
+
+    Args:
+        samples (np.ndarray): SAMPLE_DTYPE samples
+        angles (np.ndarray): stage angle in degrees of every sample, such as PositionTrack.angle_at(samples["timestamp"])
+        start_angle (float, optional): stage angle of revolution 0 at 0 degrees. Defaults to 0.0.
+
+    Returns:
+        np.ndarray: POINT_DTYPE points
+    """
+    turns = (np.asarray(angles, dtype=np.float64) - start_angle) / 360.0
+    revolution = np.floor(turns)
+    angle_deg = (turns - revolution) * 360.0
+    theta = np.radians(angle_deg)
+
+    points = np.empty(len(samples), dtype=POINT_DTYPE)
+    points["timestamp"] = samples["timestamp"]
+    points["revolution"] = np.maximum(revolution, 0)
+    points["angle_deg"] = angle_deg
+    points["distance_mm"] = samples["distance_mm"]
+    points["strength"] = samples["strength"]
+    points["status"] = samples["status"]
+    points["x_mm"] = samples["distance_mm"] * np.cos(theta)
+    points["y_mm"] = samples["distance_mm"] * np.sin(theta)
+
+    return points
+
+
+def bin_revolution(points: np.ndarray, bin_deg: float = 1.0) -> np.ndarray:
+    """average the valid points of one revolution per angle bin
+
+    Args:
+        points (np.ndarray): POINT_DTYPE points of one revolution
+        bin_deg (float, optional): bin width in degrees. Defaults to 1.0.
+
+    Returns:
+        np.ndarray: BIN_DTYPE bins starting at 0 degrees
+    """
+    n_bins = int(np.ceil(360.0 / bin_deg))
+    valid = (points["status"] == rangesensor.STATUS_OK) & np.isfinite(points["distance_mm"])
+    index = np.minimum((points["angle_deg"][valid] / bin_deg).astype(np.intp), n_bins - 1)
+
+    counts = np.bincount(index, minlength=n_bins)
+    sums = np.bincount(index, weights=points["distance_mm"][valid], minlength=n_bins)
+
+    bins = np.empty(n_bins, dtype=BIN_DTYPE)
+    bins["angle_deg"] = (np.arange(n_bins) + 0.5) * bin_deg
+    bins["count"] = counts
+    with np.errstate(invalid="ignore", divide="ignore"):
+        bins["distance_mm"] = sums / counts
+    theta = np.radians(bins["angle_deg"])
+    bins["x_mm"] = bins["distance_mm"] * np.cos(theta)
+    bins["y_mm"] = bins["distance_mm"] * np.sin(theta)
+
+    return bins
+
+
+class Sweep(object):
+    """
+    turns the stage and places every range sample of each revolution in the plane
+
+    A collector thread reads the sensor while the stage turns. Samples are
+    tagged with the stage angle interpolated from the position packets at
+    their timestamps, so the stage never waits for the sensor. The stage
+    clock is synced before turning, and a StreamClock moves sample
+    timestamps from when a chunk was read to when each frame was measured.
+    """
+
+    def __init__(
+        self,
+        sensor: rangesensor.RangeSensor,
+        stage: Stage,
+        path: Union[str, None] = None,
+        stream_clock: Union[StreamClock, None] = None,
+    ):
+        """
+        Args:
+            sensor (rangesensor.RangeSensor): range sensor on the stage
+            stage (Stage): opened stage
+            path (Union[str, None], optional): capture file getting every POINT_DTYPE point. Defaults to None.
+            stream_clock (Union[StreamClock, None], optional): corrects the sample timestamps of a streaming sensor. Defaults to None.
+        """
+        self.sensor = sensor
+        self.stage = stage
+        self.path = path
+        self.stream_clock = stream_clock
+        self._batches = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _collect(self):
+        """collector thread: keep every sensor batch"""
+        while not self._stop.is_set():
+            batch = self.sensor.read(READ_TIMEOUT)
+            if len(batch):
+                if self.stream_clock is not None:
+                    batch["timestamp"] = self.stream_clock.correct(batch["timestamp"])
+                with self._lock:
+                    self._batches.append(batch)
+
+    def _take(self) -> np.ndarray:
+        """every sample collected since the last call"""
+        with self._lock:
+            batches, self._batches = self._batches, []
+
+        return np.concatenate(batches) if batches else rangesensor.empty_batch()
+
+    def revolutions(self, n: int = 1, timeout: Union[float, None] = None) -> Iterator[np.ndarray]:
+        """turn the stage n times and yield the points of every revolution once it is done
+
+        Args:
+            n (int, optional): revolutions. Defaults to 1.
+            timeout (Union[float, None], optional): seconds to wait for each revolution. Defaults to None.
+
+        Yields:
+            np.ndarray: POINT_DTYPE points of one revolution
+        """
+        writer = None
+        if self.path is not None:
+            metadata = {"sensor": self.sensor.name, "revolutions": n}
+            writer = capture.CaptureWriter(self.path, POINT_DTYPE, metadata)
+
+        self.stage.sync()
+        self._stop.clear()
+        collector = threading.Thread(target=self._collect, daemon=True)
+        collector.start()
+
+        start_angle = self.stage.angle
+        futures = [self.stage.rotate() for _ in range(n)]
+        track = self.stage.track
+        pending = np.empty(0, dtype=POINT_DTYPE)
+
+        try:
+            for k, future in enumerate(futures):
+                future.result(timeout)
+
+                samples = self._take()
+                points = np.concatenate((pending, to_points(samples, track.angle_at(samples["timestamp"]), start_angle)))
+
+                # samples after the end of this revolution go to the next one
+                done = points["revolution"] <= k
+                if k == n - 1:
+                    done[:] = True
+                    points["revolution"] = np.minimum(points["revolution"], k)
+
+                revolution, pending = points[done], points[~done]
+                if writer is not None:
+                    writer.write(revolution)
+                yield revolution
+        finally:
+            self._stop.set()
+            collector.join()
+            self.stage.stop()
+            if writer is not None:
+                writer.close()
+
+    def run(self, n: int = 1, timeout: Union[float, None] = None) -> list[np.ndarray]:
+        """turn the stage n times
+
+        Returns:
+            list[np.ndarray]: POINT_DTYPE points of every revolution
+        """
+        return list(self.revolutions(n, timeout))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="turn the stage and save every range sample as a point in the plane")
+    parser.add_argument("--sensor", choices=list(rangesensor.SENSORS), default="SDM15")
+    parser.add_argument("--port", default="COM3", help="sensor serial port")
+    parser.add_argument("--stage-port", default="COM6", help="stage serial port")
+    parser.add_argument("--revolutions", type=int, default=1)
+    parser.add_argument("--bin", type=float, default=1.0, help="bin width in degrees for the summary")
+    parser.add_argument("--output", default="sweep.tofcap", help="capture file of every point")
+    parser.add_argument("--simulate", action="store_true", help="use simulator.py devices instead of ports, Linux only")
+    args = parser.parse_args()
+
+    if args.simulate:
+        import simulator
+
+        devices = simulator.start_all()
+        args.port = devices[args.sensor].port
+        args.stage_port = devices["stage"].port
+
+    sensor = rangesensor.open_sensor(args.sensor, args.port)
+    stage = Stage(args.stage_port, startup_delay=0.0 if args.simulate else 2.0)
+    stream_clock = StreamClock(transfer_time(*rangesensor.SENSORS[args.sensor]))
+    try:
+        for k, points in enumerate(Sweep(sensor, stage, args.output, stream_clock).revolutions(args.revolutions)):
+            bins = bin_revolution(points, args.bin)
+            covered = np.count_nonzero(bins["count"])
+            mean = np.nanmean(bins["distance_mm"]) if covered else float("nan")
+            print(f"revolution {k}: {len(points)} points, {covered}/{len(bins)} bins, mean {mean:.1f} mm")
+    finally:
+        stage.close()
+        sensor.close()
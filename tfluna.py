@@ -0,0 +1,304 @@
+import time
+from collections import deque
+from typing import Union
+
+import numpy as np
+import serial
+
+import batchdecode
+import metrics
+
+BAUD_RATES = [9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600]
+
+# serial port timeout, set once as pyserial reconfigures the port on every
+# assignment. A blocking read overruns its deadline by at most this
+READ_POLL = 0.02
+
+# command format: 0x5A, length, id, payload, checksum
+COMMAND_HEADER = 0x5A
+SET_SAMP_RATE = 0x03
+SET_BAUDRATE = 0x06
+GET_VERSION = 0x14
+
+# decoded frames kept for read_tfluna_data(), older ones are dropped when a
+# caller reads slower than the TF-Luna sends
+MAX_PENDING = 1024
+
+# reply sizes
+SAMP_RATE_REPLY_SIZE = 6
+BAUDRATE_REPLY_SIZE = 8
+VERSION_REPLY_SIZE = 30
+
+
+class TFLunaTimeoutError(Exception):
+    pass
+
+
+class TFLuna(object):
+    """
+    class for TF-Luna serial communication
+    """
+
+    def __init__(self, port: Union[str, serial.Serial], baudrate: int = 115200, timeout: float = 1.0):
+        """setup serial port
+
+        Args:
+            port (Union[str, serial.Serial]): serial port name, or an opened serial-like object such as replay.ReplaySerial
+            baudrate (int, optional): baud rate the TF-Luna is currently set to. Defaults to 115200.
+            timeout (float, optional): seconds to wait for data or a reply. Defaults to 1.0.
+        """
+        if isinstance(port, str):
+            self.ser = serial.Serial(port, baudrate, timeout=READ_POLL)
+        else:
+            self.ser = port
+            self.ser.timeout = READ_POLL
+
+        # check serial port is opened
+        if not self.ser.is_open:
+            self.ser.open()
+
+        self.timeout = timeout
+        # received bytes not decoded yet
+        self.buffer = bytearray()
+        # decoded (distance, strength, temperature) not returned yet
+        self.pending = deque(maxlen=MAX_PENDING)
+        # metrics.DriverMetrics, None until enable_metrics() is called
+        self.metrics = None
+
+    def close(self):
+        """close serial port"""
+        self.disable_metrics()
+        self.ser.close()
+
+    def enable_metrics(self, name: str = "TF-Luna") -> metrics.DriverMetrics:
+        """count bytes, frames and errors and time every read stage
+
+        Args:
+            name (str, optional): name in metrics.snapshot() and the prometheus endpoint. Defaults to "TF-Luna".
+
+        Returns:
+            metrics.DriverMetrics: metrics of this TF-Luna
+        """
+        if self.metrics is None:
+            self.metrics = metrics.register(name)
+
+        return self.metrics
+
+    def disable_metrics(self):
+        """stop counting and remove the metrics from metrics.REGISTRY"""
+        if self.metrics is not None:
+            metrics.unregister(self.metrics)
+            self.metrics = None
+
+    def _receive(self, deadline: float) -> bool:
+        """append received bytes to the buffer, blocking until deadline for the first one
+
+        Returns:
+            bool: False if nothing was received before deadline
+        """
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+
+        if self.metrics is None:
+            recv = self.ser.read(max(1, self.ser.in_waiting))
+            while len(recv) == 0 and time.monotonic() < deadline:
+                recv = self.ser.read(1)
+            self.buffer += recv
+
+            return len(recv) > 0
+
+        t0 = time.perf_counter()
+        waiting = self.ser.in_waiting
+        recv = self.ser.read(max(1, waiting))
+        while len(recv) == 0 and time.monotonic() < deadline:
+            recv = self.ser.read(1)
+        self.buffer += recv
+
+        # blocked only if nothing was waiting
+        self.metrics.observe("read" if waiting > 0 else "wait", time.perf_counter() - t0)
+        self.metrics.add("reads")
+        self.metrics.add("bytes_read", len(recv))
+
+        return len(recv) > 0
+
+    def _decode(self) -> np.ndarray:
+        """decode every complete data frame in the buffer, keeping a trailing partial frame"""
+        if self.metrics is None:
+            samples, consumed = batchdecode.decode_tfluna(self.buffer)
+            del self.buffer[:consumed]
+
+            return samples
+
+        t0 = time.perf_counter()
+        samples, consumed = batchdecode.decode_tfluna(self.buffer, self.metrics)
+        del self.buffer[:consumed]
+        self.metrics.observe("parse", time.perf_counter() - t0)
+        self.metrics.add("frames", len(samples))
+
+        return samples
+
+    def read_tfluna_data(self) -> tuple[int, int, float]:
+        """read the next data frame in received order
+
+        Frames older than the last MAX_PENDING are dropped, use read_latest()
+        to show the current distance at a lower rate than the TF-Luna sends.
+
+        Raises:
+            TFLunaTimeoutError: no data frame received in timeout
+
+        Returns:
+            tuple[int, int, float]: distance (cm), signal strength and temperature (°C)
+        """
+        deadline = time.monotonic() + self.timeout
+
+        while len(self.pending) == 0:
+            samples = self._decode()
+            if len(samples) == 0 and not self._receive(deadline):
+                if self.metrics is not None:
+                    self.metrics.add("timeouts")
+                raise TFLunaTimeoutError("no data received from TF-Luna")
+            self.pending.extend(samples.tolist())
+
+        return self.pending.popleft()
+
+    def read_latest(self) -> tuple[int, int, float]:
+        """read the newest data frame and drop the older ones, like TFMiniPlus.getData()
+
+        Raises:
+            TFLunaTimeoutError: no data frame received in timeout
+
+        Returns:
+            tuple[int, int, float]: distance (cm), signal strength and temperature (°C)
+        """
+        samples = self.read_frames()
+        if len(samples) == 0:
+            first = self.read_tfluna_data()
+            # the blocking read may have decoded a whole burst
+            samples = self.read_frames()
+            if len(samples) == 0:
+                return first
+
+        return tuple(samples[-1].tolist())
+
+    def read_frames(self) -> np.ndarray:
+        """read every data frame received since the last call without waiting
+
+        Returns:
+            np.ndarray: batchdecode.TFMINI_DTYPE samples. Distance in cm, temperature in °C
+        """
+        waiting = self.ser.in_waiting
+        if waiting > 0:
+            t0 = time.perf_counter()
+            self.buffer += self.ser.read(waiting)
+            if self.metrics is not None:
+                self.metrics.observe("read", time.perf_counter() - t0)
+                self.metrics.add("reads")
+                self.metrics.add("bytes_read", waiting)
+
+        samples = self._decode()
+
+        # frames already decoded by read_tfluna_data come first
+        if len(self.pending) > 0:
+            pending = np.array(list(self.pending), dtype=batchdecode.TFMINI_DTYPE)
+            self.pending.clear()
+            samples = np.concatenate([pending, samples])
+
+        return samples
+
+    def _command(self, cmd: int, payload: bytes, reply_size: int) -> Union[bytes, None]:
+        """send a command and wait for its reply
+
+        Returns:
+            Union[bytes, None]: reply. None if no reply with a valid checksum was received in timeout
+        """
+        packet = bytearray([COMMAND_HEADER, 4 + len(payload), cmd]) + payload
+        packet.append(sum(packet) & 0xFF)
+
+        self.ser.reset_input_buffer()
+        del self.buffer[:]
+        self.pending.clear()
+        self.ser.write(packet)
+
+        return self._wait_reply(cmd, reply_size)
+
+    def _wait_reply(self, cmd: int, reply_size: int) -> Union[bytes, None]:
+        """wait for the reply to cmd
+
+        Returns:
+            Union[bytes, None]: reply. None if no reply with a valid checksum was received in timeout
+        """
+        deadline = time.monotonic() + self.timeout
+        header = bytes([COMMAND_HEADER, reply_size, cmd])
+
+        while True:
+            start = self.buffer.find(header)
+            while start >= 0 and len(self.buffer) - start >= reply_size:
+                reply = bytes(self.buffer[start : start + reply_size])
+                if sum(reply[:-1]) & 0xFF == reply[-1]:
+                    # data frames after the reply stay buffered
+                    del self.buffer[: start + reply_size]
+                    return reply
+                if self.metrics is not None:
+                    self.metrics.add("checksum_errors")
+                start = self.buffer.find(header, start + 1)
+
+            if not self._receive(deadline):
+                if self.metrics is not None:
+                    self.metrics.add("timeouts")
+                return None
+
+    def set_samp_rate(self, samp_rate: int = 100) -> bool:
+        """change the sample rate
+
+        Args:
+            samp_rate (int, optional): samples per second, 1-250. Defaults to 100.
+
+        Returns:
+            bool: True if the TF-Luna confirmed the sample rate
+        """
+        reply = self._command(SET_SAMP_RATE, samp_rate.to_bytes(2, "little"), SAMP_RATE_REPLY_SIZE)
+
+        return reply is not None and int.from_bytes(reply[3:5], "little") == samp_rate
+
+    def get_version(self) -> str:
+        """get version info
+
+        Raises:
+            TFLunaTimeoutError: no version reply
+
+        Returns:
+            str: version
+        """
+        reply = self._command(GET_VERSION, b"", VERSION_REPLY_SIZE)
+
+        if reply is None:
+            raise TFLunaTimeoutError("no version reply from TF-Luna")
+
+        return reply[3:-1].decode("utf-8", errors="ignore")
+
+    def set_baudrate(self, baudrate: int = 115200) -> bool:
+        """change the TF-Luna baud rate and switch the serial port to it
+
+        Args:
+            baudrate (int, optional): one of BAUD_RATES. Defaults to 115200.
+
+        Returns:
+            bool: True if the TF-Luna confirmed the baud rate at the new speed
+        """
+        if baudrate not in BAUD_RATES:
+            raise ValueError(f"baud rate must be one of {BAUD_RATES}")
+
+        packet = bytearray([COMMAND_HEADER, 8, SET_BAUDRATE]) + baudrate.to_bytes(4, "little")
+        packet.append(sum(packet) & 0xFF)
+
+        self.ser.write(packet)
+        self.ser.flush()
+        time.sleep(0.1)  # wait to settle
+
+        self.ser.baudrate = baudrate
+
+        # the first answer is lost while switching, ask again at the new baud rate
+        reply = self._command(SET_BAUDRATE, baudrate.to_bytes(4, "little"), BAUDRATE_REPLY_SIZE)
+
+        return reply is not None and int.from_bytes(reply[3:7], "little") == baudrate
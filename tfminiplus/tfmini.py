@@ -21,13 +21,18 @@
  #  Returns boolean value whether serial data is available.
  #  Also sets a public one byte status code, defined below.
  #
- # `getData()` receives a frame of data from the device and
- #  sets the values of three variables:
+ # `getData()` receives the latest frame of data from the device
+ #  and sets the values of three variables:
  #  • `dist` = distance in centimeters,
  #  • `flux` = signal strength in arbitrary units, and
  #  • `temp` = degrees centigrade as a coded number
  #  Returns a boolean value whether completed without error.
- #  Also sets a one byte `status` code.
+ #  Also sets a one byte `status` code. Older frames are skipped.
+ #
+ # `getFrames()` returns every frame received since the last call
+ #  as a list of (time, dist, flux, temp) tuples, where time is the
+ #  estimated time.monotonic() arrival time of the frame. Use it
+ #  at high frame rates when no measurement may be lost.
  #
  # `sendCommand( cmnd, param)` sends appropriate command
  #  and parameter values, returns a boolean success value
@@ -38,26 +43,39 @@
  #  defined values. Incorrect values can render the device
  #  permanently uncommunicative.
  #
+ # 'TFMiniPlus()' creates an object for one device with its own
+ #  serial port, buffers, `status`, `dist`, `flux` and `temp`.
+ #  Its `begin`, `getData` and `sendCommand` work as above, so
+ #  many devices can be polled from one process. The module level
+ #  functions drive one default object.
+ #
+ # `enableMetrics( metrics)` counts bytes, frames, checksum errors,
+ #  resyncs and timeouts and times the wait, read and parse stages
+ #  into a `metrics.DriverMetrics` from the repository root, such
+ #  as `metrics.register( 'TFMini-Plus')`. Nothing is counted
+ #  until it is called.
+ #
 =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-'''
 
 import time
 import serial
 
+pStream = None       # serial port of the default device
 status = 0           # error status code
 dist =   0           # distance to target
 flux =   0           # signal quality or intensity
 temp =   0           # internal chip temperature
-version = bytearray( 3)   # firmware version number
 
 # Buffer sizes
 TFMP_FRAME_SIZE =  9   # Size of one data frame = 9 bytes
 TFMP_COMMAND_MAX = 8   # Longest command = 8 bytes
 TFMP_REPLY_SIZE =  8   # Longest command reply = 8 bytes
-# Buffers
-frame = bytearray( TFMP_FRAME_SIZE)   # firmware version number
-reply = bytearray( TFMP_REPLY_SIZE)   # firmware version number
-
 # Timeout Limits for various functions
+TFMP_SERIAL_TIMEOUT     = 1000 # milliseconds before getData() or
+                               # sendCommand() sets HEADER error
+TFMP_READ_POLL          = 20   # milliseconds of the serial port timeout,
+                               # set once as every assignment reconfigures
+                               # the port, and the most a deadline is overrun
 TFMP_MAX_READS          = 20   # readData() sets SERIAL error
 MAX_BYTES_BEFORE_HEADER = 20   # getData() sets HEADER error
 MAX_ATTEMPTS_TO_MEASURE = 20
@@ -81,19 +99,6 @@ TFMP_STRONG       = 11  # Signal Strength saturation
 TFMP_FLOOD        = 12  # Ambient Light saturation
 TFMP_MEASURE      = 13
 
-#  Return TRUE/FALSE whether receiving serial data from
-#  device, and set system status to provide more information.
-def begin( port, rate):
-    ''' Set serial port and test for data'''
-    global pStream
-    pStream = serial.Serial( port, rate)
-    time.sleep(0.2)             #  Give port 200ms to initalize
-    if pStream.inWaiting() > 0:    #  If data present...
-        status = TFMP_READY     #  return status as READY
-        return True
-    else:                       #  Otherwise...
-        status = TFMP_SERIAL    #  return status as SERIAL ERROR
-        return False
 
 ''' - - - - - -  TFMini Plus data formats  - - - - - - - - -
   Data Frame format:
@@ -106,81 +111,6 @@ def begin( port, rate):
   0x5A   Length  Cmd ID  Payload if any   Checksum
 - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - '''
 
-#  Return TRUE/FALSE whether data received without error
-#  and set system status to provide more information.
-def getData():
-    ''' Get serial frame data from device'''
-    
-    # make data variables global
-    global status, dist, flux, temp
-
-    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    #  Step 1 - Get data from the device.
-    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    #  Set 1 second timeout if HEADER code never appears
-    #  or serial data never becomes available.
-    serialTimeout = time.time() + 1000
-    #  Flush all but last frame of data from the serial buffer.
-    while( pStream.inWaiting() > TFMP_FRAME_SIZE):
-        pStream.read()
-    #  Read one byte from the serial buffer into the data buffer's
-    #  'plus one' position, then left shift the whole array 1 byte
-    #  and repeat until the two HEADER bytes show up as the first
-    #  two bytes in the array.
-    frame = bytearray( TFMP_FRAME_SIZE)   #  'frame' data buffer
-    while( frame[ 0] != 0x59) or ( frame[ 1] != 0x59):
-        if pStream.inWaiting():
-            #  Read 1 byte into the 'frame' plus one position.
-            frame.append( pStream.read()[0])
-            #  Shift entire length of 'frame' one byte left.
-            frame = frame[ 1:]
-        #  If no HEADER or serial data not available
-        #  after more than one second...
-        if time.time() >  serialTimeout:
-            status = TFMP_HEADER   #  ...then set error
-            return False
-
-    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    #  Step 2 - Perform a checksum test.
-    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    #  Clear the 'chkSum' variable declared in 'TFMPlus.h'
-    chkSum = 0
-    #  Add together all bytes but the last.
-    for i in range( TFMP_FRAME_SIZE -1):
-        chkSum += frame[ i]
-    #   If the low order byte does not equal the last byte...
-    if( ( chkSum & 0xFF) != frame[ TFMP_FRAME_SIZE -1]):
-        status = TFMP_CHECKSUM  #  ...then set error
-        return False
-
-    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    #  Step 3 - Interpret the frame data
-    #           and if okay, then go home
-    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    dist = (frame[3] * 256) + frame[2]
-    flux = (frame[5] * 256) + frame[4]
-    temp = (frame[7] * 256) + frame[6]
-    #  Convert temp code to degrees Celsius.
-    temp = ( temp >> 3) - 256
-    #  Convert Celsius to degrees Farenheit
-    #  temp = ( temp * 9 / 5) + 32
-
-    #  - - Evaluate Abnormal Data Values - -
-    #  Values are from the TFMini-S Product Manual
-    #  Signal strength <= 100
-    if( dist == -1):     status = TFMP_WEAK
-    #  Signal Strength saturation
-    elif( flux == -1):   status = TFMP_STRONG
-    #  Ambient Light saturation
-    elif( dist == -4):   status = TFMP_FLOOD
-    #  Data is apparently okay
-    else:                status = TFMP_READY
-
-    if( status != TFMP_READY):
-        return False;
-    else:
-        return True;
-
 
 #  = = = = =  SEND A COMMAND TO THE DEVICE  = = = = = = = = = =0
 #
@@ -238,14 +168,11 @@ FRAME_250          = 0x00FA
 FRAME_500          = 0x01F4
 FRAME_1000         = 0x03E8
 #
-#  Create a proper command byte array, send the command,
-#  get a repsonse, and return the status
-def sendCommand( cmnd, param):
-    ''' Send serial command and get reply data'''
+#  Create a proper command byte array from a command code
+#  and parameter. Returns the command data and reply length.
+def buildCommand( cmnd, param):
+    ''' Build serial command data'''
 
-    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    #  Step 1 - Build the command data to send to the device
-    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     # From 32bit 'cmnd' integer, create a four byte array of:
     # reply length, command length, command number and a one byte parameter
     cmndData = bytearray( cmnd.to_bytes( TFMP_COMMAND_MAX, byteorder = 'little'))
@@ -268,131 +195,439 @@ def sendCommand( cmnd, param):
         chkSum += cmndData[ i]
     #  and save it as the last byte of command data.
     cmndData[ cmndLen -1] = ( chkSum & 0xFF)
-    
-    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    #  Step 2 - Send the command data array to the device
-    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    pStream.reset_input_buffer()    #  flush input buffer
-    pStream.reset_output_buffer()   #  flush output buffer
-    pStream.write( cmndData)        #  send command data
-        
-    #  + + + + + + + + + + + + + + + + + + + + + + + + +
-    #  If the command does not expect a reply, then we're
-    #  finished here. Go home.
-    if( replyLen == 0):
+
+    return cmndData, replyLen
+
+#  = = = = =  TFMini-Plus DEVICE  = = = = = = = = = = = = = = =
+#
+#  Each 'TFMiniPlus' object keeps its own serial port, buffers
+#  and results, so any number of devices can be served by one
+#  process. '__slots__' keeps every object small.
+class TFMiniPlus:
+    ''' Benewake TFMini-Plus serial (UART) device'''
+
+    __slots__ = ( 'pStream', 'status', 'dist', 'flux', 'temp',
+                  'version', 'frame', 'reply', 'buffer', 'metrics')
+
+    def __init__( self):
+        self.pStream = None                          # serial port
+        self.status = TFMP_READY                     # error status code
+        self.dist = 0                                # distance to target
+        self.flux = 0                                # signal quality or intensity
+        self.temp = 0                                # internal chip temperature
+        self.version = bytearray( 3)                 # firmware version number
+        self.frame = bytearray( TFMP_FRAME_SIZE)     # last data frame
+        self.reply = bytearray( TFMP_REPLY_SIZE)     # last command reply
+        self.buffer = bytearray()                    # received, not yet used bytes
+        self.metrics = None                          # DriverMetrics if enabled
+
+    #  Return TRUE/FALSE whether receiving serial data from
+    #  device, and set system status to provide more information.
+    def begin( self, port, rate):
+        ''' Set serial port and test for data'''
+        #  'port' may also be an opened serial-like object,
+        #  such as 'replay.ReplaySerial'.
+        if( isinstance( port, str)):
+            self.pStream = serial.Serial( port, rate, timeout = TFMP_READ_POLL / 1000)
+        else:
+            self.pStream = port
+            self.pStream.timeout = TFMP_READ_POLL / 1000
+        del self.buffer[:]
+        time.sleep(0.2)                     #  Give port 200ms to initalize
+        if self.pStream.inWaiting() > 0:    #  If data present...
+            self.status = TFMP_READY        #  return status as READY
+            return True
+        else:                               #  Otherwise...
+            self.status = TFMP_SERIAL       #  return status as SERIAL ERROR
+            return False
+
+    #  Count and time serial reads and parsing into 'metrics',
+    #  or stop with None.
+    def enableMetrics( self, metrics):
+        ''' Set DriverMetrics to count into'''
+        self.metrics = metrics
+
+    #  Read every byte waiting in the serial port into the buffer.
+    def _readWaiting( self):
+        ''' Drain the serial port without blocking'''
+        pStream = self.pStream
+        waiting = pStream.inWaiting()
+        if( waiting > 0):
+            if( self.metrics is None):
+                self.buffer += pStream.read( waiting)
+            else:
+                t0 = time.perf_counter()
+                self.buffer += pStream.read( waiting)
+                self.metrics.observe( 'read', time.perf_counter() - t0)
+                self.metrics.add( 'reads')
+                self.metrics.add( 'bytes_read', waiting)
+
+    #  Return TRUE/FALSE whether data received without error
+    #  and set system status to provide more information.
+    def getData( self):
+        ''' Get serial frame data from device'''
+
+        #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        #  Step 1 - Get data from the device.
+        #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        #  Set 1 second timeout if HEADER code never appears
+        #  or serial data never becomes available.
+        serialTimeout = time.monotonic() + TFMP_SERIAL_TIMEOUT / 1000
+        #  Read the whole backlog with one read and jump to the
+        #  last complete frame in it.
+        self._readWaiting()
+        frame = self._lastFrame()
+        if( frame is not None):
+            if( self.metrics is not None):
+                self.metrics.add( 'frames')
+            self.frame[:] = frame
+            return self._interpret( frame)
+        #  Read bulk data until the two HEADER bytes and a
+        #  whole frame with a good checksum are in the buffer.
+        frame = self._readFrame( b'\x59\x59', TFMP_FRAME_SIZE, serialTimeout)
+        #  If no good frame or serial data not available
+        #  after more than one second, status is set.
+        if( frame is None):
+            return False
+        if( self.metrics is not None):
+            self.metrics.add( 'frames')
+        self.frame[:] = frame
+
+        #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        #  Step 2 - Interpret the frame data
+        #           and if okay, then go home
+        #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        return self._interpret( frame)
+
+    #  Return every data frame received since the last call with
+    #  its estimated arrival time, without waiting for new data.
+    def getFrames( self):
+        ''' Get all buffered serial frame data from device'''
+        pStream = self.pStream
+        #  Drain the serial buffer with one read.
+        self._readWaiting()
+        now = time.monotonic()
+        #  Seconds to receive one byte: 8 data, 1 start, 1 stop bit.
+        byteTime = 10 / pStream.baudrate
+
+        buffer = self.buffer
+        end = len( buffer)
+        frames = []
+        pos = 0
+        badChecksums = 0
+        resyncs = 0
+        while True:
+            start = buffer.find( b'\x59\x59', pos)
+            if( start < 0 or end - start < TFMP_FRAME_SIZE):
+                break
+            stop = start + TFMP_FRAME_SIZE
+            if( ( sum( memoryview( buffer)[ start:stop -1]) & 0xFF) == buffer[ stop -1]):
+                if( start != pos):
+                    resyncs += 1
+                #  Frames received earlier were followed by more bytes.
+                frames.append( ( now - ( end - stop) * byteTime,)
+                               + self._decode( buffer[ start:stop]))
+                pos = stop
+            else:
+                badChecksums += 1
+                pos = start + 1
+        #  Keep a trailing partial frame or a last HEADER byte.
+        if( start >= 0):
+            del buffer[ :start]
+        elif( end > pos and buffer[ -1] == 0x59):
+            del buffer[ :-1]
+        else:
+            del buffer[:]
+        if( self.metrics is not None):
+            self.metrics.observe( 'parse', time.monotonic() - now)
+            self.metrics.add( 'frames', len( frames))
+            self.metrics.add( 'checksum_errors', badChecksums)
+            self.metrics.add( 'resyncs', resyncs)
+        return frames
+
+    #  Find the last complete frame with a good checksum in the
+    #  receive buffer, searching backwards from the end, and drop
+    #  it and everything before it. Returns None if there is none.
+    def _lastFrame( self):
+        ''' Jump to the newest buffered frame'''
+        buffer = self.buffer
+        #  Last position a complete frame can start at.
+        last = len( buffer) - TFMP_FRAME_SIZE
+        while( last >= 0):
+            start = buffer.rfind( b'\x59\x59', 0, last + 2)
+            if( start < 0):
+                break
+            end = start + TFMP_FRAME_SIZE
+            if( ( sum( memoryview( buffer)[ start:end -1]) & 0xFF) == buffer[ end -1]):
+                frame = bytes( buffer[ start:end])
+                del buffer[ :end]
+                return frame
+            last = start - 1
+        return None
+
+    #  Find 'header' in the receive buffer and return the 'size'
+    #  bytes starting there if their checksum is good. Bytes
+    #  before the frame are dropped and bytes after it are kept
+    #  for the next call. A header with a bad checksum is skipped
+    #  so the search resyncs on the next one. Serial data is read
+    #  in bulk, blocking in the serial driver until 'deadline'
+    #  (a time.monotonic() value). Returns None and sets status
+    #  to HEADER or CHECKSUM if no good frame arrives in time.
+    def _readFrame( self, header, size, deadline):
+        ''' Synchronize to a header and read one checked frame'''
+        pStream = self.pStream
+        buffer = self.buffer
+        badChecksum = False
+        while True:
+            start = buffer.find( header)
+            if( start < 0):
+                #  Keep a last byte that may begin the header.
+                if( len( buffer) > 0 and buffer[ -1] == header[ 0]):
+                    del buffer[ :-1]
+                else:
+                    del buffer[:]
+            else:
+                if( start > 0 and self.metrics is not None):
+                    self.metrics.add( 'resyncs')
+                del buffer[ :start]
+                if( len( buffer) >= size):
+                    #  The low order byte of the sum of all
+                    #  bytes but the last must equal the last.
+                    if( ( sum( memoryview( buffer)[ :size -1]) & 0xFF) == buffer[ size -1]):
+                        frame = bytes( buffer[ :size])
+                        del buffer[ :size]
+                        return frame
+                    badChecksum = True
+                    if( self.metrics is not None):
+                        self.metrics.add( 'checksum_errors')
+                    del buffer[ :1]
+                    continue
+            #  Wait for more data until the deadline.
+            remaining = deadline - time.monotonic()
+            if( remaining <= 0):
+                self.status = TFMP_CHECKSUM if badChecksum else TFMP_HEADER
+                if( self.metrics is not None):
+                    self.metrics.add( 'timeouts')
+                return None
+            #  Blocks for at most TFMP_READ_POLL, then the deadline is checked again.
+            if( self.metrics is None):
+                buffer += pStream.read( max( 1, pStream.inWaiting()))
+            else:
+                t0 = time.perf_counter()
+                waiting = pStream.inWaiting()
+                recv = pStream.read( max( 1, waiting))
+                buffer += recv
+                #  Blocked only if nothing was waiting.
+                self.metrics.observe( 'read' if waiting > 0 else 'wait',
+                                      time.perf_counter() - t0)
+                self.metrics.add( 'reads')
+                self.metrics.add( 'bytes_read', len( recv))
+
+    #  Decode distance, flux and temperature of a data frame.
+    @staticmethod
+    def _decode( frame):
+        ''' Decode data frame values'''
+        dist = (frame[3] * 256) + frame[2]
+        flux = (frame[5] * 256) + frame[4]
+        temp = (frame[7] * 256) + frame[6]
+        #  Convert temp code to degrees Celsius.
+        temp = ( temp >> 3) - 256
+        #  Convert Celsius to degrees Farenheit
+        #  temp = ( temp * 9 / 5) + 32
+        return dist, flux, temp
+
+    #  Decode distance, flux and temperature of a checked frame
+    #  and set status for abnormal values.
+    def _interpret( self, frame):
+        ''' Interpret data frame values'''
+        dist, flux, temp = self._decode( frame)
+        self.dist = dist
+        self.flux = flux
+        self.temp = temp
+
+        #  - - Evaluate Abnormal Data Values - -
+        #  Values are from the TFMini-S Product Manual
+        #  Signal strength <= 100
+        if( dist == -1):     self.status = TFMP_WEAK
+        #  Signal Strength saturation
+        elif( flux == -1):   self.status = TFMP_STRONG
+        #  Ambient Light saturation
+        elif( dist == -4):   self.status = TFMP_FLOOD
+        #  Data is apparently okay
+        else:                self.status = TFMP_READY
+
+        if( self.status != TFMP_READY):
+            return False;
+        else:
+            return True;
+
+    #  Create a proper command byte array, send the command,
+    #  get a repsonse, and return the status
+    def sendCommand( self, cmnd, param):
+        ''' Send serial command and get reply data'''
+
+        pStream = self.pStream
+
+        #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        #  Step 1 - Build the command data to send to the device
+        #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        cmndData, replyLen = buildCommand( cmnd, param)
+
+        #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        #  Step 2 - Send the command data array to the device
+        #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        pStream.reset_input_buffer()    #  flush input buffer
+        pStream.reset_output_buffer()   #  flush output buffer
+        del self.buffer[:]              #  and bytes already read
+        pStream.write( cmndData)        #  send command data
+
+        #  + + + + + + + + + + + + + + + + + + + + + + + + +
+        #  If the command does not expect a reply, then we're
+        #  finished here. Go home.
+        if( replyLen == 0):
+            return True
+        #  + + + + + + + + + + + + + + + + + + + + + + + + +
+
+        #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        #  Step 3 - Get command reply data back from the device.
+        #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        #  Set a one second timer to timeout if HEADER never appears
+        #  or serial data never becomes available
+        serialTimeout = time.monotonic() + TFMP_SERIAL_TIMEOUT / 1000
+        #  Read bulk data until 'HEADER' and 'replyLen' appear
+        #  as the first two bytes of a whole reply with a good
+        #  checksum.
+        reply = self._readFrame( bytes([ 0x5A, replyLen]), replyLen, serialTimeout)
+        #  If no good reply appears after more than one
+        #  second, status is set.
+        if( reply is None):
+            return False                # and return 'False'.
+        self.reply[ 0:replyLen] = reply
+
+        #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        #  Step 4 - Interpret different command responses.
+        #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        if( cmnd == GET_FIRMWARE_VERSION):
+            self.version[ 0] = reply[ 5]  #  set firmware version.
+            self.version[ 1] = reply[ 4]
+            self.version[ 2] = reply[ 3]
+        else:
+            if( cmnd == SOFT_RESET or
+                cmnd == HARD_RESET or
+                cmnd == SAVE_SETTINGS ):
+                if( reply[ 3] == 1):         #  If PASS/FAIL byte non-zero...
+                    self.status = TFMP_FAIL  #  then set status to 'FAIL'...
+                    return False             #  and return 'False'.
+
+        #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        #  Step 5 - Set status to 'READY' and return 'True'
+        #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        self.status = TFMP_READY
         return True
-    #  + + + + + + + + + + + + + + + + + + + + + + + + +
-
-    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    #  Step 3 - Get command reply data back from the device.
-    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    #  Set a one second timer to timeout if HEADER never appears
-    #  or serial data never becomes available
-    serialTimeout = time.time() + 1000
-    #  Establish 'reply' bytearray and fill with zeros
-    reply = bytearray( replyLen)
-    
-    #  1) Read one byte from serial buffer
-    #  2) Append byte to end of 'reply'
-    #  3) Left shift entire array by one byte.
-    #  4) Repeat until 'HEADER' and 'replyLen'
-    #     appear as first two bytes in array.
-    while( reply[ 0] != 0x5A) or (reply[ 1] != replyLen):
-        if( pStream.inWaiting()):
-            #  Read 1 byte into the 'frame' plus one position.
-            reply.append( pStream.read()[0])
-            #  Shift entire length of 'frame' one byte left.
-            reply = reply[ 1:]
-        #  If HEADER/replyLen combo does do not
-        #  appear after more than one second...
-        if( time.time() >  serialTimeout):
-            status = TFMP_HEADER   #  ...then set error type
-            return False           # and return 'False'.
-
-    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    #  Step 4 - Perform a checksum test.
-    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    #  Clear the 'chkSum' variable declared in 'TFMPlus.h'
-    chkSum = 0
-    #  Add together all bytes but the last.
-    for i in range( replyLen -1):
-        chkSum += reply[ i]
-    #  If the low order byte does not equal the last byte...
-    if( ( chkSum & 0xFF) != reply[ replyLen - 1]):
-      status = TFMP_CHECKSUM  #  ...then set error
-      return False            #  and return 'False.'
-
-    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    #  Step 5 - Interpret different command responses.
-    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    if( cmnd == GET_FIRMWARE_VERSION):
-        version[ 0] = reply[ 5]  #  set firmware version.
-        version[ 1] = reply[ 4]
-        version[ 2] = reply[ 3]
-    else:
-        if( cmnd == SOFT_RESET or
-            cmnd == HARD_RESET or
-            cmnd == SAVE_SETTINGS ):
-            if( reply[ 3] == 1):    #  If PASS/FAIL byte non-zero...
-                status = TFMP_FAIL  #  then set status to 'FAIL'...
-                return False        #  and return 'False'.
-
-    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    #  Step 6 - Set status to 'READY' and return 'True'
-    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    status = TFMP_READY
-    return True
-
-#  - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-#  - - - - -    The following are for testing purposes   - - - -
-#     They interpret error status codes and display HEX data
-#  - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    #  - - - - -    The following are for testing purposes   - - - -
+    #     They interpret error status codes and display HEX data
+    #  - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    #
+    #  Called by either 'printFrame()' or 'printReply()'
+    #  Print status condition either 'READY' or error type
+    def printStatus( self):
+        ''' Print status condition'''
+        status = self.status
+        print("Status: ", end= '')
+        if( status == TFMP_READY):       print( "READY", end= '')
+        elif( status == TFMP_SERIAL):    print( "SERIAL", end= '')
+        elif( status == TFMP_HEADER):    print( "HEADER", end= '')
+        elif( status == TFMP_CHECKSUM):  print( "CHECKSUM", end= '')
+        elif( status == TFMP_TIMEOUT):   print( "TIMEOUT", end= '')
+        elif( status == TFMP_PASS):      print( "PASS", end= '')
+        elif( status == TFMP_FAIL):      print( "FAIL", end= '')
+        elif( status == TFMP_I2CREAD):   print( "I2C-READ", end= '')
+        elif( status == TFMP_I2CWRITE):  print( "I2C-WRITE", end= '')
+        elif( status == TFMP_I2CLENGTH): print( "I2C-LENGTH", end= '')
+        elif( status == TFMP_WEAK):      print( "Signal weak", end= '')
+        elif( status == TFMP_STRONG):    print( "Signal saturation", end= '')
+        elif( status == TFMP_FLOOD):     print( "Ambient light saturation", end= '')
+        else:                            print( "OTHER", end= '')
+        print()
+    #
+    #  Print error type and HEX values
+    #  of each byte in the data frame
+    def printFrame( self):
+        '''Print status and frame data'''
+        self.printStatus()
+        print("Data:", end= '')  # no carriage return
+        for i in range( TFMP_FRAME_SIZE):
+            #  >>> f"{value:#0{padding}X}"
+            # Pad hex number with 0s to length of n characters
+            print(f" {self.frame[ i]:0{2}X}", end='')
+        print()
+    #
+    #  Print error type and HEX values of
+    #  each byte in the command response frame.
+    def printReply( self):
+        '''Print status and reply data'''
+        self.printStatus()
+        #  Print the Hex value of each byte
+        for i in range( TFMP_REPLY_SIZE):
+            print(f" {self.reply[ i]:0{2}X}", end='')
+        print()
+
+#  = = = = =  SINGLE DEVICE MODULE INTERFACE  = = = = = = = = =
 #
-#  Called by either 'printFrame()' or 'printReply()'
-#  Print status condition either 'READY' or error type
+#  The module level functions and variables below drive one
+#  default 'TFMiniPlus' object, so scripts written for the
+#  original single device module keep working unchanged.
+_device = TFMiniPlus()
+version = _device.version
+frame = _device.frame
+reply = _device.reply
+
+#  Copy the default device results to the module variables.
+def _update( result):
+    global pStream, status, dist, flux, temp
+    pStream = _device.pStream
+    status = _device.status
+    dist = _device.dist
+    flux = _device.flux
+    temp = _device.temp
+    return result
+
+def begin( port, rate):
+    ''' Set serial port and test for data'''
+    return _update( _device.begin( port, rate))
+
+def getData():
+    ''' Get serial frame data from device'''
+    return _update( _device.getData())
+
+def getFrames():
+    ''' Get all buffered serial frame data from device'''
+    return _device.getFrames()
+
+def enableMetrics( metrics):
+    ''' Set DriverMetrics to count into'''
+    _device.enableMetrics( metrics)
+
+def sendCommand( cmnd, param):
+    ''' Send serial command and get reply data'''
+    return _update( _device.sendCommand( cmnd, param))
+
 def printStatus():
     ''' Print status condition'''
-    print("Status: ", end= '')
-    if( status == TFMP_READY):       print( "READY", end= '')
-    elif( status == TFMP_SERIAL):    print( "SERIAL", end= '')
-    elif( status == TFMP_HEADER):    print( "HEADER", end= '')
-    elif( status == TFMP_CHECKSUM):  print( "CHECKSUM", end= '')
-    elif( status == TFMP_TIMEOUT):   print( "TIMEOUT", end= '')
-    elif( status == TFMP_PASS):      print( "PASS", end= '')
-    elif( status == TFMP_FAIL):      print( "FAIL", end= '')
-    elif( status == TFMP_I2CREAD):   print( "I2C-READ", end= '')
-    elif( status == TFMP_I2CWRITE):  print( "I2C-WRITE", end= '')
-    elif( status == TFMP_I2CLENGTH): print( "I2C-LENGTH", end= '')
-    elif( status == TFMP_WEAK):      print( "Signal weak", end= '')
-    elif( status == TFMP_STRONG):    print( "Signal saturation", end= '')
-    elif( status == TFMP_FLOOD):     print( "Ambient light saturation", end= '')
-    else:                            print( "OTHER", end= '')
-    print()
-#
-#  Print error type and HEX values
-#  of each byte in the data frame
+    _device.printStatus()
+
 def printFrame():
     '''Print status and frame data'''
-    printStatus()
-    print("Data:", end= '')  # no carriage return
-    for i in range( TFMP_FRAME_SIZE):
-        #  >>> f"{value:#0{padding}X}"
-        # Pad hex number with 0s to length of n characters
-        print(f" {frame[ i]:0{2}X}", end='')
-    print()
-#   
-#  Print error type and HEX values of
-#  each byte in the command response frame.
+    _device.printFrame()
+
 def printReply():
     '''Print status and reply data'''
-    printStatus()
-    #  Print the Hex value of each byte
-    for i in range( TFMP_REPLY_SIZE):
-        print(f" {reply[ i]:0{2}X}", end='')    
-    print()
+    _device.printReply()
 
 #  Definitions that need to be exported
-__all__ = ['GET_FIRMWARE_VERSION', 'TRIGGER_DETECTION', 'SOFT_RESET',
+__all__ = ['TFMiniPlus', 'GET_FIRMWARE_VERSION', 'TRIGGER_DETECTION', 'SOFT_RESET',
            'HARD_RESET', 'SAVE_SETTINGS', 'SET_FRAME_RATE',
            'SET_BAUD_RATE', 'STANDARD_FORMAT_CM', 'PIXHAWK_FORMAT',
            'STANDARD_FORMAT_MM', 'ENABLE_OUTPUT', 'DISABLE_OUTPUT',
@@ -0,0 +1,153 @@
+import threading
+from typing import Union
+
+import numpy as np
+
+# seconds of device time the fitted pairs must span before ClockFit fits a slope
+MIN_SLOPE_SPAN = 1.0
+
+
+def transfer_time(size: int, baudrate: int) -> float:
+    """seconds to send size bytes over a UART
+
+    Args:
+        size (int): bytes
+        baudrate (int): baud rate
+
+    Returns:
+        float: seconds, with 8 data, 1 start and 1 stop bit per byte
+    """
+    return size * 10 / baudrate
+
+
+class ClockFit(object):
+    """
+    linear map from a device clock to time.monotonic(), fitted on timed pairs
+
+    Each pair is a device time and the host time it happened at, with an
+    error bound such as half the round trip of a ping. Only the better half
+    of the pairs in the window is fitted, so pings delayed by a busy bus or
+    scheduler do not move the estimate. The slope is the drift of the
+    device clock. It stays 1.0 until the pairs span MIN_SLOPE_SPAN, and
+    pairs spread over a longer time fit it better.
+    """
+
+    def __init__(self, window: int = 64):
+        """
+        Args:
+            window (int, optional): most recent pairs kept. Defaults to 64.
+        """
+        self.window = window
+        self.pairs = np.empty((0, 3))  # device time, host time, error bound
+        self.slope = 1.0
+        self.offset = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        """whether any pair was added"""
+        return len(self.pairs) > 0
+
+    @property
+    def drift_ppm(self) -> float:
+        """device clock rate error in parts per million, positive if it runs slow"""
+        return (self.slope - 1.0) * 1e6
+
+    @property
+    def error(self) -> float:
+        """median error bound of the pairs fitted, nan if not ready"""
+        with self._lock:
+            return float(np.median(self._best()[:, 2])) if self.ready else float("nan")
+
+    def _best(self) -> np.ndarray:
+        """pairs with an error bound up to the median"""
+        return self.pairs[self.pairs[:, 2] <= np.median(self.pairs[:, 2])]
+
+    def add(self, device_time: float, host_time: float, error: float = 0.0):
+        """add a pair and refit
+
+        Args:
+            device_time (float): device clock in seconds
+            host_time (float): time.monotonic() value at device_time
+            error (float, optional): error bound of host_time in seconds. Defaults to 0.0.
+        """
+        with self._lock:
+            self.pairs = np.vstack((self.pairs, (device_time, host_time, error)))[-self.window :]
+            best = self._best()
+
+            device, host = best[:, 0], best[:, 1]
+            # a slope needs pairs spread over time
+            if np.ptp(device) >= MIN_SLOPE_SPAN:
+                slope = np.polyfit(device - device[0], host, 1)[0]
+            else:
+                slope = 1.0
+            self.slope = slope
+            self.offset = float(np.mean(host - slope * device))
+
+    def to_host(self, device_time: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """convert device clock seconds to time.monotonic() values"""
+        return self.offset + self.slope * device_time
+
+
+class StreamClock(object):
+    """
+    corrects the read timestamps of a streaming sensor to when each frame was sent
+
+    Drivers stamp a chunk of frames with the time it was read, so frames
+    buffered by the serial port or the OS get one late timestamp. The
+    sensor sends frames at a steady rate, so the last frame of every chunk
+    is placed on a line of frame index against read time. The slope is the
+    frame period and the lower envelope is the smallest read delay. Every
+    frame is then put on that line, minus the transfer and sensor latency.
+    """
+
+    def __init__(self, latency: float = 0.0, window: int = 256):
+        """
+        Args:
+            latency (float, optional): seconds from measuring a frame to its last byte arriving, such as transfer_time(frame size, baud rate). Defaults to 0.0.
+            window (int, optional): chunks the line is fitted over. Defaults to 256.
+        """
+        self.latency = latency
+        self.window = window
+        self.count = 0
+        self.period = None
+        self.offset = None
+        # (frame index, read time) of the last frame of recent chunks
+        self._chunks = np.empty((0, 2))
+
+    @property
+    def delay(self) -> float:
+        """mean seconds between a frame arriving and being read, nan before two chunks"""
+        if self.period is None:
+            return float("nan")
+        index, stamp = self._chunks[:, 0], self._chunks[:, 1]
+        return float(np.mean(stamp - (self.offset + self.period * index)))
+
+    def correct(self, timestamps: np.ndarray) -> np.ndarray:
+        """correct the timestamps of the next frames
+
+        Args:
+            timestamps (np.ndarray): read time.monotonic() values of consecutive frames, equal within a chunk
+
+        Returns:
+            np.ndarray: estimated times the frames were measured
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        index = self.count + np.arange(len(timestamps), dtype=np.float64)
+        self.count += len(timestamps)
+        if len(timestamps) == 0:
+            return timestamps
+
+        # the last frame of a chunk arrived just before it was read
+        last = np.flatnonzero(np.diff(timestamps, append=np.inf) != 0)
+        self._chunks = np.vstack((self._chunks, np.column_stack((index[last], timestamps[last]))))[-self.window :]
+
+        chunk_index, stamp = self._chunks[:, 0], self._chunks[:, 1]
+        if len(self._chunks) < 2 or np.ptp(chunk_index) == 0:
+            return timestamps - self.latency
+
+        self.period = np.polyfit(chunk_index - chunk_index[0], stamp, 1)[0]
+        self.offset = np.min(stamp - self.period * chunk_index)
+
+        # a frame can not be measured after it was read
+        return np.minimum(self.offset + self.period * index, timestamps) - self.latency
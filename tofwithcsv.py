@@ -1,6 +1,6 @@
-from SDM15 import SDM15, BaudRate
+from SDM15 import SDM15, BaudRate, STREAM_DTYPE
+from capture import CaptureWriter, to_csv
 import time
-import csv
 
 if __name__ == "__main__":
     lidar = SDM15("COM4", BaudRate.BAUD_460800) # change the port name to your own port
@@ -11,19 +11,24 @@ if __name__ == "__main__":
     lidar.lidar_self_test()
     print("self test success")
 
-    lidar.start_scan()
-    with open('C:/Users/dlsdn/OneDrive/바탕 화면/스테이지/rotateandscan/SDM15lidar_data(distance, intensity).csv', mode='w', newline='') as file:
-        writer = csv.writer(file)
-        # Write header row
-        writer.writerow(["Distance", "Intensity"])
+    # serial reads run on the lidar's reader thread, so slow disk writes can not stall it
+    lidar.start_stream()
+    reader = lidar.stream_reader()
+    # samples are appended to a binary capture in large chunks, csv is written once at the end
+    path = 'C:/Users/dlsdn/OneDrive/바탕 화면/스테이지/rotateandscan/SDM15lidar_data(distance, intensity)'
+    metadata = {"sensor": "SDM15", "port": "COM4", "baud_rate": int(BaudRate.BAUD_460800)}
+    with CaptureWriter(path + '.tofcap', STREAM_DTYPE, metadata) as writer:
         while True:
             try:
-                distance, intensity, _ = lidar.get_distance()
-                print(f"distance: {distance}, intensity: {intensity}")
-                writer.writerow([distance, intensity])
-                file.flush()
+                samples = reader.read(timeout=1.0)
+                if len(samples) == 0:
+                    continue
+                print(f"distance: {samples['distance'][-1]}, intensity: {samples['intensity'][-1]}, samples: {len(samples)}")
+                writer.write(samples)
                 time.sleep(0.1)
             except KeyboardInterrupt:
                 print("Stopping data recording due to KeyboardInterrupt")
                 break
+    lidar.stop_stream()
+    to_csv(path + '.tofcap', path + '.csv')
 # https://github.com/being24/YDLIDAR-SDM15_python
\ No newline at end of file